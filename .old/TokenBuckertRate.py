@@ -6,16 +6,16 @@ class TokenRateLimiter:
         self.rate = rate
         self.current_capactity = capacity
         self.last_registerd_time = time.monotonic()
+        self.lock = threading.Lock()
 
     def _refill_capactiy(self):
         current_time = time.monotonic()
-        print(self.current_capactity)
         self.current_capactity = min(self.max_capacty,self.current_capactity+(current_time - self.last_registerd_time)*self.rate)
+        self.last_registerd_time = current_time
 
 
     def allowed(self, identity):
-        with threading.Lock() as lock:
-            print(f"Thread {identity } got lock")
+        with self.lock:
             self._refill_capactiy()
             if self.current_capactity < 1:
                 return False
@@ -23,6 +23,17 @@ class TokenRateLimiter:
             self.current_capactity = self.current_capactity - 1
             return True
 
+    def allowed_many(self, count):
+        """Admit a micro-batch of `count` requests under one lock and one refill.
+
+        Returns how many of them (the first n in the batch) got through.
+        """
+        with self.lock:
+            self._refill_capactiy()
+            admitted = min(count, int(self.current_capactity))
+            self.current_capactity = self.current_capactity - admitted
+            return admitted
+
 
 
 
@@ -38,4 +49,5 @@ def test_lock():
         thread.join()
 
 
-test_lock()
\ No newline at end of file
+if __name__ == "__main__":
+    test_lock()
@@ -0,0 +1,241 @@
+"""Load harness for every rate limiter in this folder.
+
+    python bench_rate_limiters.py --limiter all --model threads --concurrency 8 --duration 2
+    python bench_rate_limiters.py --limiter shared --model processes --skew zipf
+
+Each worker draws keys from a uniform or Zipf distribution and calls the
+limiter as fast as it can until the duration is up. The report has
+decisions/s, p50/p99/p999 decision latency, and accuracy: for keys that
+got more requests than the limit allows, allowed / (capacity + rate *
+duration). 1.0 is exact, above 1.0 means the limiter admitted too much.
+Keyless limiters (TokenBucketLimiter, TokenRateLimiter) enforce one global
+bucket, so all traffic counts as a single key for them.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+from array import array
+from bisect import bisect
+from collections import Counter
+from itertools import accumulate
+from multiprocessing import Process, Queue
+from threading import Thread
+
+LIMITERS = ("keyed", "gcra", "log", "counter", "shared", "remote", "remote-naive", "bucket", "tokenrate")
+GLOBAL_KEY = "*"
+
+
+class Setup():
+    """Builds the limiter under test (once per process) and tears it down."""
+    def __init__(self, name:str, capacity:float, rate:float):
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+        self.keyless = name in ("bucket", "tokenrate")
+        self.server = None
+        self.shared_name = f"bench-{name}-{os.getpid()}"
+        if name in ("log", "counter"):
+            from main import MAX_REQUESTS, SLIDING_WINDOW
+            self.capacity, self.rate = MAX_REQUESTS, MAX_REQUESTS / SLIDING_WINDOW
+        if name.startswith("remote"):
+            from remote_rate_limiter import TokenStoreServer
+            self.server = TokenStoreServer(("127.0.0.1", 0), capacity, rate)
+            self.server.start()
+        self.owner = self.make()
+
+    def make(self):
+        if self.name == "keyed":
+            from keyed_rate_limiter import KeyedTokenBucketLimiter
+            return KeyedTokenBucketLimiter(self.capacity, self.rate)
+        if self.name == "gcra":
+            from gcra_rate_limiter import KeyedGCRALimiter
+            return KeyedGCRALimiter(self.capacity, self.rate)
+        if self.name in ("log", "counter"):
+            from main import RateLimiter
+            return RateLimiter(self.name)
+        if self.name == "shared":
+            from shared_rate_limiter import SharedTokenBucketLimiter
+            return SharedTokenBucketLimiter(self.shared_name, self.capacity, self.rate)
+        if self.name == "remote":
+            from remote_rate_limiter import LeasingTokenBucketLimiter
+            return LeasingTokenBucketLimiter(self.server.server_address)
+        if self.name == "remote-naive":
+            from remote_rate_limiter import RemoteTokenBucketLimiter
+            return RemoteTokenBucketLimiter(self.server.server_address)
+        if self.name == "bucket":
+            from rate_limiter import TokenBucketLimiter
+            return TokenBucketLimiter(self.capacity, self.rate)
+        if self.name == "tokenrate":
+            from TokenBuckertRate import TokenRateLimiter
+            return TokenRateLimiter(self.capacity, self.rate)
+        raise ValueError(f"unknown limiter {self.name!r}")
+
+    def for_worker(self, model:str):
+        """consume(key) -> bool for a worker (async for TokenBucketLimiter).
+
+        Process workers attach their own shared/remote limiter; for the
+        in-process limiters each process ends up with its own copy.
+        """
+        limiter = self.make() if model == "processes" and self.name in ("shared", "remote", "remote-naive") else self.owner
+        if self.name in ("log", "counter"):
+            return limiter.allow
+        if self.name == "tokenrate":
+            return limiter.allowed
+        if self.name == "bucket":
+            return lambda key: limiter.async_consume_tokens(1)
+        return limiter.consume
+
+    def close(self):
+        if self.name == "shared":
+            self.owner.close()
+            self.owner.unlink()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def key_stream(keys:int, skew:str, s:float, length:int, seed:int) -> list[str]:
+    rng = random.Random(seed)
+    names = [f"client-{i}" for i in range(keys)]
+    if skew == "uniform":
+        return [names[rng.randrange(keys)] for _ in range(length)]
+    cumulative = list(accumulate(1 / (rank ** s) for rank in range(1, keys + 1)))
+    return [names[bisect(cumulative, rng.random() * cumulative[-1])] for _ in range(length)]
+
+
+def run_sync(consume, keys:list[str], deadline:float) -> tuple[array, Counter, Counter]:
+    latencies, allowed, requested = array('q'), Counter(), Counter()
+    clock = time.perf_counter_ns
+    i = 0
+    while time.monotonic() < deadline:
+        for key in keys[i:i + 256]:
+            start = clock()
+            ok = consume(key)
+            latencies.append(clock() - start)
+            requested[key] += 1
+            if ok:
+                allowed[key] += 1
+        i = (i + 256) % len(keys)
+    return latencies, allowed, requested
+
+
+async def run_async(consume, keys:list[str], deadline:float) -> tuple[array, Counter, Counter]:
+    latencies, allowed, requested = array('q'), Counter(), Counter()
+    clock = time.perf_counter_ns
+    i = 0
+    while time.monotonic() < deadline:
+        key = keys[i]
+        start = clock()
+        ok = consume(key)
+        is_async = asyncio.iscoroutine(ok)
+        if is_async:
+            ok = await ok
+        latencies.append(clock() - start)
+        requested[key] += 1
+        if ok:
+            allowed[key] += 1
+        i = (i + 1) % len(keys)
+        if not is_async:
+            # let the other tasks interleave, as request handlers would
+            await asyncio.sleep(0)
+    return latencies, allowed, requested
+
+
+def _process_worker(setup:Setup, keys:list[str], deadline:float, results:Queue):
+    latencies, allowed, requested = run_sync(setup.for_worker("processes"), keys, deadline)
+    results.put((latencies.tobytes(), dict(allowed), dict(requested)))
+
+
+def run(setup:Setup, model:str, concurrency:int, duration:float,
+        streams:list[list[str]]) -> tuple[array, Counter, Counter, float]:
+    if setup.keyless:
+        streams = [[GLOBAL_KEY] * 1024 for _ in streams]
+        if model != "asyncio" and setup.name == "bucket":
+            raise ValueError("TokenBucketLimiter only has an async API, use --model asyncio")
+    latencies, allowed, requested = array('q'), Counter(), Counter()
+    start = time.monotonic()
+    deadline = start + duration
+    if model == "threads":
+        results = [None] * concurrency
+
+        def worker(id):
+            results[id] = run_sync(setup.for_worker(model), streams[id], deadline)
+
+        threads = [Thread(target=worker, args=(id,)) for id in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elif model == "asyncio":
+        async def main():
+            return await asyncio.gather(*[run_async(setup.for_worker(model), streams[id], deadline)
+                                          for id in range(concurrency)])
+        results = asyncio.run(main())
+    else:
+        queue = Queue()
+        processes = [Process(target=_process_worker, args=(setup, streams[id], deadline, queue))
+                     for id in range(concurrency)]
+        for p in processes:
+            p.start()
+        results = []
+        for _ in processes:
+            raw, worker_allowed, worker_requested = queue.get()
+            results.append((array('q', raw), Counter(worker_allowed), Counter(worker_requested)))
+        for p in processes:
+            p.join()
+    for worker_latencies, worker_allowed, worker_requested in results:
+        latencies.extend(worker_latencies)
+        allowed.update(worker_allowed)
+        requested.update(worker_requested)
+    return latencies, allowed, requested, time.monotonic() - start
+
+
+def report(name:str, setup:Setup, latencies:array, allowed:Counter, requested:Counter, elapsed:float) -> str:
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000 if ordered else float("nan")
+
+    limit = setup.capacity + setup.rate * elapsed
+    saturated = [key for key, count in requested.items() if count > limit]
+    # no saturated key means the limit was never tested
+    accuracy = f"{sum(allowed[key] for key in saturated) / (limit * len(saturated)):.3f}" if saturated else "-"
+    return (f"{name:<13} {len(latencies) / elapsed:>12,.0f} {percentile(0.5):>9.1f} {percentile(0.99):>9.1f} "
+            f"{percentile(0.999):>9.1f} {accuracy:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limiter", default="all", choices=("all", *LIMITERS))
+    parser.add_argument("--model", default="threads", choices=("threads", "asyncio", "processes"))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--skew", default="uniform", choices=("uniform", "zipf"))
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--capacity", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    streams = [key_stream(args.keys, args.skew, args.zipf_s, 100_000, args.seed + id) for id in range(args.concurrency)]
+    names = LIMITERS if args.limiter == "all" else (args.limiter,)
+    print(f"model={args.model} concurrency={args.concurrency} duration={args.duration}s keys={args.keys} "
+          f"skew={args.skew} capacity={args.capacity} rate={args.rate}/s")
+    print(f"{'limiter':<13} {'decisions/s':>12} {'p50 us':>9} {'p99 us':>9} {'p999 us':>9} {'accuracy':>9}")
+    for name in names:
+        setup = Setup(name, args.capacity, args.rate)
+        try:
+            latencies, allowed, requested, elapsed = run(setup, args.model, args.concurrency, args.duration, streams)
+        except ValueError as error:
+            print(f"{name:<13} skipped: {error}")
+            continue
+        finally:
+            setup.close()
+        print(report(name, setup, latencies, allowed, requested, elapsed))
+
+
+if __name__ == "__main__":
+    main()
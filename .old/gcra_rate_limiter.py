@@ -0,0 +1,105 @@
+import time
+import random
+from array import array
+from threading import Lock
+from typing import Optional
+
+from key_store import IdleKeyStore
+from keyed_rate_limiter import KeyedTokenBucketLimiter, bytes_per_key
+
+
+class _GCRAStripe():
+    """One lock plus the theoretical arrival time (TAT) of every key in it."""
+    def __init__(self, max_keys:Optional[int]):
+        self.lock = Lock()
+        self.tat = array('d')
+        self.free: list[int] = []
+        # a TAT in the past is the same as a fresh key, so it can be forgotten
+        self.keys = IdleKeyStore(lambda slot, now: self.tat[slot] <= now,
+                                 max_keys=max_keys, on_evict=lambda key, slot: self.free.append(slot))
+
+    def slot_for(self, key:str, now:float) -> int:
+        slot = self.keys.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.tat[slot] = now
+            else:
+                slot = len(self.tat)
+                self.tat.append(now)
+            self.keys.put(key, slot, now)
+        return slot
+
+
+class KeyedGCRALimiter():
+    """Generic cell rate algorithm, same limits as KeyedTokenBucketLimiter.
+
+    Instead of tokens plus a refill timestamp each key stores one float, the
+    theoretical arrival time: when the key's bucket would be full again if
+    nothing else arrived. A request of n tokens moves it n emission intervals
+    (1 / rate) into the future and is allowed if that stays within the burst
+    tolerance (capacity emission intervals) from now. Deciding takes one
+    clock read and no division, and a denied request knows exactly when it
+    would have been allowed.
+    """
+    def __init__(self, capacity:float, rate:float, stripes:int = 64, max_keys:Optional[int] = None,
+                 clock=time.monotonic) -> None:
+        self.capacity:float = capacity
+        self.rate:float = rate
+        self.clock = clock
+        self.emission_interval = 1 / rate
+        self.tolerance = capacity * self.emission_interval
+        stripe_keys = None if max_keys is None else -(-max_keys // stripes)
+        self.stripes = [_GCRAStripe(stripe_keys) for _ in range(stripes)]
+
+    def decide(self, key:str, tokens:float = 1) -> tuple[bool, float]:
+        """Returns (allowed, retry_after); retry_after is 0 for allowed requests."""
+        stripe = self.stripes[hash(key) % len(self.stripes)]
+        with stripe.lock:
+            now = self.clock()
+            slot = stripe.slot_for(key, now)
+            tat = stripe.tat[slot]
+            new_tat = (tat if tat > now else now) + tokens * self.emission_interval
+            retry_after = new_tat - self.tolerance - now
+            if retry_after > 0:
+                return False, retry_after
+            stripe.tat[slot] = new_tat
+            return True, 0.0
+
+    def consume(self, key:str, tokens:float = 1) -> bool:
+        return self.decide(key, tokens)[0]
+
+    def __len__(self) -> int:
+        return sum(len(stripe.keys) for stripe in self.stripes)
+
+    @property
+    def evictions(self) -> int:
+        return sum(stripe.keys.evictions for stripe in self.stripes)
+
+
+def main():
+    keys = 200_000
+
+    def filled(limiter_class):
+        def make(keys):
+            # frozen clock so no key goes idle and gets evicted while filling
+            limiter = limiter_class(10, 1, clock=lambda: 0.0)
+            for i in range(keys):
+                limiter.consume(f"client-{i}")
+            return limiter
+        return make
+
+    for limiter_class in (KeyedTokenBucketLimiter, KeyedGCRALimiter):
+        limiter = limiter_class(10, 1)
+        rng = random.Random(0)
+        names = [f"client-{rng.randrange(10_000)}" for _ in range(500_000)]
+        start = time.perf_counter()
+        for name in names:
+            limiter.consume(name)
+        rate = len(names) / (time.perf_counter() - start)
+        print(f"{limiter_class.__name__:<24} {bytes_per_key(filled(limiter_class), keys):.0f} bytes/key "
+              f"{rate:,.0f} decisions/s")
+
+
+if __name__ == "__main__":
+    main()
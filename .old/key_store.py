@@ -0,0 +1,65 @@
+from collections import OrderedDict, deque
+from itertools import repeat
+from typing import Any, Callable, Hashable, Optional
+
+
+class IdleKeyStore():
+    """Bounded key -> value map for per-client limiter state.
+
+    Entries are kept in least-recently-used order, so the keys idle for the
+    longest time sit at the front. Each write looks at a few entries at the
+    front and drops those `is_idle(value, now)` says have fully reset, so
+    expiry is spread over normal traffic instead of a full scan. `max_keys`
+    is a hard cap enforced by evicting the least recently used key.
+    """
+    def __init__(self, is_idle:Callable[[Any, float], bool], max_keys:Optional[int] = None,
+                 sweep_batch:int = 4, on_evict:Optional[Callable[[Hashable, Any], None]] = None):
+        self.is_idle = is_idle
+        self.max_keys = max_keys
+        self.sweep_batch = sweep_batch
+        self.on_evict = on_evict
+        self.entries:OrderedDict[Hashable, Any] = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key:Hashable, default:Any = None) -> Any:
+        value = self.entries.get(key, default)
+        if value is not default:
+            self.entries.move_to_end(key)
+        return value
+
+    def get_many(self, keys:list[Hashable], default:Any = None) -> list[Any]:
+        values = list(map(self.entries.get, keys, repeat(default, len(keys))))
+        found = [key for key, value in zip(keys, values) if value is not default]
+        deque(map(self.entries.move_to_end, found), maxlen=0)
+        return values
+
+    def put(self, key:Hashable, value:Any, now:float) -> None:
+        # sweep first so the entry being written is never expired by its own put
+        self.sweep(now)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.max_keys is not None:
+            while len(self.entries) > self.max_keys:
+                self._evict(*self.entries.popitem(last=False))
+
+    def sweep(self, now:float) -> None:
+        for _ in range(self.sweep_batch):
+            if not self.entries:
+                return
+            key = next(iter(self.entries))
+            value = self.entries[key]
+            if not self.is_idle(value, now):
+                return
+            del self.entries[key]
+            self._evict(key, value)
+
+    def _evict(self, key:Hashable, value:Any) -> None:
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def __contains__(self, key:Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
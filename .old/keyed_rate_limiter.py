@@ -0,0 +1,245 @@
+import time
+import random
+import statistics
+import tracemalloc
+from array import array
+from threading import Lock, Thread
+from typing import Optional, Sequence
+
+import numpy as np
+
+from key_store import IdleKeyStore
+from rate_limiter import TokenBucketLimiter
+
+# below this many rows per stripe numpy call overhead costs more than it saves
+VECTORIZE_MIN_ROWS = 32
+
+
+class _Stripe():
+    """One lock plus the bucket state of every key that hashes to it.
+
+    Bucket state lives in two parallel float arrays (tokens, last refill time)
+    indexed by the slot number stored in `keys`, so a key costs one map entry
+    and 16 bytes instead of a whole TokenBucketLimiter object. Slots of
+    evicted keys go on a free list and are reused by new keys.
+    """
+    def __init__(self, refill_time:float, max_keys:Optional[int]):
+        self.lock = Lock()
+        self.tokens = array('d')
+        self.last_time = array('d')
+        self.free: list[int] = []
+        # an idle key has refilled to capacity, so forgetting it changes nothing
+        self.keys = IdleKeyStore(lambda slot, now: now - self.last_time[slot] >= refill_time,
+                                 max_keys=max_keys, on_evict=lambda key, slot: self.free.append(slot))
+
+    def slot_for(self, key:str, capacity:float, now:float) -> int:
+        slot = self.keys.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.tokens[slot] = capacity
+                self.last_time[slot] = now
+            else:
+                slot = len(self.tokens)
+                self.tokens.append(capacity)
+                self.last_time.append(now)
+            self.keys.put(key, slot, now)
+        return slot
+
+    def consume(self, key:str, tokens:float, capacity:float, rate:float, now:float) -> bool:
+        slot = self.slot_for(key, capacity, now)
+        current = min(capacity, self.tokens[slot] + (now - self.last_time[slot]) * rate)
+        self.last_time[slot] = now
+        if current < tokens:
+            self.tokens[slot] = current
+            return False
+        self.tokens[slot] = current - tokens
+        return True
+
+    def lease(self, key:str, tokens:float, min_tokens:float, capacity:float, rate:float, now:float) -> tuple[float, float]:
+        slot = self.slot_for(key, capacity, now)
+        current = min(capacity, self.tokens[slot] + (now - self.last_time[slot]) * rate)
+        self.last_time[slot] = now
+        if current < min_tokens:
+            self.tokens[slot] = current
+            return 0.0, (min_tokens - current) / rate
+        granted = min(tokens, current)
+        self.tokens[slot] = current - granted
+        return granted, 0.0
+
+    def _batch_evicts(self, keys:list[str]) -> bool:
+        """Whether admitting the batch's new keys would push keys out through the max_keys cap.
+
+        A key evicted halfway through comes back later in the batch with a
+        fresh bucket, which only the one-by-one path gets right.
+        """
+        if self.keys.max_keys is None:
+            return False
+        new = sum(key not in self.keys for key in set(keys))
+        return len(self.keys) + new > self.keys.max_keys
+
+    def consume_many(self, keys:list[str], costs:np.ndarray, capacity:float, rate:float, now:float) -> np.ndarray:
+        if len(keys) < VECTORIZE_MIN_ROWS or self._batch_evicts(keys):
+            return np.array([self.consume(key, cost, capacity, rate, now) for key, cost in zip(keys, costs.tolist())],
+                            dtype=bool)
+        slots = self.keys.get_many(keys)
+        known = np.array([slot for slot in slots if slot is not None], dtype=np.intp)
+        if len(known):
+            # refill known keys first so the sweep below sees them as active;
+            # the numpy views must be gone before the arrays can grow
+            bucket, last_time = np.frombuffer(self.tokens), np.frombuffer(self.last_time)
+            known = np.unique(known)
+            bucket[known] = np.minimum(capacity, bucket[known] + (now - last_time[known]) * rate)
+            last_time[known] = now
+            del bucket, last_time
+        if len(known) < len(slots):
+            slots = [self.slot_for(key, capacity, now) if slot is None else slot for key, slot in zip(keys, slots)]
+        slots = np.array(slots, dtype=np.intp)
+        bucket = np.frombuffer(self.tokens)
+        if len(np.unique(slots)) == len(slots):
+            allowed = bucket[slots] >= costs
+            bucket[slots[allowed]] -= costs[allowed]
+            return allowed
+        # repeated keys are decided in order, like repeated consume() calls
+        allowed = np.zeros(len(slots), dtype=bool)
+        for row, (slot, cost) in enumerate(zip(slots.tolist(), costs.tolist())):
+            if bucket[slot] >= cost:
+                bucket[slot] -= cost
+                allowed[row] = True
+        return allowed
+
+
+class KeyedTokenBucketLimiter():
+    """Token bucket per key (client ip, api key, ...) with lock striping.
+
+    Keys are spread over `stripes` independent locks, so two unrelated keys
+    only contend when they land on the same stripe. Keys whose bucket has
+    refilled completely are forgotten, and `max_keys` caps the number of
+    tracked keys (least recently used keys are evicted first).
+    """
+    def __init__(self, capacity:float, rate:float, stripes:int = 64, max_keys:Optional[int] = None,
+                 clock=time.monotonic) -> None:
+        self.capacity:float = capacity
+        self.rate:float = rate
+        self.clock = clock
+        stripe_keys = None if max_keys is None else -(-max_keys // stripes)
+        self.stripes = [_Stripe(capacity / rate, stripe_keys) for _ in range(stripes)]
+
+    def _stripe(self, key:str) -> _Stripe:
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def consume(self, key:str, tokens:float = 1) -> bool:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return stripe.consume(key, tokens, self.capacity, self.rate, self.clock())
+
+    def lease(self, key:str, tokens:float, min_tokens:float = 1) -> tuple[float, float]:
+        """Take up to `tokens`, but only if at least `min_tokens` are available.
+
+        Returns (granted, retry_after): retry_after is 0 when something was
+        granted, otherwise the seconds until `min_tokens` will be available.
+        """
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return stripe.lease(key, tokens, min_tokens, self.capacity, self.rate, self.clock())
+
+    def consume_many(self, keys:Sequence[str], tokens:float|Sequence[float] = 1) -> np.ndarray:
+        """Decide a whole micro-batch, returns a bool array aligned with `keys`.
+
+        Rows are grouped by stripe, each stripe lock is taken once per batch
+        and the refill and decision for all of its keys is one vectorized
+        pass over the token/timestamp arrays.
+        """
+        keys = list(keys)
+        costs = np.broadcast_to(np.asarray(tokens, dtype=np.float64), (len(keys),))
+        allowed = np.zeros(len(keys), dtype=bool)
+        if not keys:
+            return allowed
+        stripe_ids = np.fromiter(map(hash, keys), dtype=np.int64, count=len(keys)) % len(self.stripes)
+        order = np.argsort(stripe_ids, kind="stable")
+        for rows in np.split(order, np.flatnonzero(np.diff(stripe_ids[order])) + 1):
+            stripe = self.stripes[stripe_ids[rows[0]]]
+            stripe_keys = [keys[row] for row in rows.tolist()]
+            with stripe.lock:
+                allowed[rows] = stripe.consume_many(stripe_keys, costs[rows], self.capacity, self.rate, self.clock())
+        return allowed
+
+    def __len__(self) -> int:
+        return sum(len(stripe.keys) for stripe in self.stripes)
+
+    @property
+    def evictions(self) -> int:
+        return sum(stripe.keys.evictions for stripe in self.stripes)
+
+
+def bytes_per_key(make_limiter, keys:int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    limiter = make_limiter(keys)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del limiter
+    return (after - before) / keys
+
+
+def decision_latencies(limiter:KeyedTokenBucketLimiter, threads:int, decisions:int, keys:int) -> list[int]:
+    latencies: list[list[int]] = [[] for _ in range(threads)]
+
+    def worker(id):
+        rng = random.Random(id)
+        names = [f"client-{rng.randrange(keys)}" for _ in range(decisions)]
+        out = latencies[id]
+        for name in names:
+            start = time.perf_counter_ns()
+            limiter.consume(name)
+            out.append(time.perf_counter_ns() - start)
+
+    workers = [Thread(target=worker, args=(id,)) for id in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return [latency for per_thread in latencies for latency in per_thread]
+
+
+def batch_throughput(batch:int, decisions:int = 500_000, keys:int = 10_000) -> float:
+    limiter = KeyedTokenBucketLimiter(10, 1)
+    rng = random.Random(0)
+    names = [f"client-{rng.randrange(keys)}" for _ in range(decisions)]
+    start = time.perf_counter()
+    if batch == 1:
+        for name in names:
+            limiter.consume(name)
+    else:
+        for i in range(0, decisions, batch):
+            limiter.consume_many(names[i:i + batch])
+    return decisions / (time.perf_counter() - start)
+
+
+def main():
+    keys = 200_000
+
+    def object_per_key(keys):
+        return {f"client-{i}": TokenBucketLimiter(10, 1) for i in range(keys)}
+
+    def keyed(keys):
+        limiter = KeyedTokenBucketLimiter(10, 1)
+        for i in range(keys):
+            limiter.consume(f"client-{i}", 0)
+        return limiter
+
+    print(f"bytes/key  TokenBucketLimiter per key: {bytes_per_key(object_per_key, keys):.0f}")
+    print(f"bytes/key  KeyedTokenBucketLimiter:    {bytes_per_key(keyed, keys):.0f}")
+
+    for threads in (8, 16):
+        for stripes in (1, 64):
+            latencies = decision_latencies(KeyedTokenBucketLimiter(10, 1, stripes=stripes), threads, 50_000, 10_000)
+            q = statistics.quantiles(latencies, n=1000)
+            print(f"threads={threads:<3} stripes={stripes:<3} p50={q[499]/1000:.1f}us p99={q[989]/1000:.1f}us")
+
+    for batch in (1, 256, 4096, 65536):
+        print(f"batch={batch:<5} {batch_throughput(batch):,.0f} decisions/s")
+
+
+if __name__ == "__main__":
+    main()
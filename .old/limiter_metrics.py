@@ -0,0 +1,98 @@
+import threading
+from bisect import bisect_left
+from typing import Callable
+
+# lock wait buckets in seconds, Prometheus style upper bounds
+LATENCY_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0)
+
+
+def _number(value:float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class _Shard():
+    """Counters written by exactly one thread, so updates need no lock."""
+    def __init__(self):
+        self.counters:dict[tuple[str, str], float] = {}
+        # name -> ([count per bucket..., +Inf count], [sum])
+        self.histograms:dict[str, tuple[list[int], list[float]]] = {}
+
+
+class Metrics():
+    """Low overhead counters and histograms rendered in Prometheus text format.
+
+    Every thread writes to its own shard (found through a threading.local),
+    so the hot path never takes a lock; shards are only added up when
+    render() is called by the scrape. Gauges are callbacks evaluated on
+    scrape, which suits values the limiter already tracks (key counts,
+    evictions).
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._shards:list[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._help:dict[str, tuple[str, str]] = {}
+        self._callbacks:dict[str, Callable[[], float]] = {}
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def describe(self, name:str, kind:str, help:str) -> None:
+        self._help[name] = (kind, help)
+
+    def inc(self, name:str, labels:str = "", value:float = 1) -> None:
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name:str, value:float) -> None:
+        histograms = self._shard().histograms
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = ([0] * (len(LATENCY_BUCKETS) + 1), [0.0])
+        histogram[0][bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[1][0] += value
+
+    def gauge(self, name:str, kind:str, help:str, callback:Callable[[], float]) -> None:
+        self.describe(name, kind, help)
+        self._callbacks[name] = callback
+
+    def render(self) -> str:
+        counters:dict[tuple[str, str], float] = {}
+        histograms:dict[str, tuple[list[int], float]] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict() copies in one step, so a thread adding a new key can't break the loop
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for name, (buckets, total) in dict(shard.histograms).items():
+                merged_buckets, merged_total = histograms.get(name, ([0] * len(buckets), 0.0))
+                histograms[name] = ([a + b for a, b in zip(merged_buckets, buckets)], merged_total + total[0])
+
+        lines = []
+        names = sorted({name for name, _ in counters} | set(histograms) | set(self._callbacks))
+        for name in names:
+            if name in self._help:
+                kind, help = self._help[name]
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{name}{{{labels}}} {_number(value)}" if labels else f"{name} {_number(value)}")
+            if name in histograms:
+                buckets, total = histograms[name]
+                cumulative = 0
+                for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum {_number(total)}")
+                lines.append(f"{name}_count {cumulative}")
+            if name in self._callbacks:
+                lines.append(f"{name} {_number(self._callbacks[name]())}")
+        return "\n".join(lines) + "\n"
@@ -1,37 +1,132 @@
+import os
 import time
 from collections import deque
-from datetime import datetime , timedelta
+from threading import Lock
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
+from gcra_rate_limiter import KeyedGCRALimiter
+from key_store import IdleKeyStore
+from limiter_metrics import Metrics
+from remote_rate_limiter import LeasingTokenBucketLimiter
+from shared_rate_limiter import SharedTokenBucketLimiter
+
 app = FastAPI(title="RateLimiterTest")
 MAX_REQUESTS = 5
 SLIDING_WINDOW = 15
+# "shared" keeps one token bucket per ip in shared memory so every uvicorn
+# worker on the host enforces the same limit (uvicorn main:app --workers N)
+LIMITER_MODE = os.environ.get("LIMITER_MODE", "log")
+SHARED_LIMITER_NAME = "rate-limiter-test"
+# "remote" leases tokens from a TokenStoreServer shared by every node
+REMOTE_LIMITER_ADDRESS = os.environ.get("REMOTE_LIMITER_ADDRESS", "127.0.0.1:7070")
+MAX_TRACKED_IPS = 100_000
 
 
 class RateLimiter():
-    """RateLimits requests from user based on ip"""
-    def __init__(self):
-        self.memory:dict[str,deque] = {}
-    def update_queue(self,ip):
-        ip_info = self.memory[ip].copy()
-        for val in ip_info:
-            current_time = datetime.now()
-            if current_time - val > timedelta(seconds=SLIDING_WINDOW):
-                print("popped",self.memory[ip].pop())             
+    """RateLimits requests from user based on ip
 
-    def  allow(self,ip):
-        if not ip in self.memory:
-            self.memory[ip] = deque()
-        if len(self.memory[ip]) > MAX_REQUESTS:
-            self.update_queue(ip)
-            if len(self.memory[ip]) > MAX_REQUESTS:
+    mode="log" keeps the timestamp of every request in the window (exact).
+    mode="counter" keeps two fixed-window counters per ip and weights the
+    previous one by how much of it still overlaps the sliding window, so each
+    ip costs a fixed few bytes and allow() is O(1).
+    mode="shared" approximates the window with a token bucket (burst of
+    MAX_REQUESTS, refilled over SLIDING_WINDOW) stored in shared memory.
+    mode="remote" keeps that bucket in a remote token store and leases
+    tokens from it in blocks, so most decisions need no round trip.
+    mode="gcra" enforces that bucket in process memory as a single
+    theoretical arrival time per ip (generic cell rate algorithm).
+
+    An ip whose window is empty again is forgotten, and at most `max_keys`
+    ips are tracked (least recently seen are evicted first).
+
+    Decisions, lock waits, tracked ips and evictions are recorded in
+    `metrics` and served by the /metrics endpoint.
+    """
+    def __init__(self, mode:str = "log", max_keys:int = MAX_TRACKED_IPS, clock=time.monotonic,
+                 metrics:Metrics|None = None):
+        if mode not in ("log", "counter", "gcra", "shared", "remote"):
+            raise ValueError(f"unknown rate limiter mode {mode!r}")
+        self.mode = mode
+        self.clock = clock
+        self.lock = Lock()
+        self.backend = None
+        if mode == "gcra":
+            self.backend = KeyedGCRALimiter(MAX_REQUESTS, MAX_REQUESTS / SLIDING_WINDOW, max_keys=max_keys, clock=clock)
+        if mode == "shared":
+            self.backend = SharedTokenBucketLimiter(SHARED_LIMITER_NAME, MAX_REQUESTS, MAX_REQUESTS / SLIDING_WINDOW,
+                                                    clock=clock)
+        if mode == "remote":
+            host, port = REMOTE_LIMITER_ADDRESS.rsplit(":", 1)
+            self.backend = LeasingTokenBucketLimiter((host, int(port)), clock=clock)
+        self.memory = IdleKeyStore(lambda queue, now: not queue or now - queue[-1] > SLIDING_WINDOW,
+                                   max_keys=max_keys)
+        # ip -> (window index, previous window count, current window count)
+        self.counters = IdleKeyStore(lambda counter, now: now // SLIDING_WINDOW - counter[0] >= 2,
+                                     max_keys=max_keys)
+        self.metrics = metrics or Metrics()
+        self.metrics.describe("rate_limiter_decisions_total", "counter", "Rate limit decisions by result.")
+        self.metrics.describe("rate_limiter_lock_wait_seconds", "histogram", "Time spent waiting for the limiter lock.")
+        self.metrics.gauge("rate_limiter_active_keys", "gauge", "Ips currently tracked.", self.active_keys)
+        self.metrics.gauge("rate_limiter_evictions_total", "counter", "Idle or least recently used ips forgotten.",
+                           self.evictions)
+
+    def active_keys(self) -> int:
+        if self.backend is None:
+            return len(self.memory) + len(self.counters)
+        return len(self.backend) if hasattr(self.backend, "__len__") else 0
+
+    def evictions(self) -> int:
+        return self.memory.evictions + self.counters.evictions + getattr(self.backend, "evictions", 0)
+
+    def update_queue(self,ip, now:float):
+        queue = self.memory.get(ip)
+        while queue and now - queue[0] > SLIDING_WINDOW:
+            queue.popleft()
+
+    def allow_log(self, ip) -> bool:
+        now = self.clock()
+        queue = self.memory.get(ip)
+        if queue is None:
+            queue = deque([now])
+            self.memory.put(ip, queue, now)
+        elif len(queue) >= MAX_REQUESTS:
+            self.update_queue(ip, now)
+            if len(queue) >= MAX_REQUESTS:
                 return False
-        self.memory[ip].append(datetime.now())
-        print("Added entry to queue",ip, datetime.now() )
-        return  True
-        
-rate_limiter = RateLimiter()
+            queue.append(now)
+        else:
+            queue.append(now)
+        return True
+
+    def allow_counter(self, ip) -> bool:
+        now = self.clock()
+        window, elapsed = divmod(now, SLIDING_WINDOW)
+        window = int(window)
+        last_window, previous, current = self.counters.get(ip, (window, 0, 0))
+        if window != last_window:
+            previous = current if window == last_window + 1 else 0
+            current = 0
+        if previous * (1 - elapsed / SLIDING_WINDOW) + current >= MAX_REQUESTS:
+            self.counters.put(ip, (window, previous, current), now)
+            return False
+        self.counters.put(ip, (window, previous, current + 1), now)
+        return True
+
+    def  allow(self,ip):
+        if self.backend is not None:
+            # backends do their own (striped) locking
+            allowed = self.backend.consume(ip)
+        else:
+            start = time.perf_counter()
+            with self.lock:
+                self.metrics.observe("rate_limiter_lock_wait_seconds", time.perf_counter() - start)
+                allowed = self.allow_counter(ip) if self.mode == "counter" else self.allow_log(ip)
+        self.metrics.inc("rate_limiter_decisions_total", 'result="allowed"' if allowed else 'result="denied"')
+        return allowed
+
+rate_limiter = RateLimiter(LIMITER_MODE)
 
 class Ip(BaseModel):
     ip:str
@@ -42,3 +137,6 @@ def my_root(ip:Ip)->str:
         return "Success"
     return "Limit execeed"
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(rate_limiter.metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,198 @@
+"""In-process load test for the payment gateway (main.app), no network.
+
+    python bench_gateway.py --duration 5 --concurrency 32 --mix read=70,write=25,batch=5
+    python bench_gateway.py --backend sqlite --blocklist-rules 10000
+
+Requests go through httpx's ASGITransport straight into the app, so the
+numbers are the app's own cost: middleware, routing, validation, handler
+and storage. Every operation gets client latency percentiles plus where
+that time went, measured by wrapping the app and the Database:
+
+    app      time inside main.app (middleware + routing + handler)
+    storage  time awaiting the Database call(s) of the request
+    client   the rest: httpx and the ASGI transport on the harness side
+
+These are wall-clock times, so with --concurrency above 1 they include
+waiting for the event loop while other requests run; --concurrency 1
+gives plain service times.
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+
+import httpx
+
+from ingest import encode_frames
+
+OPERATIONS = ("read", "write", "batch")
+
+
+def operation(method:str, path:str) -> str:
+    if path == "/batch":
+        return "batch"
+    return "read" if method == "GET" else "write"
+
+
+class Timings:
+    def __init__(self):
+        self.latency:dict[str, list[float]] = defaultdict(list)
+        self.app:dict[str, float] = defaultdict(float)
+        self.storage:dict[str, float] = defaultdict(float)
+        self.errors:dict[str, int] = defaultdict(int)
+
+
+class _TimedApp:
+    """ASGI wrapper adding up the time every request spends inside the app."""
+    def __init__(self, app, timings:Timings):
+        self.app = app
+        self.timings = timings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.timings.app[operation(scope["method"], scope["path"])] += time.perf_counter() - start
+
+
+@contextmanager
+def timed_storage(db, timings:Timings):
+    """Wrap the async Database methods the handlers use with timers; restored afterwards."""
+    names = {"get_transaction_async": "read", "insert_transaction_async": "write", "insert_transactions_async": "batch"}
+    originals = {name: getattr(db, name) for name in names}
+
+    def timed(method, op):
+        async def call(*args):
+            start = time.perf_counter()
+            try:
+                return await method(*args)
+            finally:
+                timings.storage[op] += time.perf_counter() - start
+        return call
+
+    for name, op in names.items():
+        setattr(db, name, timed(originals[name], op))
+    try:
+        yield
+    finally:
+        for name in names:
+            delattr(db, name)
+
+
+async def worker(client:httpx.AsyncClient, rng:random.Random, mix:list[tuple[str, float]], keys:int,
+                 batch_size:int, deadline:float, timings:Timings):
+    ops, weights = zip(*mix)
+    clock = time.perf_counter
+    while clock() < deadline:
+        op = rng.choices(ops, weights)[0]
+        id = rng.randrange(keys)
+        start = clock()
+        if op == "read":
+            response = await client.get(f"/{id}")
+        elif op == "write":
+            response = await client.post(f"/{id}", json={"amount": 1.25})
+        else:
+            records = [(rng.randrange(keys), 2.5) for _ in range(batch_size)]
+            response = await client.post("/batch", content=encode_frames(records),
+                                         headers={"content-type": "application/octet-stream"})
+        timings.latency[op].append(clock() - start)
+        # a read of an id nobody wrote yet is a 404, that is expected
+        if response.status_code >= 400 and not (op == "read" and response.status_code == 404):
+            timings.errors[op] += 1
+
+
+async def run(app, mix:list[tuple[str, float]], concurrency:int, duration:float, keys:int,
+              batch_size:int, seed:int) -> tuple[Timings, float]:
+    timings = Timings()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=_TimedApp(app, timings))
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            with timed_storage(app.state.db, timings):
+                # preload so reads find something
+                await client.post("/batch", content=encode_frames([(id, 1.0) for id in range(keys)]),
+                                  headers={"content-type": "application/octet-stream"})
+                timings.__init__()
+                start = time.perf_counter()
+                deadline = start + duration
+                await asyncio.gather(*[worker(client, random.Random(seed + i), mix, keys, batch_size, deadline, timings)
+                                       for i in range(concurrency)])
+                elapsed = time.perf_counter() - start
+    return timings, elapsed
+
+
+def report(timings:Timings, elapsed:float) -> str:
+    def percentile(ordered, q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3
+
+    total = sum(len(latencies) for latencies in timings.latency.values())
+    lines = [f"{total / elapsed:,.0f} requests/s over {elapsed:.1f}s",
+             f"{'op':<6} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} "
+             f"{'app ms':>8} {'storage':>8} {'client':>8} {'errors':>7}"]
+    for op in OPERATIONS:
+        latencies = sorted(timings.latency.get(op, ()))
+        if not latencies:
+            continue
+        count = len(latencies)
+        mean = sum(latencies) / count * 1e3
+        app = timings.app[op] / count * 1e3
+        storage = timings.storage[op] / count * 1e3
+        lines.append(f"{op:<6} {count:>9,} {count / elapsed:>9,.0f} {percentile(latencies, 0.5):>8.3f} "
+                     f"{percentile(latencies, 0.99):>8.3f} {percentile(latencies, 0.999):>8.3f} "
+                     f"{app:>8.3f} {storage:>8.3f} {mean - app:>8.3f} {timings.errors[op]:>7}")
+    lines.append("app/storage/client are mean ms per request; app includes storage")
+    return "\n".join(lines)
+
+
+def parse_mix(text:str) -> list[tuple[str, float]]:
+    mix = []
+    for part in text.split(","):
+        op, weight = part.split("=")
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {op!r}, use {', '.join(OPERATIONS)}")
+        mix.append((op, float(weight)))
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default="read=70,write=25,batch=5")
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--backend", default="memory", choices=("memory", "wal", "sqlite"))
+    parser.add_argument("--blocklist-rules", type=int, default=0, help="random CIDRs for the IP filter middleware")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # the app reads these when its lifespan starts
+        os.environ.pop("PAYMENT_WAL_PATH", None)
+        os.environ.pop("PAYMENT_SQLITE_PATH", None)
+        if args.backend == "wal":
+            os.environ["PAYMENT_WAL_PATH"] = os.path.join(directory, "wal.log")
+        elif args.backend == "sqlite":
+            os.environ["PAYMENT_SQLITE_PATH"] = os.path.join(directory, "payments.db")
+        from ip_filter import IPFilter
+        from main import app
+        if args.blocklist_rules:
+            rng = random.Random(args.seed)
+            # random /24s; the ASGI transport's client is 127.0.0.1, keep that one out so requests get through
+            app.state.ip_filter = IPFilter(f"{rng.randrange(1, 127)}.{rng.randrange(256)}.{rng.randrange(256)}.0/24"
+                                           for _ in range(args.blocklist_rules))
+        timings, elapsed = asyncio.run(run(app, args.mix, args.concurrency, args.duration, args.keys,
+                                           args.batch_size, args.seed))
+    print(f"backend={args.backend} concurrency={args.concurrency} mix={','.join(f'{op}={w:g}' for op, w in args.mix)} "
+          f"blocklist_rules={args.blocklist_rules}")
+    print(report(timings, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import sys
+import time
+import random
+import tracemalloc
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from fees import to_cents, to_cents_many
+
+
+class RangeStats(NamedTuple):
+    count: int
+    sum_cents: int
+    min_cents: int|None
+    max_cents: int|None
+
+
+class ColumnarDatabase:
+    """Transactions as two sorted int64 columns: ids and amounts in cents.
+
+    Same interface as Database, but 16 bytes per transaction instead of a
+    dict entry plus a boxed float, and range aggregates run over array
+    slices found with searchsorted. Writes go to a small dict (so updates
+    of the same id and point lookups of fresh writes stay cheap) that is
+    merged into the columns once it holds `merge_every` ids or before a
+    range query.
+    """
+    def __init__(self, merge_every:int = 65_536):
+        self.merge_every = merge_every
+        self.ids = np.empty(0, dtype=np.int64)
+        self.cents = np.empty(0, dtype=np.int64)
+        self.delta:dict[int, int] = {}
+
+    def insert_transaction(self, id:int, amount:float):
+        self.delta[id] = to_cents(amount)
+        if len(self.delta) >= self.merge_every:
+            self.merge()
+        return True
+
+    def insert_transactions(self, records:Iterable[tuple[int, float]]):
+        for id, amount in records:
+            self.delta[id] = to_cents(amount)
+        if len(self.delta) >= self.merge_every:
+            self.merge()
+        return True
+
+    def insert_columns(self, ids:np.ndarray, cents:np.ndarray):
+        """Bulk load straight from arrays; later entries win for repeated ids."""
+        self.merge()
+        self._merge(np.asarray(ids, dtype=np.int64), np.asarray(cents, dtype=np.int64))
+
+    def merge(self):
+        if not self.delta:
+            return
+        ids = np.fromiter(self.delta.keys(), dtype=np.int64, count=len(self.delta))
+        cents = np.fromiter(self.delta.values(), dtype=np.int64, count=len(self.delta))
+        self.delta = {}
+        self._merge(ids, cents)
+
+    def _merge(self, ids:np.ndarray, cents:np.ndarray):
+        # only the new rows get sorted; stable, so of equal ids the newest one ends up last and is kept
+        order = np.argsort(ids, kind="stable")
+        ids, cents = ids[order], cents[order]
+        last = np.ones(len(ids), dtype=bool)
+        last[:-1] = ids[1:] != ids[:-1]
+        ids, cents = ids[last], cents[last]
+        # then they go into the sorted columns where searchsorted says they belong
+        positions = np.searchsorted(self.ids, ids)
+        present = positions < len(self.ids)
+        present[present] = self.ids[positions[present]] == ids[present]
+        new = ~present
+        # into fresh arrays, range() hands out views of the old ones
+        if new.any():
+            self.ids = np.insert(self.ids, positions[new], ids[new])
+            merged_cents = np.insert(self.cents, positions[new], cents[new])
+        else:
+            merged_cents = self.cents.copy()
+        # updated ids kept their rows, moved along by the new ids inserted before them
+        updated = positions[present]
+        merged_cents[updated + np.searchsorted(positions[new], updated, side="right")] = cents[present]
+        self.cents = merged_cents
+
+    def get_cents(self, id:int) -> int:
+        cents = self.delta.get(id)
+        if cents is not None:
+            return cents
+        i = int(np.searchsorted(self.ids, id))
+        if i == len(self.ids) or self.ids[i] != id:
+            raise KeyError(id)
+        return int(self.cents[i])
+
+    def get_transaction(self, id:int) -> float:
+        return self.get_cents(id) / 100
+
+    def range(self, low:int, high:int) -> tuple[np.ndarray, np.ndarray]:
+        """Views of the ids and cents with low <= id <= high."""
+        self.merge()
+        start = np.searchsorted(self.ids, low, side="left")
+        end = np.searchsorted(self.ids, high, side="right")
+        return self.ids[start:end], self.cents[start:end]
+
+    def stats(self, low:int, high:int) -> RangeStats:
+        _, cents = self.range(low, high)
+        if not len(cents):
+            return RangeStats(0, 0, None, None)
+        return RangeStats(len(cents), int(cents.sum()), int(cents.min()), int(cents.max()))
+
+    def __len__(self) -> int:
+        self.merge()
+        return len(self.ids)
+
+
+def benchmark(rows:int = 2_000_000, queries:int = 100):
+    from payment_system import Database
+
+    rng = random.Random(0)
+    tracemalloc.start()
+    db = Database()
+    # boxed ids and amounts are counted too, the dict keeps them alive
+    db.insert_transactions([(id, rng.randrange(1, 1_000_000) / 100) for id in range(rows)])
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    columnar = ColumnarDatabase()
+    columnar.insert_columns(np.arange(rows), to_cents_many(np.fromiter(db.memory.values(), dtype=np.float64, count=rows)))
+    columnar_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"memory: Database {dict_bytes / rows:.0f} bytes/row, ColumnarDatabase {columnar_bytes / rows:.0f} bytes/row")
+
+    ranges = [sorted((rng.randrange(rows), rng.randrange(rows))) for _ in range(queries)]
+    start = time.perf_counter()
+    for low, high in ranges:
+        amounts = [amount for id, amount in db.memory.items() if low <= id <= high]
+        len(amounts), sum(amounts), min(amounts, default=None), max(amounts, default=None)
+    dict_time = (time.perf_counter() - start) / queries
+    start = time.perf_counter()
+    for low, high in ranges:
+        columnar.stats(low, high)
+    columnar_time = (time.perf_counter() - start) / queries
+    print(f"range count/sum/min/max over {rows:,} rows: Database {dict_time * 1e3:.1f}ms, "
+          f"ColumnarDatabase {columnar_time * 1e3:.2f}ms ({dict_time / columnar_time:,.0f}x)")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,198 @@
+"""Fees in integer cents.
+
+A schedule charges `basis_points` / 10000 of the amount plus `fixed_cents`,
+clamped to minimum_cents / maximum_cents when those are set. The
+percentage part is rounded to a whole cent with one of:
+
+    HALF_UP     ties away from zero (0.5 -> 1, -0.5 -> -1), the default
+    HALF_EVEN   ties to the even cent (banker's rounding)
+    DOWN        towards zero
+
+final_cents() does one amount in plain Python ints; final_cents_many() does
+a whole int64 array with NumPy and gives the same result for every row, as
+long as |cents * basis_points| fits in an int64 (amounts up to ~9e14 cents).
+to_cents() / to_cents_many() turn float amounts into those cents.
+"""
+import sys
+import math
+import time
+import random
+from decimal import ROUND_HALF_UP, Decimal
+from typing import NamedTuple
+
+import numpy as np
+
+HALF_UP = "half_up"
+HALF_EVEN = "half_even"
+DOWN = "down"
+BASIS = 10_000
+CENT = Decimal("0.01")
+# amount * 100 is within a few ulps of the decimal amount: that is far below TIE while it stays under
+# EXACT_ABOVE (~$43M), so a row further than TIE from half a cent rounds the same either way
+TIE = 1e-6
+NOT_A_TIE = 0.5 - TIE
+EXACT_ABOVE = float(1 << 32)
+
+
+class FeeSchedule(NamedTuple):
+    basis_points: int
+    fixed_cents: int = 0
+    minimum_cents: int|None = None
+    maximum_cents: int|None = None
+
+
+# what calculate_final_amount has always charged: 25% on top
+STANDARD = FeeSchedule(basis_points=2500)
+
+
+def _exact_cents(amount:float) -> int:
+    # HALF_UP on the decimal the float prints as
+    if not math.isfinite(amount):
+        raise ValueError(f"amount {amount!r} is not finite")
+    return int(Decimal(str(amount)).quantize(CENT, ROUND_HALF_UP) * 100)
+
+
+def to_cents(amount:float) -> int:
+    """Whole cents, HALF_UP like everything else here: 0.125 -> 13, 1.005 -> 101.
+
+    amount * 100 is a little off (1.005 * 100 == 100.49999999999999) and
+    round() ties to even, so rows within TIE of half a cent, and amounts
+    too large for TIE to tell, are settled on the decimal the float prints
+    as. Everything else is a float multiply and round().
+    """
+    scaled = amount * 100
+    # false for inf and NaN as well
+    if -EXACT_ABOVE < scaled < EXACT_ABOVE:
+        cents = round(scaled)
+        if -NOT_A_TIE < scaled - cents < NOT_A_TIE:
+            return cents
+    return _exact_cents(amount)
+
+
+def to_cents_many(amounts:np.ndarray) -> np.ndarray:
+    """to_cents for a float array, as int64."""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    scaled = amounts * 100
+    magnitude = np.abs(scaled)
+    # also false for NaN
+    if not (magnitude < 2.0**63).all():
+        raise ValueError("amounts must be finite and fit in int64 cents")
+    cents = np.rint(scaled)
+    # rint ties to even and the product is inexact: redo near-ties and big amounts one by one
+    exact = np.flatnonzero((np.abs(scaled - cents) >= NOT_A_TIE) | (magnitude >= EXACT_ABOVE))
+    cents = cents.astype(np.int64)
+    cents[exact] = [_exact_cents(amount) for amount in amounts[exact].tolist()]
+    return cents
+
+
+def _divide(numerator:int, rounding:str) -> int:
+    quotient, remainder = divmod(abs(numerator), BASIS)
+    if rounding == HALF_UP:
+        quotient += 2 * remainder >= BASIS
+    elif rounding == HALF_EVEN:
+        quotient += 2 * remainder > BASIS or (2 * remainder == BASIS and quotient % 2 == 1)
+    elif rounding != DOWN:
+        raise ValueError(f"unknown rounding mode {rounding!r}")
+    return -quotient if numerator < 0 else quotient
+
+
+def fee_cents(cents:int, schedule:FeeSchedule, rounding:str = HALF_UP) -> int:
+    basis_points, fixed_cents, minimum_cents, maximum_cents = schedule
+    numerator = cents * basis_points
+    if rounding == HALF_UP:
+        # the default, inlined: this runs once per transaction
+        fee = (numerator + BASIS // 2) // BASIS if numerator >= 0 else -((BASIS // 2 - numerator) // BASIS)
+    else:
+        fee = _divide(numerator, rounding)
+    fee += fixed_cents
+    if minimum_cents is not None and fee < minimum_cents:
+        fee = minimum_cents
+    if maximum_cents is not None and fee > maximum_cents:
+        fee = maximum_cents
+    return fee
+
+
+def final_cents(cents:int, schedule:FeeSchedule = STANDARD, rounding:str = HALF_UP) -> int:
+    return cents + fee_cents(cents, schedule, rounding)
+
+
+def _divide_many(numerator:np.ndarray, rounding:str) -> np.ndarray:
+    negative = numerator < 0
+    magnitude = np.abs(numerator)
+    if rounding == HALF_UP:
+        quotient = magnitude + BASIS // 2
+        quotient //= BASIS
+    elif rounding == HALF_EVEN:
+        quotient, remainder = np.divmod(magnitude, BASIS)
+        quotient += (2 * remainder > BASIS) | ((2 * remainder == BASIS) & (quotient % 2 == 1))
+    elif rounding == DOWN:
+        quotient = magnitude // BASIS
+    else:
+        raise ValueError(f"unknown rounding mode {rounding!r}")
+    np.negative(quotient, out=quotient, where=negative)
+    return quotient
+
+
+def fee_cents_many(cents:np.ndarray, schedules:FeeSchedule|list[FeeSchedule],
+                   schedule_index:np.ndarray|None = None, rounding:str = HALF_UP) -> np.ndarray:
+    """Fees for an array of amounts, either all on one schedule or row i on schedules[schedule_index[i]]."""
+    cents = np.asarray(cents, dtype=np.int64)
+    if isinstance(schedules, FeeSchedule):
+        # plain ints broadcast, no per-row gather needed
+        def column(values):
+            return values[0]
+        schedules = [schedules]
+    else:
+        if schedule_index is None:
+            raise ValueError("a list of schedules needs a schedule_index")
+        schedule_index = np.asarray(schedule_index)
+        if schedule_index.shape != cents.shape:
+            raise ValueError(f"{len(cents)} amounts but {len(schedule_index)} schedule indexes")
+
+        def column(values):
+            return np.array(values, dtype=np.int64)[schedule_index]
+
+    fee = _divide_many(cents * column([s.basis_points for s in schedules]), rounding)
+    if any(s.fixed_cents for s in schedules):
+        fee += column([s.fixed_cents for s in schedules])
+    if any(s.minimum_cents is not None for s in schedules):
+        lowest = np.iinfo(np.int64).min
+        np.maximum(fee, column([lowest if s.minimum_cents is None else s.minimum_cents for s in schedules]), out=fee)
+    if any(s.maximum_cents is not None for s in schedules):
+        highest = np.iinfo(np.int64).max
+        np.minimum(fee, column([highest if s.maximum_cents is None else s.maximum_cents for s in schedules]), out=fee)
+    return fee
+
+
+def final_cents_many(cents:np.ndarray, schedules:FeeSchedule|list[FeeSchedule] = STANDARD,
+                     schedule_index:np.ndarray|None = None, rounding:str = HALF_UP) -> np.ndarray:
+    cents = np.asarray(cents, dtype=np.int64)
+    return cents + fee_cents_many(cents, schedules, schedule_index, rounding)
+
+
+def benchmark(rows:int = 1_000_000):
+    from payment_system import calculate_final_amount
+
+    rng = random.Random(0)
+    amounts = [rng.randrange(1, 10_000_000) / 100 for _ in range(rows)]
+    floats = np.array(amounts)
+
+    def timed(run):
+        start = time.perf_counter()
+        result = run()
+        return result, time.perf_counter() - start
+
+    # what calculate_final_amount was before it worked in cents
+    _, float_time = timed(lambda: [amount * 1.25 for amount in amounts])
+    scalar, scalar_time = timed(lambda: [calculate_final_amount(amount) for amount in amounts])
+    vector, vector_time = timed(lambda: final_cents_many(to_cents_many(floats)))
+    assert np.array_equal(np.array([round(amount * 100) for amount in scalar], dtype=np.int64), vector)
+
+    print(f"{rows:,} rows: float amount*1.25 loop {float_time * 1e3:.0f}ms, "
+          f"calculate_final_amount loop {scalar_time * 1e3:.0f}ms, "
+          f"to_cents_many + final_cents_many {vector_time * 1e3:.1f}ms "
+          f"({float_time / vector_time:.1f}x the float loop, {scalar_time / vector_time:.0f}x calculate_final_amount)")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,108 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, NamedTuple
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+class _Abandoned(Exception):
+    """The owner was cancelled (or interrupted) before it had a result; waiters claim the key again."""
+
+
+class _Entry(NamedTuple):
+    fingerprint: Hashable
+    future: Future
+    expires: float
+
+
+class IdempotencyCache:
+    """Remembers the result of each request by its idempotency key.
+
+    The first request with a key runs; every later one with the same key
+    gets the stored result until it is `ttl` seconds old. A duplicate that
+    arrives while the first is still running waits on the same Future
+    instead of running again. Failures are not stored, so the client can
+    retry them. If the first one is cancelled instead, a waiting duplicate
+    takes over and runs the request itself. At most `max_entries` keys are kept, least recently used
+    go first.
+    """
+    def __init__(self, max_entries:int = 100_000, ttl:float = 24 * 3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries:OrderedDict[str, _Entry] = OrderedDict()
+        self.hits = 0
+
+    def _claim(self, key:str, fingerprint:Hashable) -> tuple[Future, bool]:
+        """The Future for `key` and whether the caller has to run the request."""
+        with self.lock:
+            now = self.clock()
+            entry = self.entries.get(key)
+            if entry is not None and (entry.expires > now or not entry.future.done()):
+                if entry.fingerprint != fingerprint:
+                    raise IdempotencyConflict(key)
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.future, False
+            future = Future()
+            # running: a waiter that gets cancelled can't cancel it for everyone else
+            future.set_running_or_notify_cancel()
+            self.entries[key] = _Entry(fingerprint, future, now + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return future, True
+
+    def _forget(self, key:str, future:Future) -> None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.future is future:
+                del self.entries[key]
+
+    def run(self, key:str, fingerprint:Hashable, execute:Callable[[], object]):
+        """execute() once per key; `fingerprint` identifies the request (e.g. its body)."""
+        while True:
+            future, owner = self._claim(key, fingerprint)
+            if owner:
+                try:
+                    future.set_result(execute())
+                except Exception as error:
+                    self._forget(key, future)
+                    future.set_exception(error)
+                except BaseException:
+                    self._forget(key, future)
+                    future.set_exception(_Abandoned())
+                    raise
+            try:
+                return future.result()
+            except _Abandoned:
+                continue
+
+    async def run_async(self, key:str, fingerprint:Hashable, execute:Callable[[], Awaitable[object]]):
+        """run() for coroutines; duplicates await the first one without blocking the event loop."""
+        while True:
+            future, owner = self._claim(key, fingerprint)
+            if owner:
+                try:
+                    future.set_result(await execute())
+                except Exception as error:
+                    self._forget(key, future)
+                    future.set_exception(error)
+                except BaseException:
+                    # cancelled: the duplicates shouldn't be, they retry below
+                    self._forget(key, future)
+                    future.set_exception(_Abandoned())
+                    raise
+            try:
+                return await asyncio.wrap_future(future)
+            except _Abandoned:
+                continue
+
+    def __len__(self) -> int:
+        return len(self.entries)
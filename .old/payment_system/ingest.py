@@ -0,0 +1,169 @@
+"""Incremental parsers for the POST /batch body.
+
+Both take the body chunk by chunk as it arrives (feed) and hand back the
+complete records seen so far, keeping only a partial line or frame between
+calls, so a request is never buffered whole.
+
+    application/x-ndjson       one {"id": <int>, "amount": <number>} per line
+    application/octet-stream   frames of <uint32 byte length> + that many bytes of
+                               little endian (int64 id, float64 amount) records
+"""
+import os
+import sys
+import json
+import math
+import time
+import struct
+import tempfile
+
+# longest partial line or frame we are willing to hold on to
+MAX_PENDING = 1 << 20
+FRAME = struct.Struct("<I")
+RECORD = struct.Struct("<qd")
+INT64_MIN, INT64_MAX = -1 << 63, (1 << 63) - 1
+_DECODER = json.JSONDecoder()
+
+
+def _record(row) -> tuple[int, float]:
+    if type(row) is not dict:
+        raise ValueError(f"expected a JSON object, got {row!r}")
+    id, amount = row.get("id"), row.get("amount")
+    if type(id) is not int or type(amount) not in (int, float):
+        raise ValueError(f"expected an integer id and a numeric amount, got {row!r}")
+    if not INT64_MIN <= id <= INT64_MAX:
+        # the WAL and the binary format store ids as int64
+        raise ValueError(f"id {id} does not fit in 64 bits")
+    try:
+        finite = math.isfinite(amount)
+    except OverflowError:
+        # an int too large for a float64
+        finite = False
+    if not finite:
+        # the WAL stores amounts as float64; json also lets NaN and Infinity through
+        raise ValueError(f"amount {amount!r} is not a finite float64")
+    return id, amount
+
+
+class NDJSONParser:
+    def __init__(self):
+        self.pending = b""
+        # lines parsed so far, for error messages
+        self.lines = 0
+
+    def _parse(self, data:bytes) -> list[tuple[int, float]]:
+        try:
+            text = data.decode()
+        except UnicodeDecodeError as error:
+            line = self.lines + data.count(b"\n", 0, error.start) + 1
+            raise ValueError(f"line {line}: not UTF-8") from None
+        records = []
+        # each line on its own: joining them into one array would let a value run across lines;
+        # decoding str lines skips json.loads' per-call encoding detection
+        decode = _DECODER.decode
+        for number, line in enumerate(text.split("\n"), self.lines + 1):
+            if not line or line.isspace():
+                continue
+            try:
+                records.append(_record(decode(line)))
+            except ValueError as error:
+                # JSONDecodeError is a ValueError too
+                raise ValueError(f"line {number}: {error}") from None
+        self.lines += text.count("\n") + 1
+        return records
+
+    def feed(self, chunk:bytes) -> list[tuple[int, float]]:
+        data = self.pending + chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            if len(data) > MAX_PENDING:
+                raise ValueError("line too long")
+            self.pending = data
+            return []
+        self.pending = data[end + 1:]
+        return self._parse(data[:end])
+
+    def close(self) -> list[tuple[int, float]]:
+        data, self.pending = self.pending, b""
+        return self._parse(data)
+
+
+class FrameParser:
+    def __init__(self):
+        self.pending = bytearray()
+
+    def feed(self, chunk:bytes) -> list[tuple[int, float]]:
+        self.pending += chunk
+        records = []
+        offset = 0
+        with memoryview(self.pending) as view:
+            while len(view) - offset >= FRAME.size:
+                (length,) = FRAME.unpack_from(view, offset)
+                if length % RECORD.size or length > MAX_PENDING:
+                    raise ValueError(f"bad frame length {length}")
+                start = offset + FRAME.size
+                if len(view) - start < length:
+                    break
+                records.extend(RECORD.iter_unpack(view[start:start + length]))
+                offset = start + length
+        del self.pending[:offset]
+        return records
+
+    def close(self) -> list[tuple[int, float]]:
+        if self.pending:
+            raise ValueError("body ends inside a frame")
+        return []
+
+
+PARSERS = {
+    "application/x-ndjson": NDJSONParser,
+    "application/octet-stream": FrameParser,
+}
+
+
+def parser_for(content_type:str) -> NDJSONParser|FrameParser|None:
+    parser = PARSERS.get(content_type.split(";")[0].strip().lower())
+    return parser() if parser is not None else None
+
+
+def encode_frames(records:list[tuple[int, float]], per_frame:int = 4096) -> bytes:
+    frames = []
+    for i in range(0, len(records), per_frame):
+        payload = b"".join(RECORD.pack(id, amount) for id, amount in records[i:i + per_frame])
+        frames.append(FRAME.pack(len(payload)) + payload)
+    return b"".join(frames)
+
+
+def encode_ndjson(records:list[tuple[int, float]]) -> bytes:
+    return "".join(f'{{"id": {id}, "amount": {amount!r}}}\n' for id, amount in records).encode()
+
+
+def benchmark(rows:int = 1_000_000, chunk_size:int = 64 * 1024):
+    from payment_system import Database
+
+    records = [(id, id * 0.25) for id in range(rows)]
+    bodies = {"ndjson": encode_ndjson(records), "binary": encode_frames(records)}
+    content_types = {"ndjson": "application/x-ndjson", "binary": "application/octet-stream"}
+
+    start = time.perf_counter()
+    db = Database()
+    for id, amount in records:
+        db.insert_transaction(id, amount)
+    print(f"{'insert_transaction per row':<34} {rows / (time.perf_counter() - start):>12,.0f} rows/s")
+
+    for name, body in bodies.items():
+        for wal in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                db = Database(wal_path=os.path.join(directory, "wal.log") if wal else None)
+                parser = parser_for(content_types[name])
+                start = time.perf_counter()
+                for i in range(0, len(body), chunk_size):
+                    db.insert_transactions(parser.feed(body[i:i + chunk_size]))
+                db.insert_transactions(parser.close())
+                elapsed = time.perf_counter() - start
+                db.close()
+            label = f"{name} stream{' + wal' if wal else ''}"
+            print(f"{label:<34} {rows / elapsed:>12,.0f} rows/s  ({len(body) / rows:.0f} bytes/row)")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -1,31 +1,134 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Query, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+from idempotency import IdempotencyCache, IdempotencyConflict
+from ingest import parser_for
+from ip_filter import IPFilter
 from payment_system import Database
+from sharded import ShardedDatabase
+from sqlite_store import SQLiteDatabase
+
+# records applied per bulk insert while a /batch body streams in
+BATCH_CHUNK = 10_000
+# file of CIDRs to reject (one per line); checked for changes every BLOCKLIST_POLL seconds
+BLOCKLIST_PATH = os.environ.get("PAYMENT_BLOCKLIST")
+BLOCKLIST_POLL = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def open_database() -> Database|SQLiteDatabase|ShardedDatabase:
+    """PAYMENT_SQLITE_PATH picks the SQLite store, PAYMENT_SHARDS that many in-memory shard processes,
+    otherwise in memory in this process (durable with PAYMENT_WAL_PATH)."""
+    sqlite_path = os.environ.get("PAYMENT_SQLITE_PATH")
+    if sqlite_path:
+        return SQLiteDatabase(sqlite_path, pool_size=int(os.environ.get("PAYMENT_POOL_SIZE", "8")))
+    shards = os.environ.get("PAYMENT_SHARDS")
+    if shards:
+        return ShardedDatabase(int(shards))
+    return Database(wal_path=os.environ.get("PAYMENT_WAL_PATH"))
+
+
+async def watch_blocklist(app:FastAPI, path:str):
+    """Rebuild the IP filter when the blocklist file changes and swap it in."""
+    loaded = None
+    while True:
+        with suppress(OSError):
+            modified = os.stat(path).st_mtime_ns
+            if modified != loaded:
+                try:
+                    # parsing thousands of rules takes a while, keep it off the event loop
+                    app.state.ip_filter = await asyncio.to_thread(IPFilter.from_file, path)
+                    loaded = modified
+                except ValueError as error:
+                    # keep serving with the old rules rather than none
+                    logger.warning("ignoring bad blocklist %s: %s", path, error)
+                    loaded = modified
+        await asyncio.sleep(BLOCKLIST_POLL)
 
-app = FastAPI(title="Payment Gateway")
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    # one Database for the whole process, shared by every request
+    app.state.db = open_database()
+    watcher = asyncio.create_task(watch_blocklist(app, BLOCKLIST_PATH)) if BLOCKLIST_PATH else None
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    app.state.db.close()
+
+
+app = FastAPI(title="Payment Gateway", lifespan=lifespan)
+# replaced as a whole (never mutated) on reload, so a request sees either the old or the new rules
+app.state.ip_filter = IPFilter()
+# responses of POST /{id} by Idempotency-Key header, so client retries don't insert twice
+idempotency = IdempotencyCache(max_entries=100_000, ttl=24 * 3600)
 
 class Transaction(BaseModel):
     amount:float
 
 @app.middleware("http")
 async def block_private_range(request:Request,call_next):
-    client_host = request.client.host
-    print(client_host)
-    if client_host == '127.0.1.1':
+    client_host = request.client.host if request.client else None
+    if request.app.state.ip_filter.blocks(client_host):
         return JSONResponse(status_code=400, content={"detail":"blocked"})
     
     return await call_next(request)
 
+@app.post("/batch")
+async def post_batch(request:Request):
+    """Bulk ingest of an NDJSON or length-prefixed binary body (see ingest.py), parsed as it streams in.
+
+    Records are applied in chunks of BATCH_CHUNK; on a malformed body the
+    chunks already applied stay and `inserted` says how many that was.
+    """
+    db = request.app.state.db
+    parser = parser_for(request.headers.get("content-type", ""))
+    if parser is None:
+        return JSONResponse(status_code=415, content={"detail":"use application/x-ndjson or application/octet-stream"})
+    inserted = 0
+    chunk = []
+    try:
+        async for data in request.stream():
+            chunk.extend(parser.feed(data))
+            if len(chunk) >= BATCH_CHUNK:
+                await db.insert_transactions_async(chunk)
+                inserted += len(chunk)
+                chunk = []
+        chunk.extend(parser.close())
+    except ValueError as error:
+        return JSONResponse(status_code=400, content={"detail":str(error), "inserted":inserted})
+    await db.insert_transactions_async(chunk)
+    return {"inserted": inserted + len(chunk)}
+
 @app.get("/{id}")
-def get_transaction(id:int)->float:
-    return Database.get_transaction(id)
+async def get_transaction(id:int, request:Request)->float:
+    try:
+        return await request.app.state.db.get_transaction_async(id)
+    except KeyError:
+        return JSONResponse(status_code=404, content={"detail":"no such transaction"})
 
 @app.post("/{id}")
-def post_transaction(id:int, transaction:Transaction, request:Request):
-    if Database().insert_transaction(id,transaction.amount):
-        return True
+async def post_transaction(id:int, transaction:Transaction, request:Request):
+    db = request.app.state.db
+
+    async def insert():
+        if await db.insert_transaction_async(id,transaction.amount):
+            return True
+
+    key = request.headers.get("idempotency-key")
+    if key is None:
+        return await insert()
+    try:
+        return await idempotency.run_async(key, (id, transaction.amount), insert)
+    except IdempotencyConflict:
+        return JSONResponse(status_code=422, content={"detail":"Idempotency-Key was already used for a different request"})
 
 @app.get("/ip/")
 def post_transaction( id:int, request:Request, )->str:
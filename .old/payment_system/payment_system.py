@@ -1,18 +1,144 @@
+import os
+import asyncio
+import logging
+import threading
+
+from fees import STANDARD, final_cents, to_cents
+from snapshot import Snapshot, merge, write_snapshot
+from wal import WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+
 class Database:
-    def __init__(self):
+    """Transactions by id, in memory.
+
+    With `wal_path` every insert is first appended to a write-ahead log
+    (group committed, see WriteAheadLog) and the log is replayed on start,
+    so a restart keeps everything that was acknowledged. Logged ids must be
+    ints.
+
+    With `snapshot_path` as well, snapshot() (and a background thread every
+    `snapshot_every` inserts, if set) writes all transactions to a sorted snapshot file that
+    remembers how far into the log it goes. A restart maps the snapshot
+    instead of loading it and only replays the log after that point;
+    `memory` then only holds the writes newer than the snapshot.
+    """
+    def __init__(self, wal_path:str|None = None, max_batch:int = 256, max_delay:float = 0.001,
+                 snapshot_path:str|None = None, snapshot_every:int|None = None):
+        if snapshot_path is not None and wal_path is None:
+            raise ValueError("snapshots need a write-ahead log")
         self.memory = {}
+        self.wal = None
+        self.base = Snapshot.empty()
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_thread = None
+        self.since_snapshot = 0
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.base = Snapshot(snapshot_path)
+        if wal_path is not None:
+            self.wal = WriteAheadLog(wal_path, max_batch=max_batch, max_delay=max_delay)
+            for id, amount in self.wal.replay(self.base.wal_offset):
+                self.memory[id] = amount
+
+    def _apply(self, records:list[tuple[int, float]]):
+        self.memory.update(records)
+        self.since_snapshot += len(records)
 
     def insert_transaction(self,id:int,amout:float):
+        if self.wal is not None:
+            # applied once durable, in log order, so memory never disagrees with a replay
+            self.insert_transactions([(id, amout)])
+            return True
         self.memory[id] = amout
         return True
+    def insert_transactions(self, records:list[tuple[int, float]]):
+        """Bulk insert: one log append (and at most one fsync) for all of `records`."""
+        if not records:
+            return True
+        if self.wal is None:
+            self.memory.update(records)
+            return True
+        self.wal.append(records, lambda: self._apply(records))
+        if self.snapshot_every is not None and self.since_snapshot >= self.snapshot_every:
+            self._snapshot_in_background()
+        return True
     def get_transaction(self, id):
-        return self.memory[id]
+        try:
+            return self.memory[id]
+        except KeyError:
+            amount = self.base.get(id)
+            if amount is None:
+                raise
+            return amount
     def process_transactions(self,transactions:list[dict[str,float]]):
-        for transaction in transactions:
-            self.insert_transaction(*transaction)
+        self.insert_transactions(list(transactions))
+
+    # async versions for the API; only a logged insert waits on disk, so only that leaves the event loop
+    async def insert_transaction_async(self, id:int, amout:float):
+        if self.wal is None:
+            return self.insert_transaction(id, amout)
+        return await asyncio.to_thread(self.insert_transaction, id, amout)
+    async def insert_transactions_async(self, records:list[tuple[int, float]]):
+        if self.wal is None:
+            return self.insert_transactions(records)
+        return await asyncio.to_thread(self.insert_transactions, records)
+    async def get_transaction_async(self, id:int) -> float:
+        return self.get_transaction(id)
+
+    def snapshot(self, wait:bool = True) -> bool:
+        """Fold everything logged so far into a new snapshot; False if one was already running and wait is False."""
+        if self.snapshot_path is None:
+            raise ValueError("Database was opened without a snapshot_path")
+        if not self.snapshot_lock.acquire(blocking=wait):
+            return False
+        try:
+            self._snapshot()
+            return True
+        finally:
+            self.snapshot_lock.release()
+
+    def _snapshot_in_background(self):
+        # writing a snapshot takes time proportional to the whole dataset, keep it off the insert path
+        if not self.snapshot_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._snapshot()
+            except Exception:
+                logger.exception("snapshot to %s failed", self.snapshot_path)
+            finally:
+                self.snapshot_lock.release()
+
+        self.snapshot_thread = threading.Thread(target=run, name="snapshot", daemon=True)
+        self.snapshot_thread.start()
+
+    def _snapshot(self):
+        # under the log's lock memory matches exactly the first wal.size bytes of the log
+        with self.wal.cond:
+            tail = dict(self.memory)
+            offset = self.wal.size
+            self.since_snapshot = 0
+        write_snapshot(self.snapshot_path, merge(self.base, tail), offset)
+        # swap in the new snapshot before dropping what it now holds, so reads never miss
+        self.base = Snapshot(self.snapshot_path)
+        with self.wal.cond:
+            for id, amount in tail.items():
+                if self.memory.get(id) == amount:
+                    del self.memory[id]
+
+    def close(self):
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+        if self.wal is not None:
+            self.wal.close()
 
 def calculate_final_amount(amount:float):
-    return amount*1.25
+    # in whole cents: 0.10 + 25% is 0.13, not 0.125; fees.py does whole arrays
+    return final_cents(to_cents(amount), STANDARD) / 100
 
 def process_transaction(amount):
     db = Database()
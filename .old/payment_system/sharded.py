@@ -0,0 +1,258 @@
+import sys
+import time
+import asyncio
+import random
+import hashlib
+import threading
+from bisect import bisect
+from contextlib import contextmanager
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+
+MASK = (1 << 64) - 1
+
+
+def _hash(data:bytes) -> int:
+    # stable across processes and runs, unlike hash() on str
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def key_hash(id:int) -> int:
+    """splitmix64 finalizer: spreads consecutive ids over the whole ring (hash() of an int is the int)."""
+    z = (id + 0x9E3779B97F4A7C15) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+def key_hash_many(ids:np.ndarray) -> np.ndarray:
+    """key_hash over an int64 array; uint64 arithmetic wraps just like the masks above."""
+    z = ids.astype(np.int64).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class ConsistentHashRing:
+    """Maps ids to shards; each shard owns `vnodes` points on a 64-bit ring.
+
+    An id belongs to the first point after its hash. Adding a shard only
+    takes over the arcs in front of its new points, so about 1/(n+1) of the
+    ids move, all of them to the new shard.
+    """
+    def __init__(self, shards:list[int], vnodes:int = 64):
+        self.vnodes = vnodes
+        self.shards = list(shards)
+        points = sorted((_hash(f"{shard}:{v}".encode()), shard) for shard in shards for v in range(vnodes))
+        self.points = np.array([point for point, _ in points], dtype=np.uint64)
+        self.owners = np.array([shard for _, shard in points], dtype=np.int64)
+
+    def with_shard(self, shard:int) -> "ConsistentHashRing":
+        return ConsistentHashRing(self.shards + [shard], self.vnodes)
+
+    def shard_for(self, id:int) -> int:
+        return int(self.owners[bisect(self.points, key_hash(id)) % len(self.points)])
+
+    def shard_for_many(self, ids:np.ndarray) -> np.ndarray:
+        return self.owners[np.searchsorted(self.points, key_hash_many(ids), side="right") % len(self.points)]
+
+
+def _serve(connection:Connection, shard:int):
+    from payment_system import Database
+
+    db = Database()
+    while True:
+        op, *args = connection.recv()
+        if op == "insert":
+            ids, amounts = args
+            db.insert_transactions(list(zip(ids.tolist(), amounts.tolist())))
+            connection.send(len(ids))
+        elif op == "get":
+            (ids,) = args
+            connection.send([db.memory.get(id) for id in ids.tolist()])
+        elif op == "copy":
+            # every id the new ring gives to another shard; they stay here until "drop"
+            (ring,) = args
+            ids = np.fromiter(db.memory, dtype=np.int64, count=len(db.memory))
+            moving = ids[ring.shard_for_many(ids) != shard]
+            connection.send((moving, np.array([db.memory[id] for id in moving.tolist()], dtype=np.float64)))
+        elif op == "drop":
+            (ids,) = args
+            for id in ids.tolist():
+                db.memory.pop(id, None)
+            connection.send(len(ids))
+        elif op == "len":
+            connection.send(len(db.memory))
+        elif op == "stop":
+            connection.send(None)
+            return
+
+
+class _Shard:
+    def __init__(self, shard:int):
+        # one request/reply at a time on the pipe
+        self.lock = threading.Lock()
+        self.connection, child = Pipe()
+        self.process = Process(target=_serve, args=(child, shard), daemon=True)
+        self.process.start()
+        child.close()
+
+
+class ShardedDatabase:
+    """Database partitioned over worker processes by a consistent-hash ring.
+
+    Each shard is a process with its own Database, so shards don't share a
+    GIL. Calls take whole batches: records are grouped by shard, each shard
+    gets one message with its part, and all shards work on their parts at
+    the same time before the replies are collected. Single-record calls
+    work too but pay a full round trip each.
+
+    Each shard's pipe has its own lock, so calls that touch different
+    shards run side by side. A call routes with the ring it sees, locks its
+    shards (in shard order), and starts over if add_shard swapped the ring
+    meanwhile. add_shard holds every lock while it copies the moving ids to
+    the new shard, switches the ring, and only then drops them from the old
+    shards, so a failure halfway leaves them where they were.
+    """
+    def __init__(self, shards:int = 4, vnodes:int = 64):
+        self.shards = {shard: _Shard(shard) for shard in range(shards)}
+        self.ring = ConsistentHashRing(list(self.shards), vnodes)
+
+    def _group(self, ring:ConsistentHashRing, ids:np.ndarray) -> dict[int, np.ndarray]:
+        """Row numbers of `ids` per shard."""
+        owners = ring.shard_for_many(ids)
+        order = np.argsort(owners, kind="stable")
+        shards, starts = np.unique(owners[order], return_index=True)
+        return dict(zip(shards.tolist(), np.split(order, starts[1:])))
+
+    def _exchange(self, messages:dict[int, tuple]) -> dict[int, object]:
+        """Send every message before waiting for any reply; the caller holds the shards' locks."""
+        for shard, message in messages.items():
+            self.shards[shard].connection.send(message)
+        return {shard: self.shards[shard].connection.recv() for shard in messages}
+
+    @contextmanager
+    def _locked(self, shards):
+        # always in shard order, so two calls can't wait on each other
+        locks = [self.shards[shard].lock for shard in sorted(shards)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _routed(self, ids:np.ndarray, message) -> tuple[dict[int, np.ndarray], dict[int, object]]:
+        """Send message(rows) to every shard owning some of `ids`; (rows, reply) per shard."""
+        while True:
+            ring = self.ring
+            groups = self._group(ring, ids)
+            with self._locked(groups):
+                if ring is self.ring:
+                    return groups, self._exchange({shard: message(rows) for shard, rows in groups.items()})
+
+    def insert_transactions(self, records:list[tuple[int, float]]):
+        ids = np.fromiter((id for id, _ in records), dtype=np.int64, count=len(records))
+        amounts = np.fromiter((amount for _, amount in records), dtype=np.float64, count=len(records))
+        self._routed(ids, lambda rows: ("insert", ids[rows], amounts[rows]))
+        return True
+
+    def insert_transaction(self, id:int, amout:float):
+        return self.insert_transactions([(id, amout)])
+
+    def get_transactions(self, ids:list[int]) -> list[float|None]:
+        """Amounts in the order of `ids`, None for unknown ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        groups, replies = self._routed(ids, lambda rows: ("get", ids[rows]))
+        amounts = np.empty(len(ids), dtype=object)
+        for shard, rows in groups.items():
+            amounts[rows] = replies[shard]
+        return amounts.tolist()
+
+    def get_transaction(self, id:int) -> float:
+        amount = self.get_transactions([id])[0]
+        if amount is None:
+            raise KeyError(id)
+        return amount
+
+    def add_shard(self) -> int:
+        """Start one more shard and move it its ids; returns how many moved."""
+        shard = max(self.shards) + 1
+        new = _Shard(shard)
+        with self._locked(list(self.shards)):
+            ring = self.ring.with_shard(shard)
+            copies = self._exchange({existing: ("copy", ring) for existing in self.shards})
+            ids = np.concatenate([moving_ids for moving_ids, _ in copies.values()])
+            amounts = np.concatenate([moving_amounts for _, moving_amounts in copies.values()])
+            try:
+                new.connection.send(("insert", ids, amounts))
+                new.connection.recv()
+            except BaseException:
+                # the old shards still have every row, only the new one goes
+                new.process.kill()
+                raise
+            # the new shard has them: from here on the ring sends their readers there
+            self.shards[shard] = new
+            self.ring = ring
+            self._exchange({existing: ("drop", copies[existing][0]) for existing in copies})
+            return len(ids)
+
+    def shard_sizes(self) -> dict[int, int]:
+        with self._locked(list(self.shards)):
+            return self._exchange({shard: ("len",) for shard in self.shards})
+
+    def __len__(self) -> int:
+        return sum(self.shard_sizes().values())
+
+    # async versions for the API: every call waits on pipes, so it runs in a worker thread
+    async def insert_transaction_async(self, id:int, amout:float):
+        return await asyncio.to_thread(self.insert_transaction, id, amout)
+
+    async def insert_transactions_async(self, records:list[tuple[int, float]]):
+        return await asyncio.to_thread(self.insert_transactions, records)
+
+    async def get_transaction_async(self, id:int) -> float:
+        return await asyncio.to_thread(self.get_transaction, id)
+
+    def close(self):
+        with self._locked(list(self.shards)):
+            self._exchange({shard: ("stop",) for shard in self.shards})
+            for shard in self.shards.values():
+                shard.process.join()
+                shard.connection.close()
+
+
+def benchmark(rows:int = 1_000_000, batch:int = 10_000):
+    from payment_system import Database
+
+    rng = random.Random(0)
+    records = [(rng.randrange(1 << 62), 1.25) for _ in range(rows)]
+    batches = [records[i:i + batch] for i in range(0, rows, batch)]
+
+    db = Database()
+    start = time.perf_counter()
+    for chunk in batches:
+        db.insert_transactions(chunk)
+    print(f"{'Database (one process)':<24} {rows / (time.perf_counter() - start):>12,.0f} inserts/s")
+
+    for shards in (1, 2, 4, 8):
+        sharded = ShardedDatabase(shards)
+        start = time.perf_counter()
+        for chunk in batches:
+            sharded.insert_transactions(chunk)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        sharded.get_transactions([id for id, _ in records[:100_000]])
+        reads = 100_000 / (time.perf_counter() - start)
+        moved = sharded.add_shard()
+        print(f"{f'ShardedDatabase shards={shards}':<24} {rows / elapsed:>12,.0f} inserts/s {reads:>10,.0f} reads/s  "
+              f"add_shard moved {moved / rows:.1%} (ideal {1 / (shards + 1):.1%})")
+        sharded.close()
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,87 @@
+import os
+import mmap
+import struct
+from bisect import bisect_left
+from typing import Iterable, Iterator
+
+# magic, record count, byte offset in the write-ahead log the snapshot covers
+HEADER = struct.Struct("<8sqq")
+MAGIC = b"TXSNAP01"
+# transaction id, amount; the 24-byte header is a multiple of 8 (not of this), so the whole file
+# casts to int64/float64 and records start at word 3, which is all Snapshot relies on
+RECORD = struct.Struct("<qd")
+
+
+def write_snapshot(path:str, records:Iterable[tuple[int, float]], wal_offset:int) -> None:
+    """Write records (sorted by id, no duplicates) so a crash leaves either the old or the new file."""
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, 0, wal_offset))
+        for id, amount in records:
+            file.write(RECORD.pack(id, amount))
+            count += 1
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, count, wal_offset))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file.
+
+    Opening maps the file and reads the header, nothing else, so it takes
+    the same time for ten records or ten million. Lookups binary search the
+    id column in place; pages are only faulted in as they are touched.
+    """
+    def __init__(self, path:str):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.wal_offset = HEADER.unpack_from(self.map)
+        if magic != MAGIC or len(self.map) != HEADER.size + self.count * RECORD.size:
+            raise ValueError(f"{path} is not a complete snapshot")
+        start = HEADER.size // 8
+        # strided views over the mapping: every other int64 is an id, every other float64 an amount
+        self.ids = memoryview(self.map).cast("q")[start::2]
+        self.amounts = memoryview(self.map).cast("d")[start + 1::2]
+
+    @classmethod
+    def empty(cls) -> "Snapshot":
+        snapshot = cls.__new__(cls)
+        snapshot.map, snapshot.count, snapshot.wal_offset = None, 0, 0
+        snapshot.ids, snapshot.amounts = (), ()
+        return snapshot
+
+    def get(self, id:int, default=None):
+        i = bisect_left(self.ids, id)
+        if i < self.count and self.ids[i] == id:
+            return self.amounts[i]
+        return default
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[tuple[int, float]]:
+        return zip(self.ids, self.amounts)
+
+
+def merge(snapshot:Iterable[tuple[int, float]], newer:dict[int, float]) -> Iterator[tuple[int, float]]:
+    """Sorted union of a snapshot and newer writes; newer wins on equal ids."""
+    newer_items = iter(sorted(newer.items()))
+    pending = next(newer_items, None)
+    for id, amount in snapshot:
+        while pending is not None and pending[0] < id:
+            yield pending
+            pending = next(newer_items, None)
+        if pending is not None and pending[0] == id:
+            continue
+        yield id, amount
+    while pending is not None:
+        yield pending
+        pending = next(newer_items, None)
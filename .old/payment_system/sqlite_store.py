@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS transactions (id INTEGER PRIMARY KEY, amount REAL NOT NULL)"
+# always the same SQL text, so each connection compiles them once and reuses them from its statement cache
+INSERT = "INSERT OR REPLACE INTO transactions (id, amount) VALUES (?, ?)"
+SELECT = "SELECT amount FROM transactions WHERE id = ?"
+
+
+def connect(path:str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False,
+                                 cached_statements=16)
+    # WAL lets readers run next to the writer; NORMAL syncs at checkpoints instead of every commit
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class SQLiteDatabase:
+    """Database on an SQLite file, behind a fixed pool of connections.
+
+    The pool is a thread pool whose every worker opens one connection the
+    first time it runs a query and keeps it, so a request never opens a
+    connection and the statements it runs stay prepared. The *_async methods hand the call to
+    that pool and await it, which keeps the event loop free while SQLite
+    works; the plain methods run on the caller's thread.
+    """
+    def __init__(self, path:str, pool_size:int = 8):
+        self.path = path
+        self._local = threading.local()
+        connection = connect(path)
+        connection.execute(SCHEMA)
+        connection.close()
+        self._connections:list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sqlite")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def insert_transaction(self, id:int, amout:float):
+        self._connection().execute(INSERT, (id, amout))
+        return True
+
+    def insert_transactions(self, records:list[tuple[int, float]]):
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(INSERT, records)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return True
+
+    def process_transactions(self, transactions:list[tuple[int, float]]):
+        self.insert_transactions(list(transactions))
+
+    def get_transaction(self, id:int) -> float:
+        row = self._connection().execute(SELECT, (id,)).fetchone()
+        if row is None:
+            raise KeyError(id)
+        return row[0]
+
+    async def _in_pool(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, method, *args)
+
+    async def insert_transaction_async(self, id:int, amout:float):
+        return await self._in_pool(self.insert_transaction, id, amout)
+
+    async def insert_transactions_async(self, records:list[tuple[int, float]]):
+        return await self._in_pool(self.insert_transactions, records)
+
+    async def get_transaction_async(self, id:int) -> float:
+        return await self._in_pool(self.get_transaction, id)
+
+    def close(self):
+        self.pool.shutdown()
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+def benchmark(requests:int = 20_000, concurrency:int = 64, ids:int = 10_000):
+    """Requests/s of a sync handler opening a connection per request vs. the pooled async path."""
+    import httpx
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "payments.db")
+        db = SQLiteDatabase(path)
+        db.insert_transactions([(id, id * 1.25) for id in range(ids)])
+        app = FastAPI()
+
+        @app.get("/per-request/{id}")
+        def get_per_request(id:int):
+            connection = connect(path)
+            try:
+                row = connection.execute(SELECT, (id,)).fetchone()
+            finally:
+                connection.close()
+            return row[0] if row else JSONResponse(status_code=404, content=None)
+
+        @app.post("/per-request/{id}")
+        def post_per_request(id:int, amount:float):
+            connection = connect(path)
+            try:
+                connection.execute(INSERT, (id, amount))
+            finally:
+                connection.close()
+            return True
+
+        @app.get("/pooled/{id}")
+        async def get_pooled(id:int):
+            try:
+                return await db.get_transaction_async(id)
+            except KeyError:
+                return JSONResponse(status_code=404, content=None)
+
+        @app.post("/pooled/{id}")
+        async def post_pooled(id:int, amount:float):
+            return await db.insert_transaction_async(id, amount)
+
+        async def drive(prefix):
+            rng = random.Random(0)
+            # 80% reads, 20% writes
+            plan = [(rng.random() < 0.2, rng.randrange(ids)) for _ in range(requests)]
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                async def worker(worker_id):
+                    for write, id in plan[worker_id::concurrency]:
+                        if write:
+                            await client.post(f"/{prefix}/{id}", params={"amount": 2.5})
+                        else:
+                            await client.get(f"/{prefix}/{id}")
+                start = time.perf_counter()
+                await asyncio.gather(*[worker(i) for i in range(concurrency)])
+                return requests / (time.perf_counter() - start)
+
+        for prefix in ("per-request", "pooled"):
+            print(f"{prefix:<12} {asyncio.run(drive(prefix)):>8,.0f} requests/s  (concurrency {concurrency}, 20% writes)")
+        db.close()
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -9,3 +9,15 @@ def test_get_ip():
     print(response)
     assert response.status_code == 2005
 
+
+
+def test_load_harness_smoke():
+    import asyncio
+    from bench_gateway import report, run
+
+    timings, elapsed = asyncio.run(run(app, [("read", 2), ("write", 1), ("batch", 1)], concurrency=4,
+                                       duration=0.3, keys=100, batch_size=10, seed=0))
+    assert set(timings.latency) == {"read", "write", "batch"}
+    assert not timings.errors
+    assert all(timings.app[op] > 0 for op in timings.latency)
+    assert "requests/s" in report(timings, elapsed)
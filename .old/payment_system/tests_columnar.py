@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+import pytest
+
+from columnar import ColumnarDatabase, RangeStats
+
+
+def test_lookups_and_upserts_across_merges():
+    db = ColumnarDatabase(merge_every=4)
+    reference = {}
+    rng = random.Random(1)
+    for _ in range(500):
+        id, amount = rng.randrange(100), rng.randrange(10_000) / 100
+        db.insert_transaction(id, amount)
+        reference[id] = amount
+    assert len(db) == len(reference)
+    for id, amount in reference.items():
+        assert db.get_transaction(id) == amount
+    with pytest.raises(KeyError):
+        db.get_transaction(1000)
+
+
+def test_range_stats_match_python():
+    rng = random.Random(2)
+    ids = np.array(rng.sample(range(1_000_000), 5000))
+    cents = np.array([rng.randrange(-500, 100_000) for _ in ids])
+    db = ColumnarDatabase()
+    db.insert_columns(ids, cents)
+    db.insert_transaction(int(ids[0]), 1.23)
+    reference = dict(zip(ids.tolist(), cents.tolist()))
+    reference[int(ids[0])] = 123
+    for low, high in [(0, 999_999), (10_000, 20_000), (500_000, 500_000), (-5, -1)]:
+        selected = [cents for id, cents in reference.items() if low <= id <= high]
+        expected = RangeStats(len(selected), sum(selected), min(selected, default=None), max(selected, default=None))
+        assert db.stats(low, high) == expected
+
+
+def test_merge_inserts_and_updates_into_sorted_columns():
+    rng = random.Random(3)
+    db = ColumnarDatabase()
+    db.insert_columns(np.arange(0, 1000, 2), np.arange(500))
+    reference = dict(zip(range(0, 1000, 2), range(500)))
+    for _ in range(20):
+        old_ids, old_cents = db.range(0, 2000)
+        before = old_ids.copy(), old_cents.copy()
+        for _ in range(rng.choice((1, 10, 100))):
+            id, cents = rng.randrange(-10, 1010), rng.randrange(1000)
+            db.insert_transaction(id, cents / 100)
+            reference[id] = cents
+        ids, cents = db.range(-10, 2000)
+        assert ids.tolist() == sorted(reference)
+        assert cents.tolist() == [reference[id] for id in sorted(reference)]
+        # views handed out earlier still show the old state
+        assert old_ids.tolist() == before[0].tolist() and old_cents.tolist() == before[1].tolist()
@@ -0,0 +1,74 @@
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pytest
+
+from fees import DOWN, HALF_EVEN, HALF_UP, FeeSchedule, fee_cents, fee_cents_many, final_cents_many, to_cents, to_cents_many
+from payment_system import calculate_final_amount
+
+SCHEDULES = [FeeSchedule(2500), FeeSchedule(290, fixed_cents=30), FeeSchedule(150, minimum_cents=50, maximum_cents=500)]
+
+
+def test_rounding_modes_on_ties():
+    # 2 cents at 25% is exactly half a cent
+    assert [fee_cents(c, FeeSchedule(2500), HALF_UP) for c in (2, 6, -2)] == [1, 2, -1]
+    assert [fee_cents(c, FeeSchedule(2500), HALF_EVEN) for c in (2, 6, -2)] == [0, 2, 0]
+    assert [fee_cents(c, FeeSchedule(2500), DOWN) for c in (3, -3)] == [0, 0]
+
+
+def test_vectorized_matches_scalar():
+    rng = random.Random(0)
+    cents = np.array([rng.randrange(-100_000, 10_000_000) for _ in range(20_000)] + [2, 6, -2, 0], dtype=np.int64)
+    index = np.array([rng.randrange(len(SCHEDULES)) for _ in cents])
+    for rounding in (HALF_UP, HALF_EVEN, DOWN):
+        for schedule in SCHEDULES:
+            expected = [c + fee_cents(c, schedule, rounding) for c in cents.tolist()]
+            assert final_cents_many(cents, schedule, rounding=rounding).tolist() == expected
+        expected = [c + fee_cents(c, SCHEDULES[i], rounding) for c, i in zip(cents.tolist(), index.tolist())]
+        assert final_cents_many(cents, SCHEDULES, index, rounding=rounding).tolist() == expected
+
+
+def test_calculate_final_amount_is_whole_cents():
+    assert calculate_final_amount(0.1) == 0.13
+    assert calculate_final_amount(5) == 6.25
+    amounts = [0.1, 5, 19.99]
+    assert [calculate_final_amount(a) for a in amounts] == (final_cents_many([10, 500, 1999]) / 100).tolist()
+
+
+def test_to_cents_rounds_half_up_on_xx5():
+    assert to_cents(0.125) == 13
+    assert to_cents(0.135) == 14
+    assert to_cents(1.005) == 101
+    assert to_cents(2.675) == 268
+    assert to_cents(-0.125) == -13
+    assert to_cents(0.124) == 12
+    assert to_cents(7) == 700
+    assert [to_cents(cents / 1000) for cents in range(5, 10_000, 10)] == list(range(1, 1001))
+
+
+def test_to_cents_fast_path_matches_decimal_rounding():
+    rng = random.Random(1)
+    amounts = ([rng.randrange(-10**9, 10**9) / 1000 for _ in range(20_000)] + [rng.uniform(-1e6, 1e6) for _ in range(5000)]
+               + [0.125, 1.005, 2.675, -0.125, -2.675, 0.0, -0.0, 5e-324, 42_949_672.955, 1e15 + 0.5, 9e16])
+    expected = [int(Decimal(str(amount)).quantize(Decimal("0.01"), ROUND_HALF_UP) * 100) for amount in amounts]
+    assert [to_cents(amount) for amount in amounts] == expected
+    assert to_cents_many(np.array(amounts)).tolist() == expected
+    assert to_cents_many([]).tolist() == []
+
+
+def test_non_finite_amounts_and_bad_schedule_indexes_are_rejected():
+    for amount in (float("inf"), -float("inf"), float("nan")):
+        with pytest.raises(ValueError):
+            to_cents(amount)
+        with pytest.raises(ValueError):
+            to_cents_many([1.0, amount])
+    with pytest.raises(ValueError):
+        to_cents_many([1e17])
+    cents = np.array([100, 200, 300])
+    with pytest.raises(ValueError):
+        fee_cents_many(cents, SCHEDULES)
+    with pytest.raises(ValueError):
+        fee_cents_many(cents, SCHEDULES, np.array([0, 1]))
+    # a single schedule still broadcasts without an index
+    assert fee_cents_many(cents, SCHEDULES[0]).tolist() == [25, 50, 75]
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from idempotency import IdempotencyCache, IdempotencyConflict
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_duplicates_run_once():
+    cache = IdempotencyCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def execute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "done"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.run("k", 1, execute)))
+    first.start()
+    started.wait()
+    others = [threading.Thread(target=lambda: results.append(cache.run("k", 1, execute))) for _ in range(8)]
+    for t in others:
+        t.start()
+    release.set()
+    for t in [first, *others]:
+        t.join()
+    assert results == ["done"] * 9
+    assert len(calls) == 1
+    assert cache.hits == 8
+
+
+def test_ttl_lru_and_failures():
+    clock = FakeClock()
+    cache = IdempotencyCache(max_entries=2, ttl=10, clock=clock)
+    assert cache.run("a", 1, lambda: 1) == 1
+    assert cache.run("a", 1, lambda: 2) == 1
+    with pytest.raises(IdempotencyConflict):
+        cache.run("a", 2, lambda: 2)
+    clock.now = 10
+    assert cache.run("a", 1, lambda: 3) == 3
+
+    cache.run("b", 1, lambda: "b")
+    cache.run("c", 1, lambda: "c")
+    assert len(cache) == 2
+    assert cache.run("a", 1, lambda: 4) == 4
+
+    with pytest.raises(ZeroDivisionError):
+        cache.run("d", 1, lambda: 1 / 0)
+    assert cache.run("d", 1, lambda: "retried") == "retried"
+
+
+def test_cancelled_owner_hands_the_key_to_a_duplicate():
+    async def scenario():
+        cache = IdempotencyCache()
+        started = asyncio.Event()
+        calls = []
+
+        async def execute():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                await asyncio.sleep(10)
+            return "done"
+
+        owner = asyncio.create_task(cache.run_async("k", 1, execute))
+        await started.wait()
+        duplicates = [asyncio.create_task(cache.run_async("k", 1, execute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert await asyncio.gather(*duplicates) == ["done"] * 3
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_duplicate_leaves_the_owner_alone():
+    async def scenario():
+        cache = IdempotencyCache()
+        release = asyncio.Event()
+
+        async def execute():
+            await release.wait()
+            return "done"
+
+        owner = asyncio.create_task(cache.run_async("k", 1, execute))
+        await asyncio.sleep(0)
+        duplicate = asyncio.create_task(cache.run_async("k", 1, execute))
+        await asyncio.sleep(0)
+        duplicate.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await duplicate
+        release.set()
+        assert await owner == "done"
+        assert await cache.run_async("k", 1, execute) == "done"
+
+    asyncio.run(scenario())
+
+
+def test_post_with_idempotency_key(monkeypatch):
+    inserts = []
+
+    async def insert(id, amount):
+        inserts.append(id)
+        return True
+
+    headers = {"Idempotency-Key": "retry-me"}
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(client.app.state.db, "insert_transaction_async", insert)
+        assert client.post("/41", json={"amount": 1.5}, headers=headers).json() is True
+        assert client.post("/41", json={"amount": 1.5}, headers=headers).json() is True
+        assert inserts == [41]
+        assert client.post("/41", json={"amount": 2.5}, headers=headers).status_code == 422
+        client.post("/41", json={"amount": 1.5})
+        assert inserts == [41, 41]
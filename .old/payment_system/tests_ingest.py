@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from ingest import FrameParser, NDJSONParser, encode_frames, encode_ndjson
+
+RECORDS = [(id, id * 1.25) for id in range(1000)]
+
+
+@pytest.fixture(scope="module")
+def client():
+    # as a context manager so the lifespan opens app.state.db
+    with TestClient(main.app) as client:
+        yield client
+
+
+def _stream(body:bytes, content_type:str, chunk_size:int) -> httpx.Response:
+    """POST /batch with the body arriving in chunk_size pieces (TestClient would send it in one)."""
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.post("/batch", content=chunks(), headers={"content-type": content_type})
+    return asyncio.run(post())
+
+
+def _feed(parser, body:bytes, chunk_size:int) -> list[tuple[int, float]]:
+    records = []
+    for i in range(0, len(body), chunk_size):
+        records.extend(parser.feed(body[i:i + chunk_size]))
+    return records + parser.close()
+
+
+def test_parsers_handle_records_split_across_chunks():
+    for chunk_size in (1, 7, 100, 1 << 16):
+        assert _feed(NDJSONParser(), encode_ndjson(RECORDS), chunk_size) == RECORDS
+        assert _feed(FrameParser(), encode_frames(RECORDS, per_frame=64), chunk_size) == RECORDS
+
+
+def test_batch_endpoint_streams_ndjson_and_binary(client, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_CHUNK", 100)
+    body = encode_ndjson(RECORDS)
+    response = _stream(body, "application/x-ndjson", 999)
+    assert response.json() == {"inserted": 1000}
+    assert main.app.state.db.get_transaction(999) == 999 * 1.25
+
+    response = client.post("/batch", content=encode_frames([(id, 2.5) for id in range(1000, 1010)]),
+                           headers={"content-type": "application/octet-stream"})
+    assert response.json() == {"inserted": 10}
+    assert client.get("/1005").json() == 2.5
+
+
+def test_batch_endpoint_rejects_bad_bodies(client, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_CHUNK", 100)
+    body = encode_ndjson(RECORDS[:250]) + b'{"id": "x", "amount": 1}\n'
+    response = _stream(body, "application/x-ndjson", 500)
+    assert response.status_code == 400
+    # whole chunks that arrived before the bad line are kept
+    assert 100 <= response.json()["inserted"] < 250
+
+    response = client.post("/batch", content=encode_frames(RECORDS)[:-1], headers={"content-type": "application/octet-stream"})
+    assert response.status_code == 400
+    assert client.post("/batch", content=b"", headers={"content-type": "text/csv"}).status_code == 415
+
+
+def test_ndjson_errors_name_the_line():
+    parser = NDJSONParser()
+    assert parser.feed(b'{"id": 1, "amount": 1}\n\n{"id": 2, "amount": 2}\n') == [(1, 1), (2, 2)]
+    for line, error in ((b'{"id": 1, "x": [\n', "line 4"), (b'{"id": 9223372036854775808, "amount": 1}\n', "64 bits"),
+                        (b'{"id": 3, "amount": NaN}\n', "finite"), (b'{"id": 3, "amount": 1%s}\n' % (b"0" * 400), "finite"),
+                        (b'\xff\n', "line 4: not UTF-8")):
+        with pytest.raises(ValueError, match=error):
+            NDJSONParser().feed(b'{"id": 1, "amount": 1}\n\n{"id": 2, "amount": 2}\n' + line)
+    # two values on one line and one value over two lines is not NDJSON, even if the counts match
+    with pytest.raises(ValueError, match="line 1"):
+        NDJSONParser().feed(b'{"id": 1, "amount": 1}, {"id": 2, "amount": 2}\n{"id": 3, "amount": 1, "x": [\n]}\n')
+
+
+def test_batch_rejects_ids_outside_int64_with_the_wal_on(tmp_path, monkeypatch):
+    monkeypatch.setenv("PAYMENT_WAL_PATH", str(tmp_path / "wal.log"))
+    with TestClient(main.app) as client:
+        for id in (2**63, -2**63 - 1):
+            response = client.post("/batch", content=b'{"id": %d, "amount": 1}\n' % id,
+                                   headers={"content-type": "application/x-ndjson"})
+            assert response.status_code == 400
+            assert "64 bits" in response.json()["detail"]
+        body = b'{"id": %d, "amount": 1}\n' % (2**63 - 1)
+        assert client.post("/batch", content=body, headers={"content-type": "application/x-ndjson"}).json() == {"inserted": 1}
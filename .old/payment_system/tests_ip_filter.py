@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+import httpx
+
+import main
+from ip_filter import IPFilter
+
+
+def test_ipv4_ipv6_and_mapped_addresses():
+    ip_filter = IPFilter(["10.0.0.0/8", "10.1.0.0/16", "192.168.1.7/32", "2001:db8::/32", "::1/128"])
+    assert ip_filter.blocks("10.200.3.4")
+    assert ip_filter.blocks("192.168.1.7")
+    assert not ip_filter.blocks("192.168.1.8")
+    assert not ip_filter.blocks("11.0.0.0")
+    assert ip_filter.blocks("2001:db8:ffff::1")
+    assert not ip_filter.blocks("2001:db9::1")
+    assert ip_filter.blocks("::ffff:10.9.9.9")
+    assert ip_filter.blocks("::1")
+    assert not ip_filter.blocks("testclient")
+    assert not ip_filter.blocks(None)
+    assert len(ip_filter.v4.starts) == 2
+
+
+def _get_ip(client_host:str) -> httpx.Response:
+    async def get():
+        transport = httpx.ASGITransport(app=main.app, client=(client_host, 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/ip/?id=3")
+    return asyncio.run(get())
+
+
+def test_middleware_uses_the_current_rules():
+    assert _get_ip("127.0.1.1").status_code == 400
+    assert _get_ip("10.1.2.3").status_code == 200
+    old = main.app.state.ip_filter
+    main.app.state.ip_filter = IPFilter(["10.0.0.0/8"])
+    try:
+        assert _get_ip("10.1.2.3").status_code == 400
+        assert _get_ip("127.0.1.1").status_code == 200
+    finally:
+        main.app.state.ip_filter = old
+
+
+def test_blocklist_file_is_reloaded(tmp_path, monkeypatch, caplog):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("# office\n10.0.0.0/8\n")
+    monkeypatch.setattr(main, "BLOCKLIST_POLL", 0.01)
+    old = main.app.state.ip_filter
+
+    async def run():
+        watcher = asyncio.create_task(main.watch_blocklist(main.app, str(path)))
+        await asyncio.sleep(0.05)
+        assert main.app.state.ip_filter.blocks("10.0.0.1")
+        path.write_text("fd00::/8\nnot a network\n")
+        os.utime(path, ns=(0, 1))
+        await asyncio.sleep(0.05)
+        # a broken file keeps the rules that were there
+        assert main.app.state.ip_filter.blocks("10.0.0.1")
+        assert [record.levelname for record in caplog.records] == ["WARNING"]
+        assert "ignoring bad blocklist" in caplog.records[0].getMessage()
+        path.write_text("fd00::/8\n")
+        await asyncio.sleep(0.05)
+        assert main.app.state.ip_filter.blocks("fd00::1")
+        assert not main.app.state.ip_filter.blocks("10.0.0.1")
+        watcher.cancel()
+
+    try:
+        asyncio.run(run())
+    finally:
+        main.app.state.ip_filter = old
@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+
+import pytest
+
+import payment_system
+from payment_system import Database
+from snapshot import Snapshot, write_snapshot
+from wal import RECORD, WriteAheadLog
+
+
+def test_restart_replays_the_log(tmp_path):
+    path = str(tmp_path / "wal.log")
+    db = Database(wal_path=path)
+    db.insert_transaction(1, 8.75)
+    db.insert_transaction(2, 7.5)
+    db.insert_transaction(1, 10.0)
+    db.close()
+
+    db = Database(wal_path=path)
+    assert db.get_transaction(1) == 10.0
+    assert db.get_transaction(2) == 7.5
+    db.close()
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "wal.log")
+    db = Database(wal_path=path)
+    db.insert_transaction(1, 8.75)
+    db.insert_transaction(2, 7.5)
+    db.close()
+    with open(path, "ab") as file:
+        file.write(b"\x01\x02\x03")
+
+    db = Database(wal_path=path)
+    assert db.memory == {1: 8.75, 2: 7.5}
+    db.insert_transaction(3, 1.0)
+    db.close()
+    assert os.path.getsize(path) == 3 * RECORD.size
+    assert Database(wal_path=path).memory == {1: 8.75, 2: 7.5, 3: 1.0}
+
+
+def test_concurrent_inserts_share_fsyncs(tmp_path):
+    path = str(tmp_path / "wal.log")
+    db = Database(wal_path=path, max_batch=16, max_delay=0.01)
+
+    def writer(id):
+        for i in range(50):
+            db.insert_transaction(id * 1000 + i, float(i))
+
+    threads = [threading.Thread(target=writer, args=(id,)) for id in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(db.memory) == 16 * 50
+    assert db.wal.fsyncs < 16 * 50 / 2
+    db.close()
+    assert Database(wal_path=path).memory == db.memory
+
+
+def test_wal_replay_reads_what_append_wrote(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal.log"))
+    wal.append([(1, 1.5), (-2, 2.5)])
+    assert list(wal.replay()) == [(1, 1.5), (-2, 2.5)]
+    wal.close()
+
+
+def test_restart_maps_snapshot_and_replays_only_the_tail(tmp_path):
+    wal_path, snapshot_path = str(tmp_path / "wal.log"), str(tmp_path / "db.snapshot")
+    db = Database(wal_path=wal_path, snapshot_path=snapshot_path)
+    for id in (5, 1, 3):
+        db.insert_transaction(id, id * 1.25)
+    db.snapshot()
+    assert db.memory == {}
+    assert db.get_transaction(3) == 3.75
+    db.insert_transaction(3, 9.0)
+    db.insert_transaction(4, 5.0)
+    db.close()
+
+    db = Database(wal_path=wal_path, snapshot_path=snapshot_path)
+    assert db.memory == {3: 9.0, 4: 5.0}
+    assert [db.get_transaction(id) for id in (1, 3, 4, 5)] == [1.25, 9.0, 5.0, 6.25]
+    with pytest.raises(KeyError):
+        db.get_transaction(2)
+    db.snapshot()
+    assert list(db.base) == [(1, 1.25), (3, 9.0), (4, 5.0), (5, 6.25)]
+    db.close()
+
+
+def test_periodic_snapshot(tmp_path):
+    db = Database(wal_path=str(tmp_path / "wal.log"), snapshot_path=str(tmp_path / "db.snapshot"), snapshot_every=10)
+    for id in range(25):
+        db.insert_transaction(id, float(id))
+    db.snapshot_thread.join()
+    assert len(db.base) >= 10
+    assert len(db.base) + len(db.memory) == 25
+    assert all(db.get_transaction(id) == float(id) for id in range(25))
+    db.close()
+
+
+def test_periodic_snapshot_runs_off_the_insert_path(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def slow_write_snapshot(*args):
+        assert release.wait(5)
+        write_snapshot(*args)
+
+    monkeypatch.setattr(payment_system, "write_snapshot", slow_write_snapshot)
+    db = Database(wal_path=str(tmp_path / "wal.log"), snapshot_path=str(tmp_path / "db.snapshot"), snapshot_every=10)
+    # the insert that crosses snapshot_every and the ones after it return while the snapshot is still being written
+    for id in range(30):
+        db.insert_transaction(id, float(id))
+    assert db.snapshot_thread.is_alive()
+    release.set()
+    db.close()
+    assert len(Snapshot(str(tmp_path / "db.snapshot"))) >= 10
+
+
+def _cold_start(tmp_path, records:int, snapshot:bool) -> float:
+    directory = tmp_path / f"{records}-{snapshot}"
+    directory.mkdir()
+    wal_path = str(directory / "wal.log")
+    snapshot_path = str(directory / "db.snapshot") if snapshot else None
+    wal = WriteAheadLog(wal_path)
+    wal.append([(id, id * 1.25) for id in range(records)])
+    wal.close()
+    if snapshot:
+        Database(wal_path=wal_path, snapshot_path=snapshot_path).snapshot()
+    start = time.perf_counter()
+    db = Database(wal_path=wal_path, snapshot_path=snapshot_path)
+    elapsed = time.perf_counter() - start
+    assert db.get_transaction(records - 1) == (records - 1) * 1.25
+    db.close()
+    return elapsed
+
+
+def test_cold_start_does_not_grow_with_the_snapshot(tmp_path):
+    small = _cold_start(tmp_path, 10_000, snapshot=True)
+    large = _cold_start(tmp_path, 200_000, snapshot=True)
+    replay = _cold_start(tmp_path, 200_000, snapshot=False)
+    assert large < small * 5 + 0.005
+    assert large * 10 < replay
@@ -0,0 +1,105 @@
+import random
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import sharded
+from sharded import ConsistentHashRing, ShardedDatabase, key_hash, key_hash_many
+
+
+def test_scalar_and_vector_hashes_agree():
+    ids = [0, 1, -1, 2**63 - 1, -2**63, 123456789]
+    assert key_hash_many(np.array(ids)).tolist() == [key_hash(id) for id in ids]
+    ring = ConsistentHashRing([0, 1, 2])
+    assert ring.shard_for_many(np.array(ids)).tolist() == [ring.shard_for(id) for id in ids]
+
+
+def test_adding_a_shard_only_moves_ids_to_it():
+    ids = np.arange(100_000)
+    ring = ConsistentHashRing(list(range(4)))
+    before = ring.shard_for_many(ids)
+    after = ring.with_shard(4).shard_for_many(ids)
+    moved = before != after
+    assert set(after[moved].tolist()) == {4}
+    assert 0.1 < moved.mean() < 0.3
+
+
+def test_sharded_database_roundtrip_across_add_shard():
+    rng = random.Random(0)
+    records = {rng.randrange(-2**40, 2**40): rng.random() for _ in range(5000)}
+    db = ShardedDatabase(shards=3)
+    try:
+        db.insert_transactions(list(records.items()))
+        db.insert_transaction(7, 1.5)
+        records[7] = 1.5
+        moved = db.add_shard()
+        assert 0 < moved < len(records) / 2
+        assert len(db) == len(records)
+        assert db.get_transactions(list(records) + [2**50]) == list(records.values()) + [None]
+        assert db.get_transaction(7) == 1.5
+    finally:
+        db.close()
+
+
+def test_failed_add_shard_keeps_every_row(monkeypatch):
+    class BrokenShard(sharded._Shard):
+        def __init__(self, shard):
+            super().__init__(shard)
+            self.connection.close()
+
+    records = {id: id / 4 for id in range(2000)}
+    db = ShardedDatabase(shards=2)
+    try:
+        db.insert_transactions(list(records.items()))
+        monkeypatch.setattr(sharded, "_Shard", BrokenShard)
+        with pytest.raises(OSError):
+            db.add_shard()
+        assert sorted(db.shards) == [0, 1]
+        assert len(db) == len(records)
+        assert db.get_transactions(list(records)) == list(records.values())
+    finally:
+        db.close()
+
+
+def test_threads_on_different_shards_and_async_api():
+    db = ShardedDatabase(shards=4)
+    try:
+        def insert(thread):
+            for start in range(0, 1000, 100):
+                db.insert_transactions([(thread * 10_000 + id, thread + id / 100) for id in range(start, start + 100)])
+
+        threads = [threading.Thread(target=insert, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        # routing has to cope with the ring changing under the writers
+        db.add_shard()
+        for thread in threads:
+            thread.join()
+        assert len(db) == 4000
+        assert db.get_transactions([3 * 10_000 + 999, 12]) == [3 + 9.99, 0.12]
+
+        async def api():
+            await db.insert_transaction_async(-5, 2.5)
+            await db.insert_transactions_async([(-6, 3.5)])
+            assert await db.get_transaction_async(-5) == 2.5
+            assert await db.get_transaction_async(-6) == 3.5
+            with pytest.raises(KeyError):
+                await db.get_transaction_async(-7)
+
+        asyncio.run(api())
+    finally:
+        db.close()
+
+
+def test_api_routes_through_shards(monkeypatch):
+    monkeypatch.delenv("PAYMENT_SQLITE_PATH", raising=False)
+    monkeypatch.setenv("PAYMENT_SHARDS", "2")
+    with TestClient(main.app) as client:
+        assert isinstance(client.app.state.db, ShardedDatabase)
+        assert client.post("/7", json={"amount": 8.75}).json() is True
+        assert client.get("/7").json() == 8.75
+        assert client.get("/8").status_code == 404
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from sqlite_store import SQLiteDatabase
+
+
+def test_sqlite_database_roundtrip(tmp_path):
+    db = SQLiteDatabase(str(tmp_path / "payments.db"), pool_size=4)
+    db.insert_transaction(1, 8.75)
+    db.insert_transactions([(2, 7.5), (1, 10.0)])
+
+    async def concurrent():
+        await asyncio.gather(*[db.insert_transaction_async(id, id / 4) for id in range(10, 110)])
+        return await asyncio.gather(*[db.get_transaction_async(id) for id in range(10, 110)])
+
+    assert asyncio.run(concurrent()) == [id / 4 for id in range(10, 110)]
+    assert db.get_transaction(1) == 10.0
+    with pytest.raises(KeyError):
+        db.get_transaction(3)
+    # every pooled thread kept its connection
+    assert len(db._connections) <= 4 + 1
+    db.close()
+    assert SQLiteDatabase(str(tmp_path / "payments.db")).get_transaction(2) == 7.5
+
+
+def test_api_shares_one_sqlite_database(tmp_path, monkeypatch):
+    monkeypatch.setenv("PAYMENT_SQLITE_PATH", str(tmp_path / "payments.db"))
+    with TestClient(main.app) as client:
+        assert isinstance(client.app.state.db, SQLiteDatabase)
+        assert client.post("/7", json={"amount": 8.75}).json() is True
+        assert client.get("/7").json() == 8.75
+        assert client.get("/8").status_code == 404
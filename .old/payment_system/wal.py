@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import struct
+import zlib
+import tempfile
+import threading
+from typing import Callable, Iterable
+
+# crc32 of the rest, transaction id, amount
+RECORD = struct.Struct("<Iqd")
+PAYLOAD = struct.Struct("<qd")
+
+
+def encode(id:int, amount:float) -> bytes:
+    payload = PAYLOAD.pack(id, amount)
+    return struct.pack("<I", zlib.crc32(payload)) + payload
+
+
+class WriteAheadLog:
+    """Append-only transaction log with group commit.
+
+    Writers hand their records to append() and block until they are on
+    disk. The first writer to find no flush in progress becomes the leader:
+    it waits up to `max_delay` seconds (the latency budget) for more writers
+    to join or for `max_batch` records to queue up, then writes the whole
+    group and fsyncs once. Everyone else in the group just waits for it.
+    """
+    def __init__(self, path:str, max_batch:int = 256, max_delay:float = 0.001):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.cond = threading.Condition()
+        self.pending:list[tuple[bytes, Callable[[], None]|None]] = []
+        self.pending_records = 0
+        self.queued = 0
+        self.durable = 0
+        self.flushing = False
+        self.error:OSError|None = None
+        self.file = open(path, "ab")
+        # bytes in the file that are durable, i.e. where the next group starts
+        self.size = self.file.tell()
+        self.fsyncs = 0
+
+    def replay(self, start:int = 0) -> Iterable[tuple[int, float]]:
+        """Yield every intact record from byte `start` on, dropping a torn tail left by a crash."""
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            data = file.read()
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            crc, id, amount = RECORD.unpack_from(data, offset)
+            if zlib.crc32(data[offset + 4:offset + RECORD.size]) != crc:
+                break
+            yield id, amount
+            offset += RECORD.size
+        if offset != len(data):
+            with self.cond:
+                self.file.truncate(start + offset)
+                self.size = start + offset
+
+    def append(self, records:list[tuple[int, float]], on_durable:Callable[[], None]|None = None) -> None:
+        """Block until `records` are fsynced; `on_durable` runs right after, in log order."""
+        data = b"".join(encode(id, amount) for id, amount in records)
+        with self.cond:
+            self.pending.append((data, on_durable))
+            self.pending_records += len(records)
+            self.queued += 1
+            ticket = self.queued
+            if self.pending_records >= self.max_batch:
+                self.cond.notify_all()
+            while self.durable < ticket:
+                if self.error is not None:
+                    raise OSError(f"write-ahead log {self.path} failed") from self.error
+                if self.flushing:
+                    self.cond.wait()
+                else:
+                    self._flush_group()
+
+    def _flush_group(self) -> None:
+        self.flushing = True
+        self.cond.wait_for(lambda: self.pending_records >= self.max_batch, timeout=self.max_delay)
+        group, self.pending, self.pending_records = self.pending, [], 0
+        last_ticket = self.queued
+        data = b"".join(data for data, _ in group)
+        self.cond.release()
+        try:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except OSError as error:
+            # the group may be half written, nothing after it can be trusted
+            self.error = error
+            raise
+        finally:
+            self.cond.acquire()
+            self.flushing = False
+            self.cond.notify_all()
+        self.fsyncs += 1
+        self.size += len(data)
+        for _, on_durable in group:
+            if on_durable is not None:
+                on_durable()
+        self.durable = last_ticket
+
+    def close(self) -> None:
+        with self.cond:
+            self.file.close()
+
+
+class _FsyncPerInsert(WriteAheadLog):
+    """Baseline: every append writes and fsyncs on its own."""
+    def append(self, records, on_durable=None):
+        data = b"".join(encode(id, amount) for id, amount in records)
+        with self.cond:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.fsyncs += 1
+
+
+def benchmark(inserts:int = 20_000):
+    for writers in (1, 16, 64):
+        for name, make in (("fsync per insert", lambda path: _FsyncPerInsert(path)),
+                           ("group commit", lambda path: WriteAheadLog(path, max_batch=writers))):
+            with tempfile.TemporaryDirectory() as directory:
+                wal = make(os.path.join(directory, "wal.log"))
+
+                def writer(id):
+                    for i in range(inserts // writers):
+                        wal.append([(id * inserts + i, 1.25)])
+
+                threads = [threading.Thread(target=writer, args=(id,)) for id in range(writers)]
+                start = time.perf_counter()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                elapsed = time.perf_counter() - start
+                wal.close()
+                done = inserts // writers * writers
+                print(f"writers={writers:<3} {name:<17} {done / elapsed:>10,.0f} inserts/s "
+                      f"{done / wal.fsyncs:>6.1f} records/fsync")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -1,5 +1,6 @@
 import time
 import random
+from collections import deque
 from threading import Lock, Thread
 import asyncio
 class TokenBucketLimiter():
@@ -11,14 +12,16 @@ class TokenBucketLimiter():
         self.lock = Lock()
         self.last_time = time.monotonic()
         self.asyc_lock = asyncio.Lock()
+        # FIFO queue of (tokens, future) parked in acquire(), woken by one timer
+        self._waiters:deque[tuple[float, asyncio.Future]] = deque()
+        self._wakeup:asyncio.TimerHandle|None = None
     def _refill_tokens(self):
-        self.current_bucket = min( self.capacity,self.current_bucket + ( time.monotonic() - self.last_time)* self.rate) 
-        print("refilled", self.current_bucket)
-        self.last_time = time.monotonic()
+        now = time.monotonic()
+        self.current_bucket = min( self.capacity,self.current_bucket + ( now - self.last_time)* self.rate) 
+        self.last_time = now
 
     async def async_consume_tokens(self, tokens:float):
         async with self.asyc_lock:
-            print("acquired_lock")
             if  self.capacity != self.current_bucket:
                 self._refill_tokens()
             if self.current_bucket< tokens:
@@ -26,6 +29,60 @@ class TokenBucketLimiter():
             self.current_bucket-=tokens
             return True
 
+    async def acquire(self, tokens:float, timeout:float|None = None) -> bool:
+        """Wait until `tokens` are available and take them, in FIFO order.
+
+        Instead of every caller polling the lock, waiters are parked in a
+        queue and a single timer wakes the queue head exactly when the bucket
+        will have refilled enough for it. Returns False if `timeout` expires.
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+        if not self._waiters:
+            self._refill_tokens()
+            if self.current_bucket >= tokens:
+                self.current_bucket -= tokens
+                return True
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append((tokens, future))
+        self._schedule_wakeup(loop)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if future.cancelled():
+                # timed out or cancelled, the next waiter may need a different wakeup
+                self._schedule_wakeup(loop)
+
+    def _schedule_wakeup(self, loop:asyncio.AbstractEventLoop):
+        while self._waiters and self._waiters[0][1].done():
+            self._waiters.popleft()
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        if not self._waiters:
+            return
+        self._refill_tokens()
+        missing = self._waiters[0][0] - self.current_bucket
+        self._wakeup = loop.call_later(max(missing, 0) / self.rate, self._wake_waiters, loop)
+
+    def _wake_waiters(self, loop:asyncio.AbstractEventLoop):
+        self._wakeup = None
+        self._refill_tokens()
+        while self._waiters:
+            tokens, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+            elif self.current_bucket >= tokens:
+                self._waiters.popleft()
+                self.current_bucket -= tokens
+                future.set_result(True)
+            else:
+                break
+        self._schedule_wakeup(loop)
+
 async def main():
     bl = TokenBucketLimiter(5,5)
     async def worker(id):
@@ -36,8 +93,30 @@ async def main():
 
     await asyncio.gather(*[worker(id) for id in range(5)])
 
+async def benchmark_acquire(waiters:int = 10_000, rate:float = 5_000):
+    """Compare polling async_consume_tokens against acquire() for many waiters."""
+    async def polling(bl, id, grants):
+        while not await bl.async_consume_tokens(1):
+            await asyncio.sleep(0.001)
+        grants.append(id)
+
+    async def parked(bl, id, grants):
+        await bl.acquire(1)
+        grants.append(id)
+
+    for name, worker in (("poll", polling), ("acquire", parked)):
+        bl = TokenBucketLimiter(10, rate)
+        grants = []
+        cpu, wall = time.process_time(), time.perf_counter()
+        await asyncio.gather(*[worker(bl, id, grants) for id in range(waiters)])
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        # how far each waiter was served from its arrival position
+        displacement = sum(abs(position - id) for position, id in enumerate(grants)) / waiters
+        print(f"{name:<8} waiters={waiters} wall={wall:.2f}s cpu={cpu:.2f}s mean displacement={displacement:.0f}")
+
 if __name__ == "__main__":
     asyncio.run(main())
+    asyncio.run(benchmark_acquire())
         
 
 
@@ -0,0 +1,245 @@
+import time
+import socket
+import socketserver
+from threading import Lock, Thread
+from urllib.parse import quote, unquote
+
+from key_store import IdleKeyStore
+from keyed_rate_limiter import KeyedTokenBucketLimiter
+
+
+class TokenStoreError(Exception):
+    """The store answered a request with an error."""
+
+
+def _request_line(command:str, key:str, *args:float) -> str:
+    # keys are percent-encoded, so a space or a newline in one can't split the line
+    return " ".join([command, quote(key, safe=""), *map(str, args)])
+
+
+class TokenStoreServer(socketserver.ThreadingTCPServer):
+    """Tiny line protocol in front of a KeyedTokenBucketLimiter.
+
+    Stand-in for the shared store (redis, a limiter service, ...) that all
+    nodes of a deployment talk to. Keys are percent-encoded:
+
+        CONSUME <key> <tokens>          -> "1" or "0"
+        LEASE <key> <tokens> <min>      -> "<granted> <retry_after>"
+
+    A line that doesn't parse gets "ERR <reason>" and the connection stays open.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address:tuple[str, int], capacity:float, rate:float):
+        super().__init__(address, _TokenStoreHandler)
+        self.limiter = KeyedTokenBucketLimiter(capacity, rate)
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _TokenStoreHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.reply(line)
+            except (ValueError, UnicodeDecodeError) as error:
+                reply = "ERR " + " ".join(str(error).split())
+            self.wfile.write(reply.encode() + b"\n")
+
+    def reply(self, line:bytes) -> str:
+        limiter = self.server.limiter
+        command, key, *args = line.decode().split()
+        key = unquote(key)
+        if command == "CONSUME" and len(args) == 1:
+            return "1" if limiter.consume(key, float(args[0])) else "0"
+        if command == "LEASE" and len(args) == 2:
+            granted, retry_after = limiter.lease(key, float(args[0]), float(args[1]))
+            return f"{granted} {retry_after}"
+        raise ValueError(f"bad request {command!r} with {len(args)} arguments")
+
+
+class _Connection():
+    def __init__(self, address:tuple[str, int]):
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rwb")
+        self.round_trips = 0
+
+    def request(self, line:str) -> str:
+        self.file.write(line.encode() + b"\n")
+        self.file.flush()
+        self.round_trips += 1
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("token store closed the connection")
+        reply = line.decode().strip()
+        if reply.startswith("ERR"):
+            raise TokenStoreError(reply[4:])
+        return reply
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class _ConnectionPool():
+    """Connections to the store, one per request in flight; idle ones are reused."""
+    def __init__(self, address:tuple[str, int]):
+        self.address = address
+        self.lock = Lock()
+        self.idle:list[_Connection] = []
+        self.connections:list[_Connection] = []
+
+    def request(self, line:str) -> str:
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = _Connection(self.address)
+            with self.lock:
+                self.connections.append(connection)
+        try:
+            reply = connection.request(line)
+        except TokenStoreError:
+            # a whole reply was read, the stream is still in step
+            with self.lock:
+                self.idle.append(connection)
+            raise
+        except BaseException:
+            # the stream is in an unknown state, don't hand it out again
+            with self.lock:
+                self.connections.remove(connection)
+            connection.close()
+            raise
+        with self.lock:
+            self.idle.append(connection)
+        return reply
+
+    @property
+    def round_trips(self) -> int:
+        return sum(connection.round_trips for connection in self.connections)
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections, self.idle = [], []
+
+
+class RemoteTokenBucketLimiter():
+    """Asks the store for every single decision (one round trip each)."""
+    def __init__(self, address:tuple[str, int]):
+        self.connection = _ConnectionPool(address)
+
+    @property
+    def round_trips(self) -> int:
+        return self.connection.round_trips
+
+    def consume(self, key:str, tokens:float = 1) -> bool:
+        return self.connection.request(_request_line("CONSUME", key, tokens)) == "1"
+
+    def close(self):
+        self.connection.close()
+
+
+class _LeaseStripe():
+    def __init__(self):
+        self.lock = Lock()
+        # key -> [leased tokens, lease expiry, denied until]
+        self.leases = IdleKeyStore(lambda lease, now: lease[1] <= now and lease[2] <= now)
+
+
+class LeasingTokenBucketLimiter():
+    """Spends tokens leased in blocks from the store, so most decisions stay local.
+
+    When a key's local lease runs out the node asks for `lease_size` more
+    tokens in one round trip. Leased tokens expire after `lease_ttl` so an
+    idle node cannot sit on a large share of the limit; expired tokens are
+    dropped, which errs on the side of admitting less. When the store has
+    nothing to give, the node denies locally until the retry_after it got
+    back instead of asking again on every request.
+
+    Keys are spread over `stripes` locks like KeyedTokenBucketLimiter, and
+    no lock is held during the round trip, so a refill only delays the
+    request that needed it. Two requests running out on the same key at the
+    same time may both ask the store; the extra tokens stay in the lease.
+    """
+    def __init__(self, address:tuple[str, int], lease_size:float = 10, lease_ttl:float = 1.0, stripes:int = 64,
+                 clock=time.monotonic):
+        self.connection = _ConnectionPool(address)
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        self.stripes = [_LeaseStripe() for _ in range(stripes)]
+
+    @property
+    def round_trips(self) -> int:
+        return self.connection.round_trips
+
+    def _lease(self, stripe:_LeaseStripe, key:str, now:float) -> list[float]:
+        lease = stripe.leases.get(key)
+        if lease is None:
+            lease = [0.0, now + self.lease_ttl, 0.0]
+            stripe.leases.put(key, lease, now)
+        elif lease[1] <= now:
+            # the tokens expire, a running backoff doesn't
+            lease[0], lease[1] = 0.0, now + self.lease_ttl
+        return lease
+
+    def consume(self, key:str, tokens:float = 1) -> bool:
+        stripe = self.stripes[hash(key) % len(self.stripes)]
+        with stripe.lock:
+            now = self.clock()
+            lease = self._lease(stripe, key, now)
+            if lease[0] >= tokens:
+                lease[0] -= tokens
+                return True
+            if now < lease[2]:
+                return False
+            missing = tokens - lease[0]
+        granted, retry_after = map(float, self.connection.request(
+            _request_line("LEASE", key, max(self.lease_size, missing), missing)).split())
+        with stripe.lock:
+            now = self.clock()
+            lease = self._lease(stripe, key, now)
+            if granted:
+                lease[0] += granted
+                lease[1] = now + self.lease_ttl
+            else:
+                lease[2] = now + retry_after
+            # another request may have topped the lease up meanwhile
+            if lease[0] >= tokens:
+                lease[0] -= tokens
+                return True
+            return False
+
+    def __len__(self) -> int:
+        return sum(len(stripe.leases) for stripe in self.stripes)
+
+    @property
+    def evictions(self) -> int:
+        return sum(stripe.leases.evictions for stripe in self.stripes)
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    server = TokenStoreServer(("127.0.0.1", 0), capacity=1000, rate=1000)
+    server.start()
+    for limiter in (RemoteTokenBucketLimiter(server.server_address), LeasingTokenBucketLimiter(server.server_address)):
+        keys = [f"{type(limiter).__name__}-{i}" for i in range(10)]
+        start = time.perf_counter()
+        allowed = sum(limiter.consume(keys[i % len(keys)]) for i in range(10_000))
+        elapsed = time.perf_counter() - start
+        print(f"{type(limiter).__name__:<28} round trips/1k decisions={limiter.round_trips / 10:.0f} "
+              f"allowed={allowed} {10_000 / elapsed:,.0f} decisions/s")
+        limiter.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+from threading import Lock
+from multiprocessing import Process, Queue, resource_tracker, shared_memory
+
+MAGIC = b"TBUCKET1"
+# magic, stripes, slots per stripe
+HEADER = struct.Struct("<8sII")
+# key hash (0 = empty slot), tokens, last refill time
+SLOT = struct.Struct("<Qdd")
+MAX_PROBES = 32
+
+
+def key_hash(key:str) -> int:
+    """Stable 64 bit hash; hash() is salted per process so workers would disagree."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+def _set_tracked(shm:shared_memory.SharedMemory, tracked:bool) -> None:
+    """Add or remove the segment from multiprocessing's resource tracker.
+
+    The tracker unlinks every segment a process registered when that process
+    exits, which would pull the table out from under the other workers. The
+    stdlib offers no public way to opt out (SharedMemory(track=False) is
+    3.13+), so this goes through resource_tracker and the private shm._name
+    (the name with its leading slash, the form the tracker stores); both
+    uses live here so there is one place to change.
+    """
+    if tracked:
+        resource_tracker.register(shm._name, "shared_memory")
+    else:
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _open_segment(name:str, size:int) -> tuple[shared_memory.SharedMemory, bool]:
+    try:
+        shm, created = shared_memory.SharedMemory(name, create=True, size=size), True
+    except FileExistsError:
+        shm, created = shared_memory.SharedMemory(name), False
+    # the segment must outlive whichever worker created it, only unlink() removes it
+    _set_tracked(shm, False)
+    return shm, created
+
+
+class SharedTokenBucketLimiter():
+    """Keyed token bucket whose state lives in shared memory.
+
+    Every process on the host that opens the same `name` (e.g. each uvicorn
+    worker) sees the same buckets, so N workers enforce one limit instead of
+    N. The segment is a fixed-layout open addressing table split into
+    `stripes` regions; a key only ever probes inside its stripe, and each
+    stripe is guarded by a thread lock plus an fcntl byte-range lock on a
+    side file, which other processes can take without sharing any objects.
+    fcntl locks are held per process, not per thread, so the thread lock is
+    what keeps threads within one process apart.
+
+    Slots are never emptied. A slot whose bucket has refilled completely is
+    reused by the next new key probing past it, which keeps probe chains
+    intact. If a stripe has no free or idle slot within MAX_PROBES the
+    request is allowed (fail open) rather than blocking the caller.
+    """
+    def __init__(self, name:str, capacity:float, rate:float, stripes:int = 64, slots_per_stripe:int = 4096,
+                 clock=time.monotonic) -> None:
+        self.name = name
+        self.capacity:float = capacity
+        self.rate:float = rate
+        self.clock = clock
+        self.refill_time = capacity / rate
+        self.shm, created = _open_segment(name, HEADER.size + stripes * slots_per_stripe * SLOT.size)
+        self.buf = self.shm.buf
+        if created:
+            HEADER.pack_into(self.buf, 0, MAGIC, stripes, slots_per_stripe)
+        else:
+            self._wait_for_header()
+        self.stripes, self.slots_per_stripe = HEADER.unpack_from(self.buf, 0)[1:]
+        # fcntl locks belong to the process: a second thread of the same process
+        # "acquires" a range its sibling holds without waiting, so threads
+        # still need a Lock of their own in front of the fcntl one
+        self.thread_locks = [Lock() for _ in range(self.stripes)]
+        self.lock_file = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _wait_for_header(self, timeout:float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while HEADER.unpack_from(self.buf, 0)[0] != MAGIC:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"shared memory segment {self.name!r} is not a token bucket table")
+            time.sleep(0.001)
+
+    def consume(self, key:str, tokens:float = 1) -> bool:
+        hashed = key_hash(key)
+        stripe = hashed % self.stripes
+        home = (hashed // self.stripes) % self.slots_per_stripe
+        base = HEADER.size + stripe * self.slots_per_stripe * SLOT.size
+        with self.thread_locks[stripe]:
+            fcntl.lockf(self.lock_file, fcntl.LOCK_EX, 1, stripe)
+            try:
+                now = self.clock()
+                offset = self._find_slot(base, home, hashed, now)
+                if offset is None:
+                    return True
+                stored, current, last_time = SLOT.unpack_from(self.buf, offset)
+                if stored != hashed:
+                    current, last_time = self.capacity, now
+                current = min(self.capacity, current + (now - last_time) * self.rate)
+                allowed = current >= tokens
+                if allowed:
+                    current -= tokens
+                SLOT.pack_into(self.buf, offset, hashed, current, now)
+                return allowed
+            finally:
+                fcntl.lockf(self.lock_file, fcntl.LOCK_UN, 1, stripe)
+
+    def _find_slot(self, base:int, home:int, hashed:int, now:float) -> int|None:
+        """Offset of the key's slot, or of the slot it should claim."""
+        claim = None
+        for probe in range(min(MAX_PROBES, self.slots_per_stripe)):
+            offset = base + ((home + probe) % self.slots_per_stripe) * SLOT.size
+            stored, _, last_time = SLOT.unpack_from(self.buf, offset)
+            if stored == hashed:
+                return offset
+            if stored == 0:
+                return offset if claim is None else claim
+            if claim is None and now - last_time >= self.refill_time:
+                claim = offset
+        return claim
+
+    def close(self) -> None:
+        os.close(self.lock_file)
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """Remove the segment; processes that still have it open keep their mapping."""
+        # SharedMemory.unlink() unregisters the name again, so hand it back first
+        _set_tracked(self.shm, True)
+        self.shm.unlink()
+        try:
+            os.unlink(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"))
+        except FileNotFoundError:
+            pass
+
+
+def _worker(name:str, decisions:int, results:Queue):
+    limiter = SharedTokenBucketLimiter(name, 100, 1)
+    allowed = sum(limiter.consume("shared-client") for _ in range(decisions))
+    limiter.close()
+    results.put(allowed)
+
+
+def main():
+    name = f"tbucket-demo-{os.getpid()}"
+    limiter = SharedTokenBucketLimiter(name, 100, 1)
+    results = Queue()
+    workers = [Process(target=_worker, args=(name, 1000, results)) for _ in range(4)]
+    start = time.perf_counter()
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    elapsed = time.perf_counter() - start
+    print(f"4 workers x 1000 decisions: {sum(results.get() for _ in workers)} allowed (limit 100) in {elapsed:.2f}s")
+    limiter.close()
+    limiter.unlink()
+
+
+if __name__ == "__main__":
+    main()
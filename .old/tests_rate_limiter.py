@@ -0,0 +1,474 @@
+import asyncio
+import math
+import time
+from threading import Thread
+
+import pytest
+
+from keyed_rate_limiter import KeyedTokenBucketLimiter
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_keyed_buckets_are_independent():
+    clock = FakeClock()
+    limiter = KeyedTokenBucketLimiter(2, 1, clock=clock)
+    assert limiter.consume("a")
+    assert limiter.consume("a")
+    assert not limiter.consume("a")
+    assert limiter.consume("b")
+    clock.now += 1
+    assert limiter.consume("a")
+    assert not limiter.consume("a")
+    assert len(limiter) == 2
+
+
+def test_keyed_refill_is_capped():
+    clock = FakeClock()
+    limiter = KeyedTokenBucketLimiter(3, 10, clock=clock)
+    assert limiter.consume("a", 3)
+    clock.now += 100
+    assert limiter.consume("a", 3)
+    assert not limiter.consume("a", 1)
+
+
+def test_keyed_threads_never_overspend():
+    clock = FakeClock()
+    limiter = KeyedTokenBucketLimiter(100, 1, stripes=4, clock=clock)
+    allowed = []
+
+    def worker():
+        allowed.append(sum(limiter.consume(f"k{i % 5}") for i in range(200)))
+
+    threads = [Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(allowed) == 500
+
+
+def test_sliding_log_allows_max_requests_per_window():
+    from main import MAX_REQUESTS, SLIDING_WINDOW, RateLimiter
+    clock = FakeClock()
+    limiter = RateLimiter("log", clock=clock)
+    assert all(limiter.allow("ip") for _ in range(MAX_REQUESTS))
+    assert not limiter.allow("ip")
+    clock.now += SLIDING_WINDOW + 1
+    assert limiter.allow("ip")
+
+
+def test_sliding_counter_weights_previous_window():
+    from main import MAX_REQUESTS, SLIDING_WINDOW, RateLimiter
+    clock = FakeClock()
+    clock.now = 10 * SLIDING_WINDOW
+    limiter = RateLimiter("counter", clock=clock)
+    assert all(limiter.allow("ip") for _ in range(MAX_REQUESTS))
+    assert not limiter.allow("ip")
+    assert limiter.allow("other")
+    # halfway into the next window half of the previous count still applies
+    clock.now += SLIDING_WINDOW * 1.5
+    allowed = sum(limiter.allow("ip") for _ in range(MAX_REQUESTS))
+    assert allowed == math.ceil(MAX_REQUESTS / 2)
+    clock.now += SLIDING_WINDOW * 2
+    assert all(limiter.allow("ip") for _ in range(MAX_REQUESTS))
+
+
+def test_idle_key_store_expires_from_the_front():
+    from key_store import IdleKeyStore
+    evicted = []
+    store = IdleKeyStore(lambda seen, now: now - seen >= 10, on_evict=lambda key, seen: evicted.append(key))
+    store.put("a", 0, now=0)
+    store.put("b", 5, now=5)
+    store.get("a")
+    store.put("c", 12, now=12)
+    # "a" was touched after "b" so "b" is checked first; "a" is idle too
+    assert evicted == []
+    store.put("d", 16, now=16)
+    assert evicted == ["b", "a"]
+    assert len(store) == 2 and store.evictions == 2
+
+
+def test_idle_key_store_caps_keys_lru():
+    from key_store import IdleKeyStore
+    store = IdleKeyStore(lambda seen, now: False, max_keys=2)
+    store.put("a", 0, now=0)
+    store.put("b", 0, now=0)
+    store.get("a")
+    store.put("c", 0, now=0)
+    assert "a" in store and "c" in store and "b" not in store
+
+
+def test_keyed_limiter_forgets_full_buckets():
+    clock = FakeClock()
+    limiter = KeyedTokenBucketLimiter(2, 1, stripes=1, clock=clock)
+    for i in range(100):
+        limiter.consume(f"scan-{i}")
+    clock.now += 2
+    limiter.consume("late")
+    assert len(limiter) < 100
+    assert limiter.evictions > 0
+    # reused slots start from a full bucket
+    assert limiter.consume("late") and not limiter.consume("late")
+
+
+def test_keyed_limiter_max_keys():
+    limiter = KeyedTokenBucketLimiter(2, 1, stripes=4, max_keys=40, clock=FakeClock())
+    for i in range(1000):
+        limiter.consume(f"scan-{i}")
+    assert len(limiter) <= 40
+
+
+def test_rate_limiter_forgets_idle_ips():
+    from main import SLIDING_WINDOW, RateLimiter
+    clock = FakeClock()
+    for mode in ("log", "counter"):
+        limiter = RateLimiter(mode, clock=clock)
+        for i in range(50):
+            limiter.allow(f"10.0.0.{i}")
+        clock.now += 3 * SLIDING_WINDOW
+        for i in range(20):
+            limiter.allow(f"10.0.1.{i}")
+        store = limiter.memory if mode == "log" else limiter.counters
+        assert len(store) < 50
+
+
+def test_acquire_wakes_waiters_in_fifo_order():
+    from rate_limiter import TokenBucketLimiter
+
+    async def run():
+        bl = TokenBucketLimiter(2, 100)
+        order = []
+
+        async def worker(id, tokens):
+            assert await bl.acquire(tokens)
+            order.append(id)
+
+        await asyncio.gather(*[worker(id, 2 if id == 2 else 1) for id in range(6)])
+        return order
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4, 5]
+
+
+def test_acquire_timeout_releases_queue_position():
+    from rate_limiter import TokenBucketLimiter
+
+    async def run():
+        bl = TokenBucketLimiter(1, 10)
+        assert await bl.acquire(1)
+        slow = asyncio.ensure_future(bl.acquire(1, timeout=0.01))
+        fast = asyncio.ensure_future(bl.acquire(1))
+        assert not await slow
+        started = time.monotonic()
+        assert await fast
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.2
+
+
+def test_consume_many_matches_consume():
+    import random
+    rng = random.Random(7)
+    batches = [[f"k{rng.randrange(50)}" for _ in range(rng.choice((5, 200)))] for _ in range(30)]
+    batches += [[f"k{i}" for i in rng.sample(range(500), 300)] for _ in range(10)]
+    clock_a, clock_b = FakeClock(), FakeClock()
+    one_by_one = KeyedTokenBucketLimiter(3, 2, stripes=4, clock=clock_a)
+    batched = KeyedTokenBucketLimiter(3, 2, stripes=4, clock=clock_b)
+    for keys in batches:
+        costs = [rng.choice((1, 2)) for _ in keys]
+        expected = [one_by_one.consume(key, cost) for key, cost in zip(keys, costs)]
+        assert batched.consume_many(keys, costs).tolist() == expected
+        clock_a.now += 0.3
+        clock_b.now += 0.3
+
+
+def test_consume_many_matches_consume_with_max_keys():
+    import random
+    rng = random.Random(3)
+    clock_a, clock_b = FakeClock(), FakeClock()
+    one_by_one = KeyedTokenBucketLimiter(1, 0.001, stripes=1, max_keys=10, clock=clock_a)
+    batched = KeyedTokenBucketLimiter(1, 0.001, stripes=1, max_keys=10, clock=clock_b)
+    keys = [f"k{i}" for i in range(64)]
+    assert batched.consume_many(keys).tolist() == [one_by_one.consume(key) for key in keys]
+    for _ in range(20):
+        keys = [f"k{rng.randrange(rng.choice((8, 16, 100)))}" for _ in range(64)]
+        assert batched.consume_many(keys).tolist() == [one_by_one.consume(key) for key in keys]
+        assert len(batched) == len(one_by_one) <= 10
+        clock_a.now += 100
+        clock_b.now += 100
+
+
+def test_token_rate_limiter_allowed_many():
+    from TokenBuckertRate import TokenRateLimiter
+    batched = TokenRateLimiter(5, 0.001)
+    one_by_one = TokenRateLimiter(5, 0.001)
+    assert batched.allowed_many(8) == sum(one_by_one.allowed(i) for i in range(8)) == 5
+    assert batched.allowed_many(3) == 0
+    assert batched.allowed_many(0) == 0
+
+
+def _shared_worker(name, results):
+    from shared_rate_limiter import SharedTokenBucketLimiter
+    limiter = SharedTokenBucketLimiter(name, 50, 0.001)
+    results.put(sum(limiter.consume(f"ip-{i % 3}") for i in range(300)))
+    limiter.close()
+
+
+def test_shared_limiter_enforces_one_limit_across_processes():
+    import multiprocessing
+    import os
+    from shared_rate_limiter import SharedTokenBucketLimiter
+    name = f"tbucket-test-{os.getpid()}"
+    limiter = SharedTokenBucketLimiter(name, 50, 0.001)
+    try:
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_shared_worker, args=(name, results)) for _ in range(4)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+        assert sum(results.get() for _ in workers) == 3 * 50
+        assert not limiter.consume("ip-0")
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+
+def test_shared_limiter_reuses_idle_slots():
+    import os
+    from shared_rate_limiter import SharedTokenBucketLimiter
+    clock = FakeClock()
+    limiter = SharedTokenBucketLimiter(f"tbucket-small-{os.getpid()}", 2, 1, stripes=1, slots_per_stripe=4, clock=clock)
+    try:
+        for i in range(4):
+            assert limiter.consume(f"ip-{i}", 2)
+        assert limiter.consume("ip-new", 2)  # table full: fail open
+        clock.now += 2
+        assert limiter.consume("ip-new", 2)
+        assert not limiter.consume("ip-new", 2)
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+
+def test_leasing_limiter_matches_store_limit_with_fewer_round_trips():
+    from remote_rate_limiter import LeasingTokenBucketLimiter, RemoteTokenBucketLimiter, TokenStoreServer
+    server = TokenStoreServer(("127.0.0.1", 0), capacity=100, rate=0.001)
+    server.start()
+    try:
+        naive = RemoteTokenBucketLimiter(server.server_address)
+        leasing = [LeasingTokenBucketLimiter(server.server_address, lease_size=10) for _ in range(3)]
+        assert sum(naive.consume("naive") for _ in range(150)) == 100
+        assert naive.round_trips == 150
+        allowed = sum(node.consume("leased") for _ in range(50) for node in leasing)
+        assert allowed == 100
+        round_trips = sum(node.round_trips for node in leasing)
+        assert round_trips < 30
+        # denied nodes back off until retry_after instead of asking again
+        assert not leasing[0].consume("leased")
+        assert sum(node.round_trips for node in leasing) == round_trips
+        for limiter in [naive, *leasing]:
+            limiter.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_token_store_protocol_survives_odd_keys_and_bad_lines():
+    import socket
+    from remote_rate_limiter import RemoteTokenBucketLimiter, TokenStoreServer
+    server = TokenStoreServer(("127.0.0.1", 0), capacity=1, rate=0.001)
+    server.start()
+    try:
+        limiter = RemoteTokenBucketLimiter(server.server_address)
+        assert limiter.consume("a b\nLEASE x 1 1")
+        assert not limiter.consume("a b\nLEASE x 1 1")
+        assert limiter.consume("a")
+        with socket.create_connection(server.server_address) as sock:
+            file = sock.makefile("rwb")
+            for line in (b"CONSUME\n", b"CONSUME k many\n", b"\xff\xfe\n", b"CONSUME k 1\n"):
+                file.write(line)
+                file.flush()
+                reply = file.readline()
+            # three error replies, and the connection still answers the fourth line
+            assert reply == b"1\n"
+        limiter.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_connection_pool_keeps_connections_after_err_and_drops_closed_ones():
+    import socket
+    from remote_rate_limiter import TokenStoreError, TokenStoreServer, _ConnectionPool
+    server = TokenStoreServer(("127.0.0.1", 0), capacity=1, rate=0.001)
+    server.start()
+    try:
+        pool = _ConnectionPool(server.server_address)
+        with pytest.raises(TokenStoreError):
+            pool.request("NOPE k")
+        # the ERR reply was read whole: the same connection answers the next request
+        assert pool.idle == pool.connections and len(pool.connections) == 1
+        assert pool.request("CONSUME k 1") == "1"
+        assert len(pool.connections) == 1
+        pool.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        def hang_up():
+            connection, _ = listener.accept()
+            with connection:
+                connection.recv(100)
+
+        thread = Thread(target=hang_up)
+        thread.start()
+        pool = _ConnectionPool(listener.getsockname())
+        with pytest.raises(ConnectionError):
+            pool.request("CONSUME k 1")
+        thread.join()
+        # a closed connection is neither reused nor kept
+        assert pool.idle == [] and pool.connections == []
+
+
+def test_leasing_limiter_keeps_backoff_when_the_lease_expires():
+    from remote_rate_limiter import LeasingTokenBucketLimiter, TokenStoreServer
+    server = TokenStoreServer(("127.0.0.1", 0), capacity=2, rate=0.001)
+    server.start()
+    try:
+        clock = FakeClock()
+        node = LeasingTokenBucketLimiter(server.server_address, lease_size=2, lease_ttl=0.1, clock=clock)
+        assert node.consume("k") and node.consume("k") and not node.consume("k")
+        round_trips = node.round_trips
+        for _ in range(10):
+            clock.now += 0.2
+            assert not node.consume("k")
+        assert node.round_trips == round_trips
+        node.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_leasing_limiter_decides_locally_during_another_keys_refill():
+    import threading
+    from remote_rate_limiter import LeasingTokenBucketLimiter
+
+    class SlowStore():
+        round_trips = 0
+
+        def __init__(self):
+            self.entered, self.release = threading.Event(), threading.Event()
+
+        def request(self, line):
+            if line.split()[1] == "slow":
+                self.entered.set()
+                assert self.release.wait(5)
+            return "10.0 0.0"
+
+    node = LeasingTokenBucketLimiter(("127.0.0.1", 0), stripes=1)
+    node.connection = store = SlowStore()
+    assert node.consume("fast")
+    slow = Thread(target=node.consume, args=("slow",))
+    slow.start()
+    assert store.entered.wait(5)
+    # same stripe, and "slow" is waiting on the store: "fast" still gets its local tokens
+    assert all(node.consume("fast") for _ in range(5))
+    store.release.set()
+    slow.join()
+
+
+def test_gcra_matches_token_bucket_and_reports_retry_after():
+    from gcra_rate_limiter import KeyedGCRALimiter
+    clock = FakeClock()
+    gcra = KeyedGCRALimiter(3, 2, clock=clock)
+    bucket = KeyedTokenBucketLimiter(3, 2, clock=clock)
+    for step in range(40):
+        cost = 1 + step % 2
+        assert gcra.consume("k", cost) == bucket.consume("k", cost)
+        clock.now += 0.25 * (step % 3)
+    gcra = KeyedGCRALimiter(3, 2, clock=clock)
+    assert gcra.decide("k", 3) == (True, 0.0)
+    allowed, retry_after = gcra.decide("k", 1)
+    assert not allowed and retry_after == 0.5
+    clock.now += retry_after
+    assert gcra.consume("k", 1)
+
+
+def test_gcra_forgets_replenished_keys():
+    from gcra_rate_limiter import KeyedGCRALimiter
+    clock = FakeClock()
+    gcra = KeyedGCRALimiter(2, 1, stripes=1, clock=clock)
+    for i in range(100):
+        gcra.consume(f"scan-{i}")
+    clock.now += 2
+    gcra.consume("late")
+    assert len(gcra) < 100
+
+
+def test_rate_limiter_gcra_mode():
+    from main import MAX_REQUESTS, SLIDING_WINDOW, RateLimiter
+    clock = FakeClock()
+    limiter = RateLimiter("gcra", clock=clock)
+    assert all(limiter.allow("ip") for _ in range(MAX_REQUESTS))
+    assert not limiter.allow("ip")
+    clock.now += SLIDING_WINDOW / MAX_REQUESTS
+    assert limiter.allow("ip")
+
+
+def test_metrics_aggregate_thread_shards():
+    from limiter_metrics import Metrics
+    metrics = Metrics()
+    metrics.describe("decisions_total", "counter", "Decisions.")
+
+    def worker():
+        for i in range(1000):
+            metrics.inc("decisions_total", 'result="allowed"' if i % 4 else 'result="denied"')
+            metrics.observe("wait_seconds", 2e-6)
+
+    threads = [Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    text = metrics.render()
+    assert "# TYPE decisions_total counter" in text
+    assert 'decisions_total{result="allowed"} 3000' in text
+    assert 'decisions_total{result="denied"} 1000' in text
+    assert 'wait_seconds_bucket{le="1e-06"} 0' in text
+    assert 'wait_seconds_bucket{le="5e-06"} 4000' in text
+    assert "wait_seconds_count 4000" in text
+
+
+def test_metrics_endpoint():
+    from fastapi.testclient import TestClient
+    import main
+    client = TestClient(main.app)
+    for _ in range(main.MAX_REQUESTS + 2):
+        client.post("/mypost", json={"ip": "metrics-test"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'rate_limiter_decisions_total{result="denied"} 2' in response.text
+    assert "rate_limiter_lock_wait_seconds_count" in response.text
+    assert "rate_limiter_active_keys 1" in response.text
+
+
+def test_bench_harness_smoke():
+    from bench_rate_limiters import Setup, key_stream, report, run
+    streams = [key_stream(5, "zipf", 1.1, 1000, id) for id in range(2)]
+    for name, model in (("gcra", "threads"), ("bucket", "asyncio")):
+        setup = Setup(name, 5, 10)
+        try:
+            latencies, allowed, requested, elapsed = run(setup, model, 2, 0.05, streams)
+        finally:
+            setup.close()
+        assert len(latencies) == sum(requested.values()) > 0
+        assert sum(allowed.values()) <= len(requested) * (5 + 10 * elapsed) + 1
+        assert report(name, setup, latencies, allowed, requested, elapsed).startswith(name)
@@ -0,0 +1,130 @@
+# approach via lock striping: independent Robin Hood tables, one lock each
+import sys
+import time
+import random
+import threading
+
+from robin_hood_hashmap import RobinHoodHashTable
+
+MASK64 = (1 << 64) - 1
+# 2^64 / golden ratio: multiplying by it mixes every bit of the hash into the top bits
+FIBONACCI = 0x9E3779B97F4A7C15
+
+
+class ConcurrentHashTable():
+    """Thread-safe hash table split into `segments` RobinHoodHashTables.
+
+    Each segment has its own lock, so threads working on different
+    segments don't wait for each other. A key's segment comes from the top
+    bits of its Fibonacci-multiplied hash, while a segment picks the slot
+    from the low bits of the hash, so the two choices don't correlate and
+    every segment fills evenly. A segment doubles on its own when it is
+    full, holding only its own lock. items() and len() take every lock, in
+    segment order, so they see one consistent state. segments=1 is a plain
+    table behind a global lock.
+    """
+    def __init__(self, segments=16, capacity=8, max_load=0.8):
+        bits = (segments - 1).bit_length()
+        self.shift = 64 - bits
+        self.segments = [RobinHoodHashTable(max(capacity >> bits, 8), max_load) for _ in range(1 << bits)]
+        self.locks = [threading.Lock() for _ in range(1 << bits)]
+
+    def _segment(self, h):
+        return ((h * FIBONACCI) & MASK64) >> self.shift
+
+    def insert(self, key, value):
+        h = hash(key)
+        s = self._segment(h)
+        segment = self.segments[s]
+        with self.locks[s]:
+            i = segment._find(key, h)
+            if i >= 0:
+                segment.values[i] = value
+            else:
+                segment._add(h, key, value)
+
+    def get(self, key, default=None):
+        h = hash(key)
+        s = self._segment(h)
+        segment = self.segments[s]
+        # a lookup racing a resize or a backward shift could miss the key, so reads lock too
+        with self.locks[s]:
+            i = segment._find(key, h)
+            return default if i < 0 else segment.values[i]
+
+    def delete(self, key):
+        s = self._segment(hash(key))
+        with self.locks[s]:
+            self.segments[s].delete(key)
+
+    def __contains__(self, key):
+        h = hash(key)
+        s = self._segment(h)
+        with self.locks[s]:
+            return self.segments[s]._find(key, h) >= 0
+
+    def _lock_all(self):
+        # always in segment order, two snapshots can't deadlock
+        for lock in self.locks:
+            lock.acquire()
+
+    def _unlock_all(self):
+        for lock in reversed(self.locks):
+            lock.release()
+
+    def __len__(self):
+        self._lock_all()
+        try:
+            return sum(segment.size for segment in self.segments)
+        finally:
+            self._unlock_all()
+
+    def items(self):
+        """Snapshot of every (key, value) at one point in time."""
+        self._lock_all()
+        try:
+            return [item for segment in self.segments for item in segment.items()]
+        finally:
+            self._unlock_all()
+
+
+def benchmark(ops_per_thread=100_000, keys=100_000):
+    rng = random.Random(0)
+    universe = [rng.getrandbits(62) for _ in range(keys)]
+    mixes = (("read-heavy", 0.9), ("write-heavy", 0.1))
+
+    def worker(table, operations, barrier):
+        barrier.wait()
+        for is_read, key in operations:
+            if is_read:
+                table.get(key)
+            else:
+                table.insert(key, key)
+
+    print(f"switch interval {sys.getswitchinterval() * 1e3:g}ms; threads share one GIL, "
+          f"so totals measure contention overhead, not parallel speedup")
+    for mix, reads in mixes:
+        for threads in (1, 2, 4, 8, 16, 32):
+            line = f"{mix:<12} threads={threads:<3}"
+            for segments in (1, 16, 64):
+                table = ConcurrentHashTable(segments)
+                for key in universe:
+                    table.insert(key, key)
+                work = [[(rng.random() < reads, rng.choice(universe)) for _ in range(ops_per_thread)]
+                        for _ in range(threads)]
+                barrier = threading.Barrier(threads + 1)
+                pool = [threading.Thread(target=worker, args=(table, operations, barrier)) for operations in work]
+                for thread in pool:
+                    thread.start()
+                barrier.wait()
+                start = time.perf_counter()
+                for thread in pool:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                name = "global lock" if segments == 1 else f"{segments} segments"
+                line += f"  {name} {threads * ops_per_thread / elapsed:>9,.0f} ops/s"
+            print(line)
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
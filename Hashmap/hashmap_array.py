@@ -10,7 +10,6 @@ class HashTable():
         index = hash(key)% self.size
 
         for i, (current_key, current_value) in enumerate(self.array[index]):
-            print("Collsion:", self.array[index])
             if key == current_key:
                 self.array[index][i] = (key, value)
                 return
@@ -23,41 +22,18 @@ class HashTable():
                 return current_value
 
 
-        
+#Option B: Open Addressing (linear probing) -> robin_hood_hashmap.py
 
-a = HashTable(8)
-a.insert(1, 'apple')
-a.insert(2, 'banana')
-a.insert(4, 'rasberry')
-a.insert(12, 'strawberry')
 
-print(a.get(1))
-print(a.get(2))
-print(a.get(4))
-print(a.get(12))
-print(a.get(13))
+if __name__ == "__main__":
+    a = HashTable(8)
+    a.insert(1, 'apple')
+    a.insert(2, 'banana')
+    a.insert(4, 'rasberry')
+    a.insert(12, 'strawberry')
 
-
-#Option B: Open Addressing (linear probing)
-
-def put(key, value):
-    index = hash_function(key)
-
-    while table[index] is not None:
-        if table[index][0] == key:
-            table[index] = (key, value)
-            return
-        index = (index + 1) % size
-
-    table[index] = (key, value)
-
-
-    def get(key):
-    index = hash_function(key)
-
-    while table[index] is not None:
-        if table[index][0] == key:
-            return table[index][1]
-        index = (index + 1) % size
-
-    return None
+    print(a.get(1))
+    print(a.get(2))
+    print(a.get(4))
+    print(a.get(12))
+    print(a.get(13))
@@ -0,0 +1,184 @@
+# approach via Robin Hood tables that grow incrementally instead of all at once
+import sys
+import time
+import random
+from array import array
+
+from robin_hood_hashmap import EMPTY, RobinHoodHashTable
+
+# value left in the old table for an entry that was moved, overwritten or deleted
+_DELETED = object()
+# empty slots appended to the next table's arrays per insert, ahead of time
+_PREALLOCATE = 32
+_EMPTY_HASHES = array('q', [EMPTY]) * _PREALLOCATE
+_NONES = [None] * _PREALLOCATE
+
+
+class IncrementalHashTable():
+    """RobinHoodHashTable without the stop-the-world resize.
+
+    When the table is full a second one, twice the size, takes over and the
+    old one becomes read-only. Every insert/get/delete then moves the next
+    `migrate_slots` slots of the old table across, so no single operation
+    pays for more than a handful of moves. That is raised where needed (from
+    1 to 2 at max_load 0.8) so the old table is drained before inserts fill
+    the new one, which would otherwise resize all at once. Until the old
+    table is drained, lookups try the new table first and then the old one. Entries in the
+    old table are never shifted, only marked _DELETED once they have moved
+    or been replaced, which keeps the migration cursor valid.
+
+    Allocating the bigger table and freeing the old one are O(capacity) as
+    well. So the drained old arrays are kept, and while the current table
+    fills up every insert wipes or appends a few of their slots, until they
+    have twice the current capacity and can back the next table.
+    """
+    def __init__(self, capacity=8, max_load=0.8, migrate_slots=8):
+        self.max_load = max_load
+        self.migrate_slots = migrate_slots
+        # slots moved per operation during the current migration
+        self.step = migrate_slots
+        self.table = RobinHoodHashTable(capacity, max_load)
+        self.old = None
+        self.cursor = 0
+        # entries in the old table that have not moved or been replaced yet
+        self.old_live = 0
+        # (hashes, keys, values) for the next table, and how many of their slots are already empty
+        self.spare = (array('q'), [], [])
+        self.cleared = 0
+
+    def _grow_spare(self):
+        hashes, keys, values = self.spare
+        i = self.cleared
+        if i < len(hashes):
+            # arrays recycled from the last old table: wipe them first
+            n = min(_PREALLOCATE, len(hashes) - i)
+            hashes[i:i + n] = _EMPTY_HASHES[:n]
+            keys[i:i + n] = _NONES[:n]
+            values[i:i + n] = _NONES[:n]
+        else:
+            n = min(_PREALLOCATE, self.table.capacity * 2 - i)
+            if n <= 0:
+                return
+            hashes.extend(_EMPTY_HASHES[:n])
+            keys.extend(_NONES[:n])
+            values.extend(_NONES[:n])
+        self.cleared = i + n
+
+    def _start_migration(self):
+        capacity = self.table.capacity * 2
+        hashes, keys, values = self.spare
+        if self.cleared < capacity:
+            # only if the spare could not keep up, e.g. a table built with a large capacity
+            hashes[:] = array('q', [EMPTY]) * capacity
+            keys[:] = [None] * capacity
+            values[:] = [None] * capacity
+        self.old = self.table
+        self.old_live = self.old.size
+        self.cursor = 0
+        self.table = RobinHoodHashTable(capacity, self.max_load, self.spare)
+        # each operation adds at most one entry to the new table while the old one drains, so
+        # draining in `room` operations keeps it below grow_at
+        room = max(self.table.grow_at - self.old_live, 1)
+        self.step = max(self.migrate_slots, -(-self.old.capacity // room))
+        self.spare = (array('q'), [], [])
+        self.cleared = 0
+
+    def _migrate(self):
+        old = self.old
+        end = min(self.cursor + self.step, old.capacity)
+        hashes, keys, values = old.hashes, old.keys, old.values
+        for i in range(self.cursor, end):
+            if hashes[i] != EMPTY and values[i] is not _DELETED:
+                self.table._add(hashes[i], keys[i], values[i])
+                values[i] = _DELETED
+                self.old_live -= 1
+        self.cursor = end
+        if end == old.capacity:
+            # freeing these arrays would be O(capacity) too, they become the next spare instead
+            self.old = None
+            self.spare = (hashes, keys, values)
+            self.cleared = 0
+
+    def _drop_old(self, key, h):
+        """Mark key's entry in the old table as gone; True if it was live there."""
+        i = self.old._find(key, h)
+        if i >= 0 and self.old.values[i] is not _DELETED:
+            self.old.values[i] = _DELETED
+            self.old_live -= 1
+            return True
+        return False
+
+    def insert(self, key, value):
+        if self.old is not None:
+            self._migrate()
+        if self.old is None:
+            if self.table.size >= self.table.grow_at:
+                self._start_migration()
+            else:
+                self._grow_spare()
+        if self.old is not None:
+            self._drop_old(key, hash(key))
+        self.table.insert(key, value)
+
+    def get(self, key, default=None):
+        if self.old is not None:
+            self._migrate()
+        h = hash(key)
+        i = self.table._find(key, h)
+        if i >= 0:
+            return self.table.values[i]
+        if self.old is not None:
+            i = self.old._find(key, h)
+            if i >= 0 and self.old.values[i] is not _DELETED:
+                return self.old.values[i]
+        return default
+
+    def delete(self, key):
+        if self.old is not None:
+            self._migrate()
+        found = key in self.table
+        if found:
+            self.table.delete(key)
+        if self.old is not None and self._drop_old(key, hash(key)):
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key, _DELETED) is not _DELETED
+
+    def __len__(self):
+        return self.table.size + (self.old_live if self.old is not None else 0)
+
+    def items(self):
+        yield from self.table.items()
+        if self.old is not None:
+            for key, value in self.old.items():
+                if value is not _DELETED:
+                    yield key, value
+
+
+def benchmark(inserts=2_000_000):
+    rng = random.Random(0)
+    keys = [rng.getrandbits(62) for _ in range(inserts)]
+    clock = time.perf_counter_ns
+    for name, table in (("RobinHoodHashTable", RobinHoodHashTable()), ("IncrementalHashTable", IncrementalHashTable())):
+        # preallocated, growing the list while timing would show up as spikes of its own
+        latencies = [0] * inserts
+        start = time.perf_counter()
+        for n, key in enumerate(keys):
+            before = clock()
+            table.insert(key, key)
+            latencies[n] = clock() - before
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] / 1000
+
+        print(f"{name:<22} {inserts / elapsed:>10,.0f} inserts/s  p50 {percentile(0.5):.1f}us  p99 {percentile(0.99):.1f}us  "
+              f"p999 {percentile(0.999):.1f}us  p9999 {percentile(0.9999):.1f}us  max {latencies[-1] / 1000:,.0f}us")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,322 @@
+# approach via open addressing (linear probing) in a memory-mapped file, values in an append-only log
+import os
+import sys
+import mmap
+import time
+import fcntl
+import random
+import struct
+import hashlib
+import resource
+
+# magic, capacity (slots), count (used slots), generation; the size of two slots, so slots stay 8-byte aligned
+HEADER = struct.Struct("<8sQQQ")
+MAGIC = b"PHTIDX02"
+# header words
+COUNT, GENERATION = 2, 3
+# key hash (0 = free), offset of the record in the log: one word each, so a reader never sees half a store
+SLOT = struct.Struct("<QQ")
+# key length, value length; followed by the key and the value
+RECORD = struct.Struct("<II")
+
+
+def _hash(key):
+    # stable across processes and runs, unlike hash(); 0 is kept for free slots
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def _encode(data):
+    return data.encode() if isinstance(data, str) else bytes(data)
+
+
+def _fsync_directory(path):
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class PersistentHashTable():
+    """Hash table whose slot array is a memory-mapped file, values in a log.
+
+    `path` holds a header and `capacity` slots of (key hash, offset);
+    `path + ".log"` holds the records (key length, value length, key,
+    value) back to back. Opening maps both files and reads the header,
+    nothing else, so a table of any size is usable at once and pages are
+    only read as lookups touch them: one slot page, usually a single probe
+    with linear probing at 70% load, and one log page.
+
+    One process opens it writable, any number read-only. The writer
+    appends the record to the log before storing its offset in the slot,
+    and stores the slot's hash last, so a reader never follows a slot to a
+    record that isn't there. Records are never changed; an update appends
+    a new one and stores its offset, a single word, so readers see the old
+    record or the new one, never a mix. Growing writes a new index file,
+    renames it over the old one and then bumps the old file's generation;
+    readers compare it on every get and map the new file once it changed.
+    Nothing is fsynced until sync(). After a crash slots may point past the
+    end of the log, those keys read as absent; the writer drops such slots
+    when it opens, before appending brings the offsets back inside the log.
+    """
+    def __init__(self, path, writable=False, capacity=1024, max_load=0.7):
+        self.path = path
+        self.writable = writable
+        self.max_load = max_load
+        self.log_path = path + ".log"
+        self.log_file = open(self.log_path, "a+b" if writable else "rb", buffering=0)
+        if writable:
+            # one writer at a time, readers don't lock
+            fcntl.flock(self.log_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if not os.path.exists(path):
+                self._create_index(path, 1 << max(capacity - 1, 1).bit_length(), [], 0)
+        self.log_size = os.fstat(self.log_file.fileno()).st_size
+        self.log = None
+        self._map_index()
+        self._map_log()
+        if writable:
+            self._drop_cut_off_records()
+
+    def _create_index(self, path, capacity, entries, generation):
+        """Write an index of `capacity` slots holding (hash, offset) entries, and move it to `path`."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w+b") as file:
+            # sparse: the free slots are zeros nobody wrote
+            file.truncate(HEADER.size + capacity * SLOT.size)
+            with mmap.mmap(file.fileno(), 0) as index:
+                HEADER.pack_into(index, 0, MAGIC, capacity, len(entries), generation)
+                slots = memoryview(index).cast("Q")
+                mask = capacity - 1
+                for h, offset in entries:
+                    i = h & mask
+                    while slots[4 + 2 * i]:
+                        i = (i + 1) & mask
+                    slots[5 + 2 * i], slots[4 + 2 * i] = offset, h
+                slots.release()
+                index.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(path)
+
+    def _map_index(self):
+        while True:
+            with open(self.path, "r+b" if self.writable else "rb") as file:
+                self.inode = os.fstat(file.fileno()).st_ino
+                self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+            magic, self.capacity, _, self.generation = HEADER.unpack_from(self.index)
+            if magic != MAGIC or len(self.index) != HEADER.size + self.capacity * SLOT.size:
+                self.index.close()
+                raise ValueError(f"{self.path} is not a complete index")
+            # the generation is only bumped after the rename: if the name still points at our file,
+            # what we read is from before any bump, otherwise it may be the bumped one, so map again
+            if self.writable or os.stat(self.path).st_ino == self.inode:
+                break
+            self.index.close()
+        # lookups land anywhere in the file, read-ahead would only fetch pages nobody asked for
+        self.index.madvise(mmap.MADV_RANDOM)
+        self.mask = self.capacity - 1
+        self.grow_at = int(self.capacity * self.max_load)
+        # slot i is slots[4 + 2i : 6 + 2i]: the header takes the first four words
+        self.slots = memoryview(self.index).cast("Q")
+
+    def _map_log(self):
+        if self.log is not None:
+            self.log.close()
+        size = os.fstat(self.log_file.fileno()).st_size
+        # an empty file can't be mapped
+        self.log = mmap.mmap(self.log_file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+        if self.log is not None:
+            self.log.madvise(mmap.MADV_RANDOM)
+
+    def _unmap_index(self):
+        self.slots.release()
+        self.index.close()
+
+    def _drop_cut_off_records(self):
+        """Rebuild the index without slots whose record didn't make it into the log before a crash.
+
+        Records are appended back to back, so of those starting inside the log
+        only the last one can be cut off. Also puts COUNT right, should the
+        crash have come between storing a hash and counting it.
+        """
+        hashes, offsets = self.slots[4::2].tolist(), self.slots[5::2].tolist()
+        entries = [(h, offset) for h, offset in zip(hashes, offsets) if h]
+        inside = [entry for entry in entries if entry[1] < self.log_size]
+        last = max(inside, key=lambda entry: entry[1], default=None)
+        if last is not None and self._record(last[1]) is None:
+            inside.remove(last)
+        if len(inside) < len(entries) or self.slots[COUNT] != len(entries):
+            self._resize(self.capacity, inside)
+
+    def _record(self, offset):
+        """(key, value) of the record at offset, or None if the log ends before it does."""
+        end = offset + RECORD.size
+        if self.log is None or end > len(self.log):
+            # written after we mapped the log
+            self._map_log()
+        if self.log is None or end > len(self.log):
+            return None
+        key_length, value_length = RECORD.unpack_from(self.log, offset)
+        if end + key_length + value_length > len(self.log):
+            self._map_log()
+            if end + key_length + value_length > len(self.log):
+                # cut off by a crash before the log reached the disk
+                return None
+        return self.log[end:end + key_length], self.log[end + key_length:end + key_length + value_length]
+
+    def _find(self, key, h):
+        """(slot, value) for key, or (the free slot it would go in, None)."""
+        slots, mask = self.slots, self.mask
+        i = h & mask
+        while True:
+            stored = slots[4 + 2 * i]
+            if stored == 0:
+                return i, None
+            if stored == h:
+                record = self._record(slots[5 + 2 * i])
+                if record is not None and record[0] == key:
+                    return i, record[1]
+            i = (i + 1) & mask
+
+    def get(self, key, default=None):
+        key = _encode(key)
+        if not self.writable:
+            self.refresh()
+        value = self._find(key, _hash(key))[1]
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def insert(self, key, value):
+        if not self.writable:
+            raise PermissionError(f"{self.path} is open read-only")
+        key, value = _encode(key), _encode(value)
+        h = _hash(key)
+        i, old = self._find(key, h)
+        if old is None and len(self) >= self.grow_at:
+            self._resize(self.capacity * 2)
+            i = self._find(key, h)[0]
+        record = RECORD.pack(len(key), len(value)) + key + value
+        offset = self.log_size
+        self.log_file.write(record)
+        self.log_size += len(record)
+        slots = self.slots
+        slots[5 + 2 * i] = offset
+        if old is None:
+            # last: from here on readers can find it
+            slots[4 + 2 * i] = h
+            slots[COUNT] += 1
+
+    def _resize(self, capacity, entries=None):
+        slots = self.slots
+        if entries is None:
+            entries = [(slots[4 + 2 * i], slots[5 + 2 * i]) for i in range(self.capacity) if slots[4 + 2 * i]]
+        generation = self.generation + 1
+        self._create_index(self.path, capacity, entries, generation)
+        # the new file is in place: tell readers of this one to switch
+        slots[GENERATION] = generation
+        self._unmap_index()
+        self._map_index()
+
+    def refresh(self):
+        """Switch to the index file the writer replaced ours with, if it did; True if it did."""
+        if self.slots[GENERATION] == self.generation:
+            return False
+        self._unmap_index()
+        self._map_index()
+        return True
+
+    def __len__(self):
+        if not self.writable:
+            self.refresh()
+        return self.slots[COUNT]
+
+    def items(self):
+        if not self.writable:
+            self.refresh()
+        slots = self.slots
+        for i in range(self.capacity):
+            if slots[4 + 2 * i]:
+                record = self._record(slots[5 + 2 * i])
+                if record is not None:
+                    yield record
+
+    def sync(self):
+        """Make everything inserted so far durable: the log first, then the slots pointing into it."""
+        os.fsync(self.log_file.fileno())
+        self.index.flush()
+
+    def close(self):
+        if self.writable:
+            self.sync()
+        self._unmap_index()
+        if self.log is not None:
+            self.log.close()
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(records=1_000_000, value_size=100, lookups=10_000):
+    import tempfile
+
+    rng = random.Random(0)
+    keys = [f"key-{i}" for i in range(records)]
+    value = b"v" * value_size
+    with tempfile.TemporaryDirectory(dir=".") as directory:
+        path = os.path.join(directory, "index")
+        start = time.perf_counter()
+        with PersistentHashTable(path, writable=True) as table:
+            for key in keys:
+                table.insert(key, value)
+            capacity = table.capacity
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(path + ".log", "rb") as file:
+            data = file.read()
+        loaded, offset = {}, 0
+        while offset < len(data):
+            key_length, value_length = RECORD.unpack_from(data, offset)
+            start_key = offset + RECORD.size
+            loaded[data[start_key:start_key + key_length]] = data[start_key + key_length:start_key + key_length + value_length]
+            offset = start_key + key_length + value_length
+        load = time.perf_counter() - start
+        del data, loaded
+
+        def evict():
+            # drop both files from the page cache, as if the data were far bigger than RAM
+            for name in (path, path + ".log"):
+                fd = os.open(name, os.O_RDONLY)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                os.close(fd)
+
+        evict()
+        start = time.perf_counter()
+        table = PersistentHashTable(path)
+        opened = time.perf_counter() - start
+        sample = rng.sample(keys, lookups)
+        for label in ("cold", "warm"):
+            latencies = []
+            faults = resource.getrusage(resource.RUSAGE_SELF).ru_majflt
+            for key in sample:
+                before = time.perf_counter()
+                table.get(key)
+                latencies.append(time.perf_counter() - before)
+            faults = resource.getrusage(resource.RUSAGE_SELF).ru_majflt - faults
+            latencies.sort()
+            print(f"{label} get: p50 {latencies[len(latencies) // 2] * 1e6:,.1f}us  "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:,.1f}us  {faults / lookups:.2f} major faults/lookup")
+        table.close()
+        sizes = os.path.getsize(path) + os.path.getsize(path + ".log")
+        print(f"{records:,} records, {capacity:,} slots, {sizes / 2**20:,.0f}MB on disk: built in {build:.1f}s, "
+              f"reopened in {opened * 1e6:,.0f}us (loading the log into a dict: {load * 1e3:,.0f}ms)")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,390 @@
+# approach via open addressing with Robin Hood probing
+import sys
+import time
+import random
+from array import array
+
+import numpy as np
+
+# hash() never returns -1 (CPython turns it into -2), so -1 can mark a free slot
+EMPTY = -1
+# CPython hashes ints modulo this prime (keeping the sign), see int_hash_many
+HASH_MODULUS = (1 << 61) - 1
+INT64 = 1 << 63
+
+
+class RobinHoodHashTable():
+    """Open addressing with linear probing and Robin Hood displacement.
+
+    Slot i holds hashes[i], keys[i], values[i]: three flat arrays instead of
+    a list of tuples. An entry's distance is how far it sits from its home
+    slot (hash & mask). While inserting, whoever is further from home keeps
+    the slot and the other one moves on, which keeps distances short and
+    even, so a lookup can stop as soon as it meets an entry closer to home
+    than it is. Deleting shifts the following entries back one slot instead
+    of leaving a tombstone. The table doubles when it is `max_load` full.
+
+    get_many/insert_many take numpy int64 keys and probe all of them at
+    once, one numpy pass per probe step. That needs every stored key to be
+    an int that fits in int64; `unsafe_keys` counts the ones that don't,
+    and while there are any the batch calls go key by key. Most ints are
+    their own hash; while none of the stored keys is `wide` (hash != key),
+    a matching hash is a matching key and the keys need not be compared.
+    With a numeric `dtype` the values live in a numpy array of that type
+    rather than a list, so get_many is one fancy index.
+    """
+    def __init__(self, capacity=8, max_load=0.8, slots=None, dtype=None):
+        self.max_load = max_load
+        self.dtype = None if dtype is None or np.dtype(dtype) == object else np.dtype(dtype)
+        # what a free slot holds as its value
+        self.no_value = None if self.dtype is None else 0
+        self.size = 0
+        self.unsafe_keys = 0
+        self.wide_keys = 0
+        self._allocate(1 << max(capacity - 1, 1).bit_length(), slots)
+
+    def _allocate(self, capacity, slots=None):
+        """Start over with `capacity` empty slots; `slots` can hand in (hashes, keys, values) built elsewhere."""
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.grow_at = int(capacity * self.max_load)
+        if slots is None:
+            values = [None] * capacity if self.dtype is None else np.zeros(capacity, self.dtype)
+            slots = array('q', [EMPTY]) * capacity, [None] * capacity, values
+        self.hashes, self.keys, self.values = slots
+
+    def _resize(self, capacity):
+        old_hashes, old_keys, old_values = self.hashes, self.keys, self.values
+        self._allocate(capacity)
+        hashes, keys, values, mask = self.hashes, self.keys, self.values, self.mask
+        if self.dtype is not None:
+            # numpy scalars are slow to move one at a time, shuffle lists and convert once
+            old_values, values = old_values.tolist(), [0] * capacity
+        # _place inlined: this loop runs for every entry on every doubling
+        for old, h in enumerate(old_hashes):
+            if h == EMPTY:
+                continue
+            key, value = old_keys[old], old_values[old]
+            i = h & mask
+            distance = 0
+            while True:
+                current = hashes[i]
+                if current == EMPTY:
+                    hashes[i], keys[i], values[i] = h, key, value
+                    break
+                current_distance = (i - current) & mask
+                if current_distance < distance:
+                    hashes[i], h = h, current
+                    keys[i], key = key, keys[i]
+                    values[i], value = value, values[i]
+                    distance = current_distance
+                i = (i + 1) & mask
+                distance += 1
+        if self.dtype is not None:
+            self.values = np.array(values, dtype=self.dtype)
+
+    def _place_many(self, hs, keys, values):
+        """_place for many entries known to be absent, none sharing a key.
+
+        hs is an int64 array of their hashes, keys a list, values a list or,
+        with a dtype, an array. Where a home slot is free, the first entry
+        that wants it goes straight there, all in one numpy pass; only the
+        rest are placed one by one.
+        """
+        hashes = np.frombuffer(self.hashes, dtype=np.int64)
+        home = hs & self.mask
+        _, first = np.unique(home, return_index=True)
+        direct = first[hashes[home[first]] == EMPTY]
+        rest = np.ones(len(hs), dtype=bool)
+        rest[direct] = False
+        rest = np.flatnonzero(rest)
+        slots = home[direct]
+        hashes[slots] = hs[direct]
+        table_keys, table_values = self.keys, self.values
+        if self.dtype is None:
+            for i, j in zip(slots.tolist(), direct.tolist()):
+                table_keys[i], table_values[i] = keys[j], values[j]
+        else:
+            for i, j in zip(slots.tolist(), direct.tolist()):
+                table_keys[i] = keys[j]
+            table_values[slots] = values[direct]
+        place, mask = self._place, self.mask
+        for h, j in zip(hs[rest].tolist(), rest.tolist()):
+            place(h, keys[j], values[j], h & mask, 0)
+
+    def _place(self, h, key, value, i, distance):
+        """Put an entry known to be absent, starting the probe at slot i."""
+        hashes, keys, values, mask = self.hashes, self.keys, self.values, self.mask
+        while True:
+            current = hashes[i]
+            if current == EMPTY:
+                hashes[i], keys[i], values[i] = h, key, value
+                return
+            current_distance = (i - current) & mask
+            if current_distance < distance:
+                # the resident is closer to home than we are: take its slot, carry it on
+                hashes[i], h = h, current
+                keys[i], key = key, keys[i]
+                values[i], value = value, values[i]
+                distance = current_distance
+            i = (i + 1) & mask
+            distance += 1
+
+    def _find(self, key, h):
+        hashes, keys, mask = self.hashes, self.keys, self.mask
+        i = h & mask
+        distance = 0
+        while True:
+            current = hashes[i]
+            if current == EMPTY or ((i - current) & mask) < distance:
+                return -1
+            if current == h and (keys[i] is key or keys[i] == key):
+                return i
+            i = (i + 1) & mask
+            distance += 1
+
+    def insert(self, key, value):
+        h = hash(key)
+        hashes, keys, mask = self.hashes, self.keys, self.mask
+        i = h & mask
+        distance = 0
+        while True:
+            current = hashes[i]
+            if current == EMPTY or ((i - current) & mask) < distance:
+                break
+            if current == h and (keys[i] is key or keys[i] == key):
+                self.values[i] = value
+                return
+            i = (i + 1) & mask
+            distance += 1
+        # not there; i is where it would go
+        if self.size >= self.grow_at:
+            self._resize(self.capacity * 2)
+            hashes, keys = self.hashes, self.keys
+            i, distance = h & self.mask, 0
+        if hashes[i] == EMPTY and distance == 0:
+            # the common case, its home slot is free
+            hashes[i], keys[i], self.values[i] = h, key, value
+        else:
+            self._place(h, key, value, i, distance)
+        self.size += 1
+        if type(key) is not int or h != key:
+            self._count_unusual(key, 1)
+
+    def _add(self, h, key, value):
+        """Insert an entry known to be absent, with its hash already computed."""
+        if self.size >= self.grow_at:
+            self._resize(self.capacity * 2)
+        self._place(h, key, value, h & self.mask, 0)
+        self.size += 1
+        if type(key) is not int or h != key:
+            self._count_unusual(key, 1)
+
+    def _count_unusual(self, key, change):
+        if type(key) is int and -INT64 <= key < INT64:
+            self.wide_keys += change
+        else:
+            self.unsafe_keys += change
+
+    def get(self, key, default=None):
+        i = self._find(key, hash(key))
+        return default if i < 0 else self.values[i]
+
+    def delete(self, key):
+        i = self._find(key, hash(key))
+        if i < 0:
+            raise KeyError(key)
+        hashes, keys, values, mask = self.hashes, self.keys, self.values, self.mask
+        if type(keys[i]) is not int or hashes[i] != keys[i]:
+            self._count_unusual(keys[i], -1)
+        # backward shift: pull every following entry that isn't home yet one slot closer
+        j = (i + 1) & mask
+        while hashes[j] != EMPTY and ((j - hashes[j]) & mask) != 0:
+            hashes[i], keys[i], values[i] = hashes[j], keys[j], values[j]
+            i, j = j, (j + 1) & mask
+        hashes[i], keys[i], values[i] = EMPTY, None, self.no_value
+        self.size -= 1
+
+    def __contains__(self, key):
+        return self._find(key, hash(key)) >= 0
+
+    def __len__(self):
+        return self.size
+
+    def items(self):
+        for i, h in enumerate(self.hashes):
+            if h != EMPTY:
+                yield self.keys[i], self.values[i]
+
+    def _find_many(self, queries):
+        """_find for an int64 array of keys: slot per key, -1 where absent.
+
+        Only valid while unsafe_keys == 0, so that stored keys can be
+        compared as int64 when their hash matches.
+        """
+        mask, keys = self.mask, self.keys
+        hashes = np.frombuffer(self.hashes, dtype=np.int64)
+        hs = int_hash_many(queries)
+        slots = np.full(len(queries), -1, dtype=np.int64)
+        pending = np.arange(len(queries))
+        i = hs & mask
+        distance = 0
+        while len(pending):
+            current = hashes[i]
+            hit = current == hs
+            if self.wide_keys:
+                # two different ints can share a hash, compare the keys
+                candidates = np.flatnonzero(hit)
+                stored = np.fromiter(map(keys.__getitem__, i[candidates].tolist()), dtype=np.int64,
+                                     count=len(candidates))
+                hit[candidates] = stored == queries[pending[candidates]]
+                done = hit
+            else:
+                # every stored key is its own hash: this is the only candidate, and it
+                # is the key unless the query is wide
+                done = hit
+                hit = hit & (queries[pending] == hs)
+            slots[pending[hit]] = i[hit]
+            going = ~(done | (current == EMPTY) | (((i - current) & mask) < distance))
+            pending, hs, i = pending[going], hs[going], (i[going] + 1) & mask
+            distance += 1
+        return slots
+
+    def get_many(self, keys, default=None, dtype=None):
+        """get() for every key of an int64 array, as an array of `dtype` (by default the table's, or object)."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if dtype is None:
+            dtype = object if self.dtype is None else self.dtype
+        if self.unsafe_keys:
+            return np.fromiter((self.get(key, default) for key in keys.tolist()), dtype=dtype, count=len(keys))
+        out = np.full(len(keys), default, dtype=dtype)
+        slots = self._find_many(keys)
+        found = np.flatnonzero(slots >= 0)
+        if self.dtype is not None:
+            out[found] = self.values[slots[found]]
+            return out
+        # fetch in slot order, walking the values list front to back is a lot kinder to the cache
+        order = np.argsort(slots[found])
+        found = found[order]
+        out[found] = np.fromiter(map(self.values.__getitem__, slots[found].tolist()), dtype=dtype, count=len(found))
+        return out
+
+    def insert_many(self, keys, values):
+        """insert() every (key, value) pair, in order, so a repeated key keeps its last value."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if self.dtype is None:
+            values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        else:
+            values = np.asarray(values, dtype=self.dtype)
+        if len(values) != len(keys):
+            raise ValueError(f"{len(keys)} keys but {len(values)} values")
+        if self.unsafe_keys:
+            for key, value in zip(keys.tolist(), values):
+                self.insert(key, value)
+            return
+        # the last occurrence of each key, in their original order
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = np.sort(len(keys) - 1 - last)
+        keys = keys[last]
+        values = list(map(values.__getitem__, last.tolist())) if self.dtype is None else values[last]
+        slots = self._find_many(keys)
+        present = np.flatnonzero(slots >= 0)
+        # keys already stored: overwrite in place
+        if self.dtype is None:
+            table_values = self.values
+            for i, j in zip(slots[present].tolist(), present.tolist()):
+                table_values[i] = values[j]
+        else:
+            self.values[slots[present]] = values[present]
+        new = np.flatnonzero(slots < 0)
+        capacity = self.capacity
+        while self.size + len(new) > int(capacity * self.max_load):
+            capacity *= 2
+        if capacity != self.capacity:
+            self._resize(capacity)
+        keys = keys[new]
+        hs = int_hash_many(keys)
+        self._place_many(hs, keys.tolist(), list(map(values.__getitem__, new.tolist())) if self.dtype is None else values[new])
+        self.size += len(new)
+        self.wide_keys += int(np.count_nonzero(hs != keys))
+
+    def probe_lengths(self):
+        """Slots a successful lookup looks at, per entry (distance from home + 1)."""
+        mask = self.mask
+        return [((i - h) & mask) + 1 for i, h in enumerate(self.hashes) if h != EMPTY]
+
+
+def int_hash_many(keys):
+    """hash() of every int in an int64 array: sign * (|k| mod 2^61-1), and -1 becomes -2."""
+    keys = np.asarray(keys, dtype=np.int64)
+    negative = keys < 0
+    # |k| as uint64, which also covers -2^63
+    magnitude = np.where(negative, -keys.view(np.uint64), keys.view(np.uint64))
+    hs = (magnitude % np.uint64(HASH_MODULUS)).astype(np.int64)
+    np.negative(hs, out=hs, where=negative)
+    hs[hs == -1] = -2
+    return hs
+
+
+def benchmark(keys=10_000_000, chain_buckets=1 << 20):
+    from hashmap_array import HashTable
+
+    rng = random.Random(0)
+    present = [rng.getrandbits(62) for _ in range(keys)]
+    missing = [rng.getrandbits(62) | (1 << 62) for _ in range(min(keys, 1_000_000))]
+
+    def chain_probe_lengths(table):
+        # a hit at position p of its chain compares p + 1 keys
+        return [p + 1 for bucket in table.array for p in range(len(bucket))]
+
+    for name, make, probe_lengths in (
+            (f"chaining, {chain_buckets:,} buckets", lambda: HashTable(chain_buckets), chain_probe_lengths),
+            ("robin hood", RobinHoodHashTable, RobinHoodHashTable.probe_lengths)):
+        table = make()
+        start = time.perf_counter()
+        for key in present:
+            table.insert(key, key)
+        inserts = keys / (time.perf_counter() - start)
+        sample = present[:1_000_000]
+        start = time.perf_counter()
+        for key in sample:
+            table.get(key)
+        hits = len(sample) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for key in missing:
+            table.get(key)
+        misses = len(missing) / (time.perf_counter() - start)
+        lengths = probe_lengths(table)
+        print(f"{name:<30} insert {inserts:>10,.0f}/s  get hit {hits:>10,.0f}/s  get miss {misses:>10,.0f}/s  "
+              f"probe length mean {sum(lengths) / len(lengths):.2f} max {max(lengths)}")
+        del table, lengths
+
+    batch = min(keys, 1_000_000)
+    # below 2^61 every id is its own hash; at 62 bits half of them are wide and the keys get compared
+    for bits in (60, 62):
+        ids = np.array([rng.getrandbits(bits) for _ in range(batch)], dtype=np.int64)
+        values = np.arange(batch, dtype=np.float64)
+        table = RobinHoodHashTable()
+        start = time.perf_counter()
+        for key, value in zip(ids.tolist(), values.tolist()):
+            table.insert(key, value)
+        inserts = time.perf_counter() - start
+        batch_table = RobinHoodHashTable(dtype=np.float64)
+        start = time.perf_counter()
+        batch_table.insert_many(ids, values)
+        inserts_many = time.perf_counter() - start
+        queries = ids[np.random.default_rng(0).permutation(batch)]
+        start = time.perf_counter()
+        for key in queries.tolist():
+            table.get(key)
+        gets = time.perf_counter() - start
+        start = time.perf_counter()
+        batch_table.get_many(queries, np.nan)
+        gets_many = time.perf_counter() - start
+        print(f"{batch:,} {bits}-bit ids ({table.wide_keys:,} wide)  insert loop {inserts * 1e3:,.0f}ms  "
+              f"insert_many {inserts_many * 1e3:,.0f}ms ({inserts / inserts_many:.1f}x)  get loop {gets * 1e3:,.0f}ms  "
+              f"get_many {gets_many * 1e3:,.0f}ms ({gets / gets_many:.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,104 @@
+import sys
+import threading
+
+import pytest
+
+from concurrent_hashmap import ConcurrentHashTable
+
+THREADS = 8
+
+
+@pytest.fixture(autouse=True)
+def switch_often():
+    # hand the GIL over every few bytecodes, so threads interleave inside the table's methods
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def run_threads(target, *args):
+    barrier = threading.Barrier(THREADS)
+
+    def start(n):
+        barrier.wait()
+        target(n, *args)
+
+    threads = [threading.Thread(target=start, args=(n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_disjoint_writers_while_segments_grow():
+    # 8 slots spread over 4 segments: every segment doubles many times under the writers
+    table = ConcurrentHashTable(segments=4, capacity=8)
+    per_thread = 5000
+
+    def write(n):
+        for key in range(n * per_thread, (n + 1) * per_thread):
+            table.insert(key, -key)
+
+    run_threads(write)
+    assert len(table) == THREADS * per_thread
+    assert all(table.get(key) == -key for key in range(THREADS * per_thread))
+    assert all(segment.capacity > 8 for segment in table.segments)
+
+
+def test_overlapping_writers_and_deleters():
+    table = ConcurrentHashTable(segments=16)
+    keys = range(3000)
+    deleted = [0] * THREADS
+
+    def write(n):
+        for key in keys:
+            table.insert(key, key)
+
+    run_threads(write)
+    assert len(table) == len(keys)
+
+    def delete(n):
+        for key in keys:
+            try:
+                table.delete(key)
+            except KeyError:
+                continue
+            deleted[n] += 1
+
+    run_threads(delete)
+    # every key went exactly once, whichever thread got there first
+    assert sum(deleted) == len(keys)
+    assert len(table) == 0 and table.items() == []
+
+
+def test_items_is_one_point_in_time():
+    table = ConcurrentHashTable(segments=16, capacity=8)
+    per_thread = 3000
+    done = threading.Event()
+    snapshots = []
+
+    def write(n):
+        # each writer inserts its keys in order, so any consistent state holds a prefix of them
+        for i in range(per_thread):
+            table.insert((n, i), i)
+
+    def read():
+        while not done.is_set():
+            snapshots.append(table.items())
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    run_threads(write)
+    done.set()
+    reader.join()
+    snapshots.append(table.items())
+    assert len(snapshots) > 2
+    for items in snapshots:
+        seen = {}
+        for (n, i), value in items:
+            assert value == i
+            seen.setdefault(n, set()).add(i)
+        for written in seen.values():
+            assert written == set(range(len(written)))
+    assert len(snapshots[-1]) == THREADS * per_thread == len(table)
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from incremental_hashmap import _DELETED, IncrementalHashTable
+from robin_hood_hashmap import RobinHoodHashTable
+
+
+def fill_until_migrating(table, reference, start=0):
+    """Insert keys start, start+1, ... until a migration starts; returns the next key."""
+    key = start
+    while table.old is None:
+        table.insert(key, key)
+        reference[key] = key
+        key += 1
+    return key
+
+
+@pytest.mark.parametrize("migrate_slots", [1, 2, 8])
+def test_matches_dict_while_migrating(migrate_slots):
+    rng = random.Random(migrate_slots)
+    table, reference = IncrementalHashTable(migrate_slots=migrate_slots), {}
+    migrating = 0
+    for step in range(30_000):
+        key = rng.randrange(3000)
+        operation = rng.random()
+        if operation < 0.6:
+            table.insert(key, step)
+            reference[key] = step
+        elif operation < 0.75:
+            if key in reference:
+                table.delete(key)
+                del reference[key]
+            else:
+                with pytest.raises(KeyError):
+                    table.delete(key)
+        else:
+            assert table.get(key) == reference.get(key)
+            assert (key in table) == (key in reference)
+        migrating += table.old is not None
+        assert len(table) == len(reference)
+    assert migrating > 100
+    assert dict(table.items()) == reference
+
+
+def test_update_and_delete_keys_only_in_the_old_table():
+    table, reference = IncrementalHashTable(capacity=64, migrate_slots=1), {}
+    fill_until_migrating(table, reference)
+    # the cursor is at the front, the old table still holds nearly everything
+    waiting = [key for key, value in table.old.items() if value is not _DELETED][-4:]
+    assert all(table.table.get(key) is None for key in waiting)
+    table.insert(waiting[0], "updated")
+    table.delete(waiting[1])
+    reference[waiting[0]] = "updated"
+    del reference[waiting[1]]
+    assert table.get(waiting[0]) == "updated"
+    assert waiting[1] not in table
+    with pytest.raises(KeyError):
+        table.delete(waiting[1])
+    # and neither comes back when the migration reaches their old slots
+    while table.old is not None:
+        table.get(-1)
+    assert table.get(waiting[0]) == "updated"
+    assert waiting[1] not in table
+    assert len(table) == len(reference)
+    assert dict(table.items()) == reference
+
+
+@pytest.mark.parametrize("max_load", [0.5, 0.8, 0.95])
+@pytest.mark.parametrize("capacity", [2, 8, 64, 1000])
+def test_old_table_drains_before_the_new_one_fills(monkeypatch, capacity, max_load):
+    # one slot per operation would leave the new table full with the old one half drained, at max_load 0.8
+    def resize(self, capacity):
+        raise AssertionError("stop-the-world resize")
+    monkeypatch.setattr(RobinHoodHashTable, "_resize", resize)
+    table, reference = IncrementalHashTable(capacity, max_load, migrate_slots=1), {}
+    key, target = 0, table.table.capacity * 64
+    # at max_load 0.5 the next migration starts in the same insert that finishes one
+    while table.table.capacity < target:
+        table.insert(key, key)
+        reference[key] = key
+        key += 1
+    assert table.step > 1
+    assert len(table) == len(reference)
+    assert dict(table.items()) == reference
+
+
+def test_recycled_arrays_back_the_next_table():
+    table, reference = IncrementalHashTable(capacity=8), {}
+    key = 0
+    for _ in range(5):
+        key = fill_until_migrating(table, reference, key)
+        drained = table.old.hashes
+        while table.old is not None:
+            table.insert(key, key)
+            reference[key] = key
+            key += 1
+        assert table.spare[0] is drained
+    assert dict(table.items()) == reference
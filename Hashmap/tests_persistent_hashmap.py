@@ -0,0 +1,159 @@
+import os
+import multiprocessing
+
+import pytest
+
+from persistent_hashmap import PersistentHashTable
+
+
+def _reader(path, connection):
+    """Answer lists of keys with their values from a read-only table, until None."""
+    table = PersistentHashTable(path)
+    connection.send("ready")
+    while (keys := connection.recv()) is not None:
+        connection.send([table.get(key) for key in keys])
+    table.close()
+
+
+def _watch(path, key, last, connection):
+    """get(key) until it reads `last`; sends how many times it came back absent."""
+    table = PersistentHashTable(path)
+    connection.send("ready")
+    misses = 0
+    while (value := table.get(key)) != last:
+        misses += value is None
+    connection.send(misses)
+    table.close()
+
+
+def test_reopen_keeps_everything(tmp_path):
+    path = str(tmp_path / "index")
+    with PersistentHashTable(path, writable=True, capacity=8) as table:
+        for i in range(500):
+            table.insert(f"key-{i}", f"value-{i}")
+        table.insert("key-7", "updated")
+        capacity = table.capacity
+    with PersistentHashTable(path) as table:
+        assert len(table) == 500 and table.capacity == capacity
+        assert table.get("key-7") == b"updated"
+        assert table.get("key-499") == b"value-499"
+        assert table.get("nope") is None
+        assert dict(table.items())[b"key-8"] == b"value-8"
+        with pytest.raises(PermissionError):
+            table.insert("key-1", "x")
+    # and the writer carries on where it stopped
+    with PersistentHashTable(path, writable=True) as table:
+        table.insert("key-500", "value-500")
+        assert len(table) == 501 and table.get("key-0") == b"value-0"
+
+
+def test_one_writer_at_a_time(tmp_path):
+    path = str(tmp_path / "index")
+    with PersistentHashTable(path, writable=True):
+        with pytest.raises(BlockingIOError):
+            PersistentHashTable(path, writable=True)
+
+
+def test_records_cut_off_by_a_crash_read_as_absent(tmp_path):
+    path = str(tmp_path / "index")
+    with PersistentHashTable(path, writable=True) as table:
+        table.insert("kept", "1")
+        table.insert("lost", "2" * 100)
+    # the index reached the disk, the end of the log did not
+    os.truncate(path + ".log", os.path.getsize(path + ".log") - 50)
+    with PersistentHashTable(path) as table:
+        assert table.get("kept") == b"1"
+        assert table.get("lost") is None
+        assert list(table.items()) == [(b"kept", b"1")]
+    with PersistentHashTable(path, writable=True) as table:
+        assert len(table) == 1
+        table.insert("lost", "again")
+        table.insert("new", "3")
+        # the log grows back past where the cut-off record claimed to end
+        for i in range(20):
+            table.insert(f"more-{i}", str(i))
+    expected = {b"kept": b"1", b"lost": b"again", b"new": b"3", **{b"more-%d" % i: b"%d" % i for i in range(20)}}
+    with PersistentHashTable(path) as table:
+        assert [table.get(key) for key in ("kept", "lost", "new")] == [b"1", b"again", b"3"]
+        assert len(table) == len(expected)
+        assert sorted(table.items()) == sorted(expected.items())
+
+
+def test_partial_index_files(tmp_path):
+    path = str(tmp_path / "index")
+    with PersistentHashTable(path, writable=True, capacity=2) as table:
+        table.insert("a", "1")
+    # a resize that died before its rename leaves only the temporary file behind
+    with open(path + ".tmp", "wb") as file:
+        file.write(b"\0" * 100)
+    with PersistentHashTable(path, writable=True) as table:
+        assert table.get("a") == b"1"
+        # the next resize writes over it
+        for i in range(10):
+            table.insert(str(i), str(i))
+    assert not os.path.exists(path + ".tmp")
+    os.truncate(path, os.path.getsize(path) - 1)
+    with pytest.raises(ValueError):
+        PersistentHashTable(path)
+
+
+def test_reader_sees_updates_after_a_resize(tmp_path):
+    path = str(tmp_path / "index")
+    writer = PersistentHashTable(path, writable=True, capacity=8)
+    writer.insert("a", "1")
+    reader = PersistentHashTable(path)
+    assert reader.get("a") == b"1"
+    for i in range(100):
+        writer.insert(str(i), str(i))
+    writer.insert("a", "2")
+    # "a" is still in the index the reader mapped, pointing at the old record
+    assert reader.get("a") == b"2"
+    assert len(reader) == 101 and reader.capacity == writer.capacity
+    reader.close()
+    writer.close()
+
+
+def test_readers_in_other_processes(tmp_path):
+    path = str(tmp_path / "index")
+    writer = PersistentHashTable(path, writable=True, capacity=8)
+    writer.insert("a", "1")
+    connection, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_reader, args=(path, child))
+    process.start()
+    try:
+        assert connection.recv() == "ready"
+        connection.send(["a", "b"])
+        assert connection.recv() == [b"1", None]
+        for i in range(1000):
+            writer.insert(f"k{i}", f"v{i}")
+        writer.insert("a", "2")
+        connection.send(["a", "k0", "k999", "b"])
+        assert connection.recv() == [b"2", b"v0", b"v999", None]
+        connection.send(None)
+    finally:
+        process.join(5)
+        process.kill()
+        writer.close()
+
+
+def test_updates_and_resizes_never_hide_a_key(tmp_path):
+    path = str(tmp_path / "index")
+    writer = PersistentHashTable(path, writable=True, capacity=8)
+    writer.insert("hot", "0")
+    connection, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_watch, args=(path, "hot", b"last", child))
+    process.start()
+    try:
+        assert connection.recv() == "ready"
+        for i in range(5000):
+            writer.insert("hot", str(i))
+            if i % 10 == 0:
+                writer.insert(f"filler-{i}", "x")
+        writer.insert("hot", "last")
+        # a reader stuck on an old index would never see "last"
+        assert connection.poll(30)
+        assert connection.recv() == 0
+    finally:
+        process.join(5)
+        process.kill()
+        writer.close()
@@ -0,0 +1,219 @@
+import random
+
+import numpy as np
+import pytest
+
+from robin_hood_hashmap import EMPTY, HASH_MODULUS, RobinHoodHashTable, int_hash_many
+
+
+def check_invariants(table):
+    """Every entry is reachable from its home slot, and distances only grow by one from slot to slot."""
+    mask = table.mask
+    used = [i for i, h in enumerate(table.hashes) if h != EMPTY]
+    assert len(used) == table.size
+    for i in used:
+        distance = (i - table.hashes[i]) & mask
+        # nothing free between home and here, or a lookup would stop early
+        assert all(table.hashes[(i - back) & mask] != EMPTY for back in range(distance + 1))
+        following = table.hashes[(i + 1) & mask]
+        if following != EMPTY:
+            assert ((i + 1 - following) & mask) <= distance + 1
+    for i, h in enumerate(table.hashes):
+        if h == EMPTY:
+            assert table.keys[i] is None and table.values[i] == table.no_value
+
+
+def test_matches_dict_across_resizes():
+    rng = random.Random(0)
+    table, reference = RobinHoodHashTable(), {}
+    # few distinct keys with small ones sharing low bits, so chains form and break up
+    keys = [rng.randrange(-1000, 1000) for _ in range(300)] + [f"key-{i}" for i in range(100)] + [2**64 + 1]
+    capacities = set()
+    for step in range(20_000):
+        key = rng.choice(keys)
+        operation = rng.random()
+        if operation < 0.5:
+            table.insert(key, step)
+            reference[key] = step
+        elif operation < 0.8:
+            if key in reference:
+                table.delete(key)
+                del reference[key]
+            else:
+                with pytest.raises(KeyError):
+                    table.delete(key)
+        else:
+            assert table.get(key, "missing") == reference.get(key, "missing")
+        capacities.add(table.capacity)
+        if step % 1000 == 0:
+            check_invariants(table)
+    assert len(capacities) > 3
+    assert len(table) == len(reference)
+    assert dict(table.items()) == reference
+    check_invariants(table)
+
+
+def test_delete_shifts_the_cluster_back():
+    table = RobinHoodHashTable(16)
+    # 1, 17 and 33 share home slot 1, 2 is home at 2 and gets pushed to 4
+    for key in (1, 17, 33, 2):
+        table.insert(key, key)
+    assert table.hashes[1:5].tolist() == [1, 17, 33, 2]
+    table.delete(1)
+    # everyone behind moved one closer to home, and the last slot is free again instead of a tombstone
+    assert table.hashes[1:5].tolist() == [17, 33, 2, EMPTY]
+    assert [table.get(key) for key in (17, 33, 2)] == [17, 33, 2]
+    table.delete(33)
+    assert table.hashes[1:4].tolist() == [17, 2, EMPTY]
+    check_invariants(table)
+    # an entry already at home stops the shift
+    table.insert(18, 18)
+    table.insert(3, 3)
+    table.delete(17)
+    assert table.get(2) == 2 and table.get(18) == 18 and table.get(3) == 3
+    check_invariants(table)
+
+
+def test_deletes_leave_no_tombstones():
+    table = RobinHoodHashTable(64)
+    for key in range(50):
+        table.insert(key * 64, key)
+    for key in range(50):
+        table.delete(key * 64)
+    assert len(table) == 0
+    assert set(table.hashes) == {EMPTY}
+    assert set(table.keys) == {None} and set(table.values) == {None}
+    # and nothing stale is left to find
+    assert table.get(0) is None
+
+
+def test_grows_at_max_load_and_never_shrinks():
+    table = RobinHoodHashTable(16, max_load=0.75)
+    assert (table.capacity, table.grow_at) == (16, 12)
+    for key in range(12):
+        table.insert(key, key)
+    assert table.capacity == 16
+    # updating a stored key never grows it
+    table.insert(0, "again")
+    assert table.capacity == 16
+    table.insert(12, 12)
+    assert (table.capacity, table.grow_at) == (32, 24)
+    for key in range(13):
+        table.delete(key)
+    # there is no shrink threshold: the slots stay for the next fill
+    assert (len(table), table.capacity) == (0, 32)
+    check_invariants(table)
+
+
+def test_capacity_rounds_up_to_a_power_of_two():
+    assert RobinHoodHashTable(100).capacity == 128
+    assert RobinHoodHashTable(1).capacity == 2
+
+
+EDGE_KEYS = [0, 1, -1, -2, 7, -7, HASH_MODULUS - 1, HASH_MODULUS, HASH_MODULUS + 1, -HASH_MODULUS, 2 * HASH_MODULUS - 1,
+             2**62, 2**63 - 1, -2**63, -2**63 + 1]
+
+
+def test_int_hash_many_matches_hash():
+    rng = random.Random(1)
+    keys = EDGE_KEYS + [rng.randrange(-2**63, 2**63) for _ in range(1000)]
+    assert int_hash_many(np.array(keys, dtype=np.int64)).tolist() == [hash(key) for key in keys]
+
+
+def test_batch_calls_match_key_by_key_calls():
+    rng = random.Random(2)
+    # k and k + 2^61-1 share a hash, so do -1 and -2
+    colliding = [k + shift for k in (3, -3, 12345) for shift in (0, HASH_MODULUS, -HASH_MODULUS)]
+    pool = EDGE_KEYS + colliding + [rng.randrange(-2**63, 2**63) for _ in range(200)] + list(range(-50, 50))
+    scalar, batch = RobinHoodHashTable(), RobinHoodHashTable()
+    for round in range(30):
+        keys = [rng.choice(pool) for _ in range(rng.choice((1, 10, 100)))]
+        values = [f"{round}-{n}" for n in range(len(keys))]
+        for key, value in zip(keys, values):
+            scalar.insert(key, value)
+        batch.insert_many(np.array(keys, dtype=np.int64), values)
+        assert dict(batch.items()) == dict(scalar.items())
+        assert (batch.wide_keys, batch.unsafe_keys) == (scalar.wide_keys, scalar.unsafe_keys)
+        queries = np.array(pool + [5, -5, 2**62 + 1], dtype=np.int64)
+        expected = [scalar.get(key, "missing") for key in queries.tolist()]
+        assert batch.get_many(queries, "missing").tolist() == expected
+        assert scalar.get_many(queries, "missing").tolist() == expected
+        if round == 15:
+            # every wide key gone: a matching hash is a matching key again
+            for key in list(dict(batch.items())):
+                if hash(key) != key:
+                    batch.delete(key)
+                    scalar.delete(key)
+            assert batch.wide_keys == scalar.wide_keys == 0
+    assert batch.wide_keys > 0
+
+
+def test_wide_query_against_narrow_keys():
+    table = RobinHoodHashTable()
+    table.insert_many(np.arange(100), np.arange(100) * 2)
+    assert table.wide_keys == 0
+    # same hash as 5 but a different key
+    assert table.get_many(np.array([5, 5 + HASH_MODULUS, -1]), -1, np.int64).tolist() == [10, -1, -1]
+
+
+def test_batch_calls_fall_back_for_unsafe_keys():
+    table = RobinHoodHashTable()
+    table.insert("id", 1)
+    table.insert(2**64, 2)
+    assert table.unsafe_keys == 2
+    table.insert_many(np.array([1, 2, 1, -1]), ["a", "b", "c", "d"])
+    assert table.get_many(np.array([1, 2, -1, 3])).tolist() == ["c", "b", "d", None]
+    assert table.get("id") == 1 and table.get(2**64) == 2
+    table.delete("id")
+    table.delete(2**64)
+    # back on the vectorized path
+    assert table.unsafe_keys == 0
+    assert table.get_many(np.array([1, 2, -1, 3]), 0).tolist() == ["c", "b", "d", 0]
+
+
+def test_insert_many_keeps_the_last_value_and_grows_once():
+    table = RobinHoodHashTable()
+    keys = np.arange(1000) % 300
+    table.insert_many(keys, np.arange(1000))
+    assert len(table) == 300
+    assert table.get_many(np.arange(300), -1, np.int64).tolist() == list(range(900, 1000)) + list(range(700, 900))
+    # sized up front for all 300, not doubled step by step past them
+    assert table.capacity == 512
+    with pytest.raises(ValueError):
+        table.insert_many(np.arange(3), [1, 2])
+
+
+def test_insert_many_probes_only_for_shared_home_slots(monkeypatch):
+    placed = []
+    place = RobinHoodHashTable._place
+    monkeypatch.setattr(RobinHoodHashTable, "_place", lambda self, h, *args: placed.append(h) or place(self, h, *args))
+    table = RobinHoodHashTable(1024)
+    # 0, 1024 and 2048 all want slot 0: 0 gets it, like everyone else gets their own free home slot
+    table.insert_many(np.array(list(range(100)) + [1024, 2048]), list(range(102)))
+    assert sorted(placed) == [1024, 2048]
+    assert table.get_many(np.array([0, 1, 99, 1024, 2048])).tolist() == [0, 1, 99, 100, 101]
+    check_invariants(table)
+
+
+def test_numeric_values_live_in_an_array():
+    rng = random.Random(3)
+    table, reference = RobinHoodHashTable(dtype=np.float64), {}
+    for round in range(20):
+        # small keys that share home slots, and a wide one each round
+        keys = np.array([rng.randrange(-3000, 3000) for _ in range(rng.choice((1, 50, 500)))] + [2**62 + round])
+        values = np.arange(len(keys)) * 0.5 + round
+        table.insert_many(keys, values)
+        reference.update(zip(keys.tolist(), values.tolist()))
+        for key in rng.sample(sorted(reference), min(5, len(reference))):
+            table.delete(key)
+            del reference[key]
+        table.insert(round, -1.0)
+        reference[round] = -1.0
+        queries = np.arange(-3000, 3000)
+        got = table.get_many(queries, np.nan)
+        assert got.dtype == np.float64
+        assert np.array_equal(got, [reference.get(key, np.nan) for key in queries.tolist()], equal_nan=True)
+        check_invariants(table)
+    assert isinstance(table.values, np.ndarray) and table.capacity > 1024
+    assert table.wide_keys == sum(hash(key) != key for key in reference) > 0
+    assert dict(table.items()) == reference